@@ -2,73 +2,63 @@ import random
 import numpy as np
 import pickle
 import os
-from settings import Direction, Point, BLOCK_SIZE, NUM_ENVS
-from game import VectorizedSnakeGame, DemoGame
+from qtable import DenseQTable, HashQTable, STATE_BITS
+from encoders import BasicEncoder, get_encoder
+from symmetry import SymmetricQTable
+from checkpoint import atomic_write, load_checkpoint
+from profiler import NULL_PROFILER
+# Hyperparameters mặc định nằm trong config.py, mỗi agent đọc từ RunConfig của nó
+from config import DEFAULT_CONFIG, LR, GAMMA, EPSILON_START, DECAY_RATE
 
-# Hyperparameters
-# Q learning formula: target = current_val + LR * (reward + GAMMA * max_next_q - current_val)
-LR = 0.001 
-GAMMA = 0.95
-EPSILON_START = 80
-DECAY_RATE = 0.05
+# LR, GAMMA, EPSILON_START, DECAY_RATE vẫn được xuất lại vì trước kia chúng nằm trong agent.py
+__all__ = ["Q_TABLE_PATH", "QTableAgent", "table_backend", "hash_table_args", "new_q_table",
+           "run_training", "run_demo", "clear_q_table", "LR", "GAMMA", "EPSILON_START", "DECAY_RATE"]
+
+Q_TABLE_PATH = "q_table.pkl"
 
 class QTableAgent:
-    def __init__(self):
+    def __init__(self, backend="dict", q_table=None, path=Q_TABLE_PATH, config=None):
+        """
+        backend="dict" giữ Q-Table dạng dict; "dense" dùng mảng DenseQTable (2048, 3);
+        "hash" dùng HashQTable (cho encoder nhiều bit, giới hạn bộ nhớ theo config.table_mb).
+        Truyền `q_table` để dùng một bảng có sẵn (ví dụ bảng trong shared memory) thay vì đọc file.
+        `path` là file q_table.pkl hoặc checkpoint .npz để nạp.
+        backend="live" map chỉ đọc file live `path` của một trainer đang chạy (xem livetable.py):
+        mỗi lần tra đều thấy Q-value mới nhất, chỉ dùng được với get_actions (greedy).
+        `config` (RunConfig) cho lr, gamma, epsilon_start, decay_rate; mặc định là các hằng số trong config.py.
+        config.symmetry=True gộp các state đối xứng vào một SymmetricQTable (mọi backend, chỉ encoder basic).
+        """
+        self.config = config if config is not None else DEFAULT_CONFIG
+        self.encoder = get_encoder(self.config.encoder)
         self.n_games = 0
         self.epsilon = 0
         self.q_table = {}
-        self.load_table()
-    #state = (danger, move)
+        if q_table is not None:
+            self.q_table = q_table
+            return
+        if backend == "live":
+            if self.encoder.bits > STATE_BITS:
+                raise ValueError("live tables hold 11-bit states; use the basic encoder")
+            from livetable import open_live
+            self.q_table, reader = open_live(path)
+            self.n_games = reader.n_games
+            return
+        self.load_table(path)
+        if self.config.symmetry:
+            if self.encoder.bits > STATE_BITS or backend == "hash":
+                raise ValueError("symmetry canonicalization works on the basic 11-bit state only")
+            self.q_table = SymmetricQTable.from_dict(self.q_table)
+        elif backend == "dense":
+            if self.encoder.bits > STATE_BITS:
+                raise ValueError(f"encoder '{self.config.encoder}' needs the hash backend")
+            self.q_table = DenseQTable.from_dict(self.q_table)
+        elif backend == "hash":
+            self.q_table = HashQTable.from_dict(self.q_table, **hash_table_args(self.config))
+        elif backend != "dict":
+            raise ValueError(f"Unknown Q-table backend: {backend}")
+    #state = (danger, move), xem encoders.py
     def get_state(self, game):
-        head = game.snake[0]
-        
-        # Calculate danger in all 4 directions
-        point_l = Point(head.x - BLOCK_SIZE, head.y)
-        point_r = Point(head.x + BLOCK_SIZE, head.y)
-        point_u = Point(head.x, head.y - BLOCK_SIZE)
-        point_d = Point(head.x, head.y + BLOCK_SIZE)
-        
-        dir_l = game.direction == Direction.LEFT
-        dir_r = game.direction == Direction.RIGHT
-        dir_u = game.direction == Direction.UP
-        dir_d = game.direction == Direction.DOWN
-
-        # is_trap function will return True if moving to that point leads to a trap
-        is_danger_l = game.is_trap(point_l)
-        is_danger_r = game.is_trap(point_r)
-        is_danger_u = game.is_trap(point_u)
-        is_danger_d = game.is_trap(point_d)
-
-        state = [
-            # Danger Straight
-            (dir_r and is_danger_r) or 
-            (dir_l and is_danger_l) or 
-            (dir_u and is_danger_u) or 
-            (dir_d and is_danger_d),
-
-            # Danger Right
-            (dir_u and is_danger_r) or 
-            (dir_d and is_danger_l) or 
-            (dir_l and is_danger_u) or 
-            (dir_r and is_danger_d),
-
-            # Danger Left
-            (dir_d and is_danger_r) or 
-            (dir_u and is_danger_l) or 
-            (dir_r and is_danger_u) or 
-            (dir_l and is_danger_d),
-            
-            # Move Direction
-            dir_l, dir_r, dir_u, dir_d,
-            
-            # Food Location
-            game.food.x < game.head.x, # Food Left
-            game.food.x > game.head.x, # Food Right
-            game.food.y < game.head.y, # Food Up
-            game.food.y > game.head.y  # Food Down
-        ]
-        
-        return tuple(map(int, state))
+        return self.encoder.features(game)
 
     # Get Q-values for a state, initialize if not present
     def get_q_values(self, state):
@@ -81,7 +71,7 @@ class QTableAgent:
         final_move = [0, 0, 0]
         
         if train_mode:
-            self.epsilon = max(1, EPSILON_START - self.n_games * DECAY_RATE)
+            self.epsilon = max(1, self.config.epsilon_start - self.n_games * self.config.decay_rate)
         else:
             self.epsilon = 0
         #probability of discovery: 80/200 at the beginning, decreasing over time
@@ -106,77 +96,277 @@ class QTableAgent:
             next_q = self.get_q_values(next_state)
             max_next_q = np.max(next_q)
             # Q learning formula
-            target = current_val + LR * (reward + GAMMA * max_next_q - current_val)
+            target = current_val + self.config.lr * (reward + self.config.gamma * max_next_q - current_val)
+
+        # Ghi lại qua q_table[state]: SymmetricQTable trả về bản sao đã đổi thứ tự action
+        current_q[action_idx] = target
+        self.q_table[state] = current_q
+
+    # --- API theo lô: mọi env trong một lần gọi, action là chỉ số 0/1/2 ---
+    def get_states(self, env):
+        """States đã pack (mảng int) cho mọi env của HeadlessSnakeGame/VectorizedSnakeGame hoặc BatchSnakeEngine."""
+        return self.encoder.encode_all(env)
 
-        self.q_table[state][action_idx] = target
+    def _dense_table(self):
+        if not isinstance(self.q_table, (DenseQTable, HashQTable, SymmetricQTable)):
+            raise TypeError('Batch methods need QTableAgent(backend="dense") or backend="hash"')
+        return self.q_table
 
-    def save_table(self):
+    def get_actions(self, states, train_mode=True):
+        """Epsilon-greedy cho cả lô với một lần rút số ngẫu nhiên duy nhất."""
+        table = self._dense_table()
+        if train_mode:
+            self.epsilon = max(1, self.config.epsilon_start - self.n_games * self.config.decay_rate)
+        else:
+            self.epsilon = 0
+        # draws // 3 phân bố đều trên 0..200 (như random.randint(0, 200)), draws % 3 là action ngẫu nhiên
+        draws = np.random.randint(0, 201 * 3, len(states))
+        actions = draws % 3
+        greedy = draws // 3 >= self.epsilon
+        actions[greedy] = table.best_actions(states[greedy])
+        return actions
+
+    def train_batch(self, states, actions, rewards, next_states, dones):
+        """Cập nhật Q-value cho mọi transition của một tick (xem DenseQTable.update_batch)."""
+        self._dense_table().update_batch(states, actions, rewards, next_states, dones,
+                                         self.config.lr, self.config.gamma)
+
+    def hyperparameters(self):
+        return self.config.hyperparameters()
+
+    def save_table(self, path=Q_TABLE_PATH):
         print(f"Saving Q-Table with {len(self.q_table)} states...")
-        with open("q_table.pkl", "wb") as f:
-            data = {
-                "q_table": self.q_table,
-                "n_games": self.n_games
-            }
-            pickle.dump(data, f)
-
-    def load_table(self):
-        if os.path.exists("q_table.pkl"):
-            with open("q_table.pkl", "rb") as f:
-                try:
-                    data = pickle.load(f)
-                    if isinstance(data, dict) and "q_table" in data:
-                        self.q_table = data["q_table"]
-                        self.n_games = data["n_games"] # Khôi phục số ván
-                        print(f"Loaded Q-Table and continued from game {self.n_games}.")
-                    else:
-                        # Hỗ trợ đọc file cũ (chỉ có q_table)
-                        self.q_table = data
-                        self.n_games = 0
-                        print("Loaded old version Q-Table.")
-                except:
-                    print("Error loading Q-Table")
+        q_table = self.q_table
+        if isinstance(q_table, (DenseQTable, SymmetricQTable)):
+            q_table = q_table.to_dict()
+        data = {
+            "q_table": q_table,
+            "n_games": self.n_games,
+            "state_encoding": self.encoder.spec(),
+        }
+        # Ghi file tạm rồi đổi tên: dừng giữa chừng cũng không làm hỏng file cũ
+        atomic_write(path, lambda f: pickle.dump(data, f))
+
+    def load_table(self, path=Q_TABLE_PATH):
+        if not os.path.exists(path):
+            return
+        if path.endswith(".live"):
+            from livetable import LiveQTableReader
+            try:
+                reader = LiveQTableReader.open(path)
+            except (OSError, ValueError) as e:
+                print(f"Error loading live Q-Table {path}: {e}")
+                return
+            table = reader.snapshot()
+            self.q_table = (SymmetricQTable(table) if reader.symmetry else table).to_dict()
+            self.n_games = reader.n_games
+            reader.close()
+            print(f"Loaded live Q-Table and continued from game {self.n_games}.")
+            return
+        if path.endswith(".npz"):
+            try:
+                table, meta = load_checkpoint(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading checkpoint {path}: {e}")
+                return
+            if meta.get("state_encoding", {}).get("name") != self.encoder.name:
+                print(f"Error loading checkpoint {path}: state encoding differs from {self.encoder.name}")
+                return
+            self.q_table = table.to_dict()
+            self.n_games = meta.get("n_games", 0)
+            print(f"Loaded checkpoint and continued from game {self.n_games}.")
+            return
+        with open(path, "rb") as f:
+            try:
+                data = pickle.load(f)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+                print(f"Error loading Q-Table: {e}")
+                return
+        if isinstance(data, dict) and "q_table" in data:
+            encoding = data.get("state_encoding", BasicEncoder().spec())
+            if encoding["name"] != self.encoder.name:
+                print(f"Error loading Q-Table: it uses state encoding {encoding['name']}, "
+                      f"this agent uses {self.encoder.name}")
+                return
+            self.q_table = data["q_table"]
+            self.n_games = data["n_games"] # Khôi phục số ván
+            print(f"Loaded Q-Table and continued from game {self.n_games}.")
+        else:
+            # Hỗ trợ đọc file cũ (chỉ có q_table)
+            self.q_table = data
+            self.n_games = 0
+            print("Loaded old version Q-Table.")
+
+def table_backend(config=None):
+    """Backend cho API theo lô: DenseQTable nếu state của encoder vừa 11 bit, không thì HashQTable."""
+    config = config if config is not None else DEFAULT_CONFIG
+    return "dense" if get_encoder(config.encoder).bits <= STATE_BITS else "hash"
+
+
+def hash_table_args(config=None):
+    config = config if config is not None else DEFAULT_CONFIG
+    max_bytes = int(config.table_mb * (1 << 20)) if config.table_mb else None
+    return {"state_bits": get_encoder(config.encoder).bits, "max_bytes": max_bytes}
+
+
+def new_q_table(config=None):
+    """Q-Table rỗng cho API theo lô, đúng backend của `config`."""
+    if config is not None and config.symmetry:
+        return SymmetricQTable()
+    if table_backend(config) == "dense":
+        return DenseQTable()
+    return HashQTable(**hash_table_args(config))
+
 
 # --- Main Content ---
-def run_training():
-    """Chạy vòng lặp training 16 envs"""
-    agent = QTableAgent()
-    env = VectorizedSnakeGame()
+def run_training(env=None, max_steps=None, max_games=None, seed=None, checkpoints=None,
+                 load_path=Q_TABLE_PATH, profiler=None, spectate=None, record_dir=None, config=None,
+                 live_path=None, replay_dir=None, replay_min_score=0):
+    """Chạy vòng lặp training song song.
+
+    `env` mặc định là cửa sổ 16 envs; truyền `HeadlessSnakeGame` để chạy không cần màn hình.
+    `max_steps` giới hạn số tick (mỗi tick mọi env đi một bước), `max_games` giới hạn số ván
+    kết thúc trong lần chạy này. `checkpoints` (CheckpointManager) nhận các lần lưu giữa chừng
+    trên thread nền thay vì ghi q_table.pkl ngay trong vòng lặp. `load_path` là bảng để học tiếp
+    (q_table.pkl hoặc checkpoint .npz). `profiler` (PhaseProfiler) đo thời gian từng pha.
+    `spectate` là tên vùng shared memory để chia sẻ bàn cờ cho viewer (xem spectator.py).
+    `record_dir` ghi mọi transition vào log trên đĩa để học lại offline (xem trajectory.py).
+    `config` (RunConfig) cho hyperparameter của agent và cấu hình env mặc định.
+    `live_path` cho Q-Table vào file live (livetable.py) để demo/eval/serve đọc trực tiếp khi đang train.
+    `replay_dir` lưu mỗi ván có điểm >= `replay_min_score` thành file .snkr để xem lại (replay.py).
+    Trả về agent sau khi đã lưu Q-Table.
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    agent = QTableAgent(backend=table_backend(config), path=load_path, config=config)
+    if record_dir and agent.encoder.bits > STATE_BITS:
+        raise ValueError("trajectory logs store 11-bit states; record with the basic encoder")
+    if checkpoints is not None and agent.encoder.bits > STATE_BITS:
+        # Kiểm tra trước khi train: nếu không, lần checkpoint đầu tiên mới báo lỗi và mất công đã chạy
+        raise ValueError("checkpoints hold 11-bit states; use the basic encoder or save with q_table.pkl only")
+    live = None
+    if live_path:
+        from livetable import publish
+        agent.q_table, live = publish(live_path, agent.q_table, agent.n_games)
+    if env is None:
+        from game import VectorizedSnakeGame
+        env = VectorizedSnakeGame(config=config)
+    prof = profiler if profiler is not None else NULL_PROFILER
+    if hasattr(env, "profiler"):
+        env.profiler = prof
+    spectator = None
+    if spectate:
+        from spectator import SpectatorPublisher
+        spectator = SpectatorPublisher(env, spectate)
+    recorder = None
+    if record_dir:
+        from trajectory import TrajectoryWriter
+        recorder = TrajectoryWriter(record_dir, len(agent.get_states(env)))
+    replays = None
+    if replay_dir:
+        from replay import record_env
+        replays = record_env(env, replay_dir, replay_min_score, seed=seed)
     record = 0
+    steps = 0
+    games = 0
     running = True
+    def save_progress():
+        if checkpoints is not None:
+            checkpoints.save(agent.q_table, agent.n_games, agent.hyperparameters())
+        else:
+            agent.save_table()
+
+    # State sau mỗi tick là state đầu của tick kế tiếp (env đã tự reset ván vừa kết thúc),
+    # nên chỉ tính một lần mỗi tick
+    with prof.phase("get_state"):
+        states_old = agent.get_states(env)
     while running:
-        states_old = [agent.get_state(game) for game in env.games]
-        final_moves = []
-        for state in states_old:
-            final_moves.append(agent.get_action(state, train_mode=True))
-        rewards, dones, scores, stop_req = env.step_all(final_moves)
+        with prof.phase("get_action"):
+            final_moves = agent.get_actions(states_old, train_mode=True)
+        with prof.phase("step"):
+            rewards, dones, scores, stop_req = env.step_all(final_moves)
+        if spectator is not None:
+            spectator.maybe_publish(env)
+            stop_req = stop_req or spectator.stop_requested()
         if stop_req:
             agent.save_table()
             running = False
             continue
-        states_new = [agent.get_state(game) for game in env.games]
-        #
-        for i in range(NUM_ENVS):
-            agent.train_step(states_old[i], final_moves[i], rewards[i], states_new[i], dones[i])
-            if dones[i]:
-                agent.n_games += 1
-                if scores[i] > record:
-                    record = scores[i]
-                    if record % 5 == 0: agent.save_table()
-
-def run_demo():
-    agent = QTableAgent()
+        with prof.phase("get_state"):
+            states_new = agent.get_states(env)
+        dones = np.asarray(dones, dtype=bool)
+        with prof.phase("train"):
+            agent.train_batch(states_old, final_moves, rewards, states_new, dones)
+        if recorder is not None:
+            with prof.phase("record"):
+                recorder.append(states_old, final_moves, rewards, states_new, dones)
+        if prof.enabled:
+            prof.count("env_steps", len(states_old))
+            prof.count("games", int(dones.sum()))
+            prof.gauge("q_table_size", len(agent.q_table))
+            prof.maybe_export()
+        for i in np.flatnonzero(dones):
+            agent.n_games += 1
+            games += 1
+            if scores[i] > record:
+                record = scores[i]
+                if record % 5 == 0: save_progress()
+        if live is not None:
+            live.n_games = agent.n_games
+        if checkpoints is not None:
+            checkpoints.maybe_save(agent.q_table, agent.n_games, agent.hyperparameters())
+        steps += 1
+        if (max_steps is not None and steps >= max_steps) or \
+           (max_games is not None and games >= max_games):
+            agent.save_table()
+            running = False
+        states_old = states_new
+    if checkpoints is not None:
+        checkpoints.save(agent.q_table, agent.n_games, agent.hyperparameters())
+        checkpoints.close()
+    if spectator is not None:
+        spectator.close()
+    if recorder is not None:
+        recorder.close()
+    if live is not None:
+        live.flush()
+    print(f"Training finished: {steps} steps, {games} games, record {record}.")
+    if replays is not None:
+        print(f"Saved {replays.saved} game recordings to {replay_dir}.")
+    if isinstance(agent.q_table, HashQTable):
+        stats = agent.q_table.stats()
+        print(f"Hash Q-table: {stats['states']} states in {stats['bytes'] / (1 << 20):.1f} MB, "
+              f"{stats['evicted']} evicted, {stats['never_updated']} never updated.")
+    return agent
+
+def run_demo(path=Q_TABLE_PATH, replay_dir=None):
+    """
+    Chơi greedy trong cửa sổ. `path` là file .live thì đọc thẳng bảng của trainer đang chạy.
+    `replay_dir` lưu mọi ván thành file .snkr (xem replay.py).
+    """
+    from game import DemoGame
+    live = path.endswith(".live")
+    agent = QTableAgent(backend="live" if live else "dict", path=path)
     env = DemoGame()
+    if replay_dir:
+        from replay import record_env
+        record_env(env, replay_dir)
     print("Starting Demo Mode...")
     while True:
-        state = agent.get_state(env.game)
-        action = agent.get_action(state, train_mode=False)
+        if live:
+            states = np.array([agent.encoder.encode(env.game)])
+            action = int(agent.get_actions(states, train_mode=False)[0])
+        else:
+            state = agent.get_state(env.game)
+            action = agent.get_action(state, train_mode=False)
         stop_req = env.step(action)
         if stop_req:
             break
 
 def clear_q_table():
-    if os.path.exists("q_table.pkl"):
-        os.remove("q_table.pkl")
+    if os.path.exists(Q_TABLE_PATH):
+        os.remove(Q_TABLE_PATH)
         print("Data cleared! Training will start from scratch.")
     else:
-        print("No data found to delete.")
\ No newline at end of file
+        print("No data found to delete.")
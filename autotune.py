@@ -0,0 +1,223 @@
+# autotune.py
+"""
+Tự chọn engine, số env, số worker và nhịp vẽ cửa sổ cho máy đang chạy.
+
+Chạy các đợt training ngắn (Q-Table rỗng, không đọc/ghi q_table.pkl), đo env-steps/s và
+tỉ lệ thời gian của từng pha (PhaseProfiler), rồi lưu cấu hình nhanh nhất vào một profile
+JSON để `main.py train --profile` nạp lại. Tìm theo tầng cho ít đợt:
+1. engine x số env trên một process;
+2. số worker cho cấu hình tốt nhất của tầng 1 (khi máy có nhiều nhân);
+3. số env và nhịp vẽ (render_every) của cửa sổ training, khi có màn hình.
+"""
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+from checkpoint import atomic_write
+from config import RunConfig
+from profiler import PhaseProfiler
+
+TUNE_PROFILE_PATH = "tune_profile.json"
+PROFILE_VERSION = 1
+GAMES_ENVS = (4, 8, 16, 32, 64, 128)
+BATCH_ENVS = (256, 1024, 4096)
+WINDOW_ENVS = (4, 9, 16, 25, 36)
+RENDER_EVERY = (1, 2, 5, 10, 25, 100)
+# Nhịp vẽ được chọn là nhịp dày nhất còn giữ được tỉ lệ này của tốc độ không vẽ
+RENDER_SHARE = 0.8
+
+
+def has_display():
+    """Có màn hình để mở cửa sổ không (trên Linux: biến DISPLAY/WAYLAND_DISPLAY)."""
+    if not sys.platform.startswith("linux"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def _burst(config, engine, num_envs, duration, render_every=0, seed=0, start_at=None):
+    """
+    Một đợt training ngắn. Trả về (env-steps/s, {pha: tỉ lệ thời gian}).
+    `start_at` (time.time()) cho các worker cùng bắt đầu đo một lúc.
+    """
+    from agent import QTableAgent, new_q_table
+    random.seed(seed)
+    np.random.seed(seed)
+    config = config.replace(engine=engine, num_envs=num_envs, seed=seed)
+    if render_every:
+        from game import VectorizedSnakeGame
+        env = VectorizedSnakeGame(render_every=render_every, config=config)
+    else:
+        env = config.make_env()
+    agent = QTableAgent(q_table=new_q_table(config), config=config)
+    prof = PhaseProfiler(window=1 << 22)
+    if hasattr(env, "profiler"):
+        env.profiler = prof
+    states_old = agent.get_states(env)
+    if start_at is not None:
+        time.sleep(max(0.0, start_at - time.time()))
+    ticks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        with prof.phase("get_action"):
+            actions = agent.get_actions(states_old, train_mode=True)
+        with prof.phase("step"):
+            rewards, dones, _, _ = env.step_all(actions)
+        with prof.phase("get_state"):
+            states_new = agent.get_states(env)
+        with prof.phase("train"):
+            agent.train_batch(states_old, actions, rewards, states_new, np.asarray(dones, dtype=bool))
+        states_old = states_new
+        ticks += 1
+    elapsed = time.perf_counter() - start
+    phases = {name: sum(samples) / elapsed for name, samples in prof.samples.items()}
+    return ticks * num_envs / elapsed, phases
+
+
+def _worker(args):
+    config, engine, num_envs, duration, seed, start_at = args
+    return _burst(RunConfig.from_dict(config), engine, num_envs, duration, seed=seed, start_at=start_at)
+
+
+def _parallel_burst(config, engine, num_envs, workers, duration):
+    """Tổng env-steps/s của `workers` process chạy cùng lúc, mỗi process một bảng riêng."""
+    start_at = time.time() + 0.5 + 0.1 * workers   # đợi mọi process khởi động xong
+    jobs = [(config.to_dict(), engine, num_envs, duration, seed, start_at) for seed in range(workers)]
+    with mp.Pool(workers) as pool:
+        parts = pool.map(_worker, jobs)
+        pool.close()
+        pool.join()
+    phases = {}
+    for _, part in parts:
+        for name, share in part.items():
+            phases[name] = phases.get(name, 0.0) + share / workers
+    return sum(rate for rate, _ in parts), phases
+
+
+def _worker_counts(cpus, max_workers=None):
+    limit = min(cpus, max_workers or cpus)
+    counts = {limit}
+    n = 2
+    while n < limit:
+        counts.add(n)
+        n *= 2
+    return sorted(c for c in counts if c > 1)
+
+
+def autotune(config=None, duration=1.0, max_workers=None, window=None, log=print):
+    """
+    Chạy các đợt đo và trả về profile (dict). `window` None thì chỉ đo cửa sổ khi có màn hình;
+    True/False để bắt buộc đo hoặc bỏ qua. Encoder khác basic chỉ chạy được engine games
+    trên một process nên bỏ các tầng còn lại.
+    """
+    config = config if config is not None else RunConfig()
+    window = has_display() if window is None else window
+    basic = config.encoder == "basic"
+    cpus = os.cpu_count() or 1
+    trials = []
+
+    def record(stage, rate, phases, engine, envs, workers=1, render_every=0):
+        trial = {"stage": stage, "engine": engine, "envs": envs, "workers": workers,
+                 "render_every": render_every, "steps_per_s": rate, "phases": phases}
+        trials.append(trial)
+        log(f"  {stage:8s} {engine:5s} envs {envs:5d}  workers {workers:2d}  render {render_every:3d}  "
+            f"{rate:12,.0f} env-steps/s")
+        return trial
+
+    log(f"Calibrating on {cpus} CPU(s), {config.grid_w}x{config.grid_h} boards, {duration:g}s per burst")
+    candidates = [("games", n) for n in GAMES_ENVS]
+    if basic:
+        candidates += [("batch", n) for n in BATCH_ENVS]
+    for engine, envs in candidates:
+        rate, phases = _burst(config, engine, envs, duration)
+        record("envs", rate, phases, engine, envs)
+    best = max(trials, key=lambda t: t["steps_per_s"])
+
+    if basic:
+        for workers in _worker_counts(cpus, max_workers):
+            rate, phases = _parallel_burst(config, best["engine"], best["envs"], workers, duration)
+            record("workers", rate, phases, best["engine"], best["envs"], workers)
+    train = max(trials, key=lambda t: t["steps_per_s"])
+
+    shown = None
+    if window:
+        shown = _tune_window(config, duration, record)
+
+    return {
+        "version": PROFILE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"cpus": cpus, "platform": platform.platform(), "python": platform.python_version(),
+                    "display": has_display()},
+        "grid": [config.grid_w, config.grid_h],
+        "encoder": config.encoder,
+        "train": {key: train[key] for key in ("engine", "envs", "workers", "steps_per_s", "phases")},
+        "window": shown,
+        "trials": trials,
+    }
+
+
+def _tune_window(config, duration, record):
+    """Số env và nhịp vẽ cho cửa sổ training (engine games, một process)."""
+    from settings import BLOCK_SIZE, grid_layout, screen_limits
+    headless = {}
+    for envs in WINDOW_ENVS:
+        headless[envs], _ = _burst(config, "games", envs, duration)
+    # Nhiều bàn nhất mà cửa sổ vẽ mỗi bước vẫn không chậm hơn RENDER_SHARE so với không vẽ
+    rendered = {}
+    for envs in WINDOW_ENVS:
+        rate, phases = _burst(config, "games", envs, duration, render_every=1)
+        rendered[envs] = record("window", rate, phases, "games", envs, render_every=1)
+    fits = [n for n in WINDOW_ENVS if rendered[n]["steps_per_s"] >= RENDER_SHARE * headless[n]]
+    envs = max(fits) if fits else max(WINDOW_ENVS, key=lambda n: rendered[n]["steps_per_s"])
+    choice = rendered[envs]
+    if choice["steps_per_s"] < RENDER_SHARE * headless[envs]:
+        for every in RENDER_EVERY[1:]:
+            rate, phases = _burst(config, "games", envs, duration, render_every=every)
+            choice = record("render", rate, phases, "games", envs, render_every=every)
+            if rate >= RENDER_SHARE * headless[envs]:
+                break
+    cols, rows = grid_layout(envs, config.grid_w * BLOCK_SIZE, config.grid_h * BLOCK_SIZE, *screen_limits())
+    return {"envs": envs, "render_every": choice["render_every"], "cols": cols, "rows": rows,
+            "steps_per_s": choice["steps_per_s"], "headless_steps_per_s": headless[envs]}
+
+
+def save_profile(profile, path=TUNE_PROFILE_PATH):
+    atomic_write(path, lambda f: json.dump(profile, f, indent=2), mode="w")
+
+
+def load_profile(path=TUNE_PROFILE_PATH):
+    with open(path) as f:
+        profile = json.load(f)
+    if profile.get("version", 0) > PROFILE_VERSION:
+        raise ValueError(f"{path} has profile version {profile['version']}, supported is {PROFILE_VERSION}")
+    return profile
+
+
+def profile_warnings(profile, config):
+    """Những điểm mà máy/cấu hình hiện tại khác lúc đo profile."""
+    warnings = []
+    if profile["grid"] != [config.grid_w, config.grid_h]:
+        warnings.append("profile was tuned for {}x{} boards".format(*profile["grid"]))
+    if profile["machine"]["cpus"] != (os.cpu_count() or 1):
+        warnings.append(f"profile was tuned on a machine with {profile['machine']['cpus']} CPU(s)")
+    if profile.get("encoder", "basic") != config.encoder:
+        warnings.append(f"profile was tuned with the {profile.get('encoder', 'basic')} encoder")
+    return warnings
+
+
+def format_profile(profile):
+    train = profile["train"]
+    lines = [f"training: engine {train['engine']}, {train['envs']} envs x {train['workers']} worker(s), "
+             f"{train['steps_per_s']:,.0f} env-steps/s"]
+    shown = profile.get("window")
+    if shown:
+        lines.append(f"window:   {shown['envs']} envs in a {shown['cols']}x{shown['rows']} grid, "
+                     f"redraw every {shown['render_every']} tick(s), {shown['steps_per_s']:,.0f} env-steps/s "
+                     f"({shown['headless_steps_per_s']:,.0f} without a window)")
+    # Tỉ lệ trên thời gian thực; pha lồng nhau (play_step nằm trong step) được tính cả hai lần
+    lines.append("phases:   " + ", ".join(f"{name} {share:.0%}" for name, share in
+                                         sorted(train["phases"].items(), key=lambda kv: -kv[1])))
+    return "\n".join(lines)
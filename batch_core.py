@@ -0,0 +1,263 @@
+# batch_core.py
+import numpy as np
+from settings import GRID_W, GRID_H, NUM_ENVS
+from qtable import pack_states
+
+# Hướng theo chiều kim đồng hồ, cùng thứ tự với SingleGame._move: RIGHT, DOWN, LEFT, UP
+DIR_DX = np.array([1, 0, -1, 0])
+DIR_DY = np.array([0, 1, 0, -1])
+# action 0 = đi thẳng, 1 = rẽ phải, 2 = rẽ trái
+TURN = np.array([0, 1, -1])
+
+
+class BatchSnakeEngine:
+    """
+    N bàn cờ Snake lưu dưới dạng mảng NumPy và được cập nhật cùng lúc.
+
+    Luật chơi giống hệt SingleGame.play_step: +20 khi ăn, -20 khi chết
+    (tường, thân hoặc đói quá 100*len(snake) bước), +1 khi lại gần mồi, -2 nếu không.
+    Toạ độ là ô lưới (không phải pixel); ô phẳng = y * grid_w + x.
+    """
+    def __init__(self, num_envs=NUM_ENVS, grid_w=GRID_W, grid_h=GRID_H, seed=None, trap_mode="capped"):
+        self.num_envs = num_envs
+        self.trap_mode = trap_mode
+        self.grid_w = grid_w
+        self.grid_h = grid_h
+        self.n_cells = grid_w * grid_h
+        self.rng = np.random.default_rng(seed)
+
+        # Thân rắn là ring buffer: đầu ở body[i, head_ptr[i]], đuôi lùi lại length-1 ô
+        self.capacity = self.n_cells + 1
+        self.body = np.zeros((num_envs, self.capacity), dtype=np.int32)
+        self.head_ptr = np.zeros(num_envs, dtype=np.int64)
+        self.length = np.zeros(num_envs, dtype=np.int64)
+        self.occupied = np.zeros((num_envs, self.n_cells), dtype=bool)
+
+        self.head_x = np.zeros(num_envs, dtype=np.int64)
+        self.head_y = np.zeros(num_envs, dtype=np.int64)
+        self.direction = np.zeros(num_envs, dtype=np.int64)
+        self.food = np.zeros(num_envs, dtype=np.int64)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        self.frame_iteration = np.zeros(num_envs, dtype=np.int64)
+
+        self.scores = np.zeros(num_envs, dtype=np.int64)       # điểm ván vừa kết thúc
+        self.high_scores = np.zeros(num_envs, dtype=np.int64)
+
+        # Vùng trống liên thông, cập nhật tăng dần như RegionTracker (xem _update_regions).
+        # Nhãn là chỉ số toàn cục env * n_cells + ô; ô bị chiếm mang nhãn canh gác `_no_label`.
+        # Cột cuối của labels (ô thứ n_cells) luôn là canh gác, dùng cho ô ngoài bàn.
+        self._no_label = num_envs * self.n_cells
+        self.labels = np.full((num_envs, self.n_cells + 1), self._no_label, dtype=np.int64)
+        self.region_size = np.zeros(self._no_label + 1, dtype=np.int64)   # nhãn -> số ô
+        self._neighbors, self._ring = self._grid_tables()
+        self.reset()
+
+    def _grid_tables(self):
+        """4 ô kề (RIGHT, DOWN, LEFT, UP) và 8 ô quanh (N, NE, E, SE, S, SW, W, NW) của mỗi ô; n_cells nếu ra ngoài."""
+        x = np.arange(self.n_cells) % self.grid_w
+        y = np.arange(self.n_cells) // self.grid_w
+
+        def around(offsets):
+            nx = x[:, None] + np.array([dx for dx, _ in offsets])
+            ny = y[:, None] + np.array([dy for _, dy in offsets])
+            inside = (nx >= 0) & (nx < self.grid_w) & (ny >= 0) & (ny < self.grid_h)
+            return np.where(inside, ny * self.grid_w + nx, self.n_cells)
+
+        neighbors = around(list(zip(DIR_DX, DIR_DY)))
+        ring = around([(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)])
+        return neighbors, ring
+
+    @classmethod
+    def from_config(cls, config, num_envs=None):
+        if config.encoder != "basic":
+            raise ValueError("BatchSnakeEngine computes the basic 11-bit state only")
+        return cls(num_envs or config.num_envs, config.grid_w, config.grid_h, config.seed, config.trap_mode)
+
+    def reset(self, idx=None):
+        """Đặt lại các env trong `idx` (mặc định tất cả) về trạng thái đầu ván."""
+        if idx is None:
+            idx = np.arange(self.num_envs)
+        idx = np.asarray(idx)
+        if len(idx) == 0:
+            return self
+        hx, hy = self.grid_w // 2, self.grid_h // 2
+        start = hy * self.grid_w + hx - np.arange(2, -1, -1)   # đuôi -> đầu
+
+        self.occupied[idx] = False
+        self.body[idx, :3] = start
+        self.occupied[idx[:, None], start[None, :]] = True
+        self.head_ptr[idx] = 2
+        self.length[idx] = 3
+        self.head_x[idx] = hx
+        self.head_y[idx] = hy
+        self.direction[idx] = 0
+        self.score[idx] = 0
+        self.frame_iteration[idx] = 0
+        self._place_food(idx)
+        self._relabel(idx)
+        return self
+
+    def _place_food(self, idx):
+        # Chọn ngẫu nhiên đều trong các ô trống: khoá ngẫu nhiên, ô bị chiếm nhận -1
+        keys = self.rng.random((len(idx), self.n_cells))
+        keys[self.occupied[idx]] = -1.0
+        # Giống SingleGame._place_food: bàn đã kín thì giữ nguyên mồi cũ
+        has_free = keys.max(axis=1) >= 0
+        self.food[idx[has_free]] = keys[has_free].argmax(axis=1)
+
+    def snake_cells(self, i):
+        """Danh sách ô của rắn thứ i, từ đầu đến đuôi."""
+        ptrs = (self.head_ptr[i] - np.arange(self.length[i])) % self.capacity
+        return self.body[i, ptrs]
+
+    def _relabel(self, idx):
+        """
+        Gán nhãn lại từ đầu các vùng trống của những bàn trong `idx`: lan nhãn nhỏ nhất sang ô kề
+        rồi nhảy con trỏ (label = label[label]) cho tới khi ổn định. Chỉ dùng khi reset hoặc khi
+        cập nhật tăng dần không đủ (vùng có thể bị cắt, hai vùng có thể gộp).
+        """
+        k, h, w, c = len(idx), self.grid_h, self.grid_w, self.n_cells
+        if k == 0:
+            return
+        total = k * c
+        free = ~self.occupied[idx].reshape(k, h, w)
+        # Nhãn cục bộ trong `idx`; ô bị chiếm trỏ tới phần tử canh gác ở cuối mảng phẳng
+        labels = np.where(free, np.arange(total).reshape(k, h, w), total)
+        while True:
+            new = labels.copy()
+            np.minimum(new[:, 1:, :], labels[:, :-1, :], out=new[:, 1:, :])
+            np.minimum(new[:, :-1, :], labels[:, 1:, :], out=new[:, :-1, :])
+            np.minimum(new[:, :, 1:], labels[:, :, :-1], out=new[:, :, 1:])
+            np.minimum(new[:, :, :-1], labels[:, :, 1:], out=new[:, :, :-1])
+            new[~free] = total
+            flat = np.append(new.ravel(), total)
+            new = flat[new]
+            if np.array_equal(new, labels):
+                break
+            labels = new
+        free = free.reshape(k, c)
+        labels = labels.reshape(k, c)
+        sizes = self.region_size[:-1].reshape(self.num_envs, c)
+        sizes[idx] = np.bincount(labels[free], minlength=total).reshape(k, c)
+        # Đổi nhãn cục bộ (hàng r, ô x) sang nhãn toàn cục của env idx[r]
+        self.labels[idx, :c] = np.where(free, idx[:, None] * c + labels % c, self._no_label)
+
+    def _update_regions(self, live, heads, moving, tails):
+        """
+        Cập nhật nhãn sau một bước như RegionTracker: ô đầu mới bị chiếm (env `live`), ô đuôi
+        được giải phóng (env `moving`). Phần lớn env chỉ đổi hai ô; env nào ô đầu có thể cắt đôi
+        vùng hoặc ô đuôi nối nhiều vùng (hay không kề vùng nào) thì gán nhãn lại cả bàn.
+        """
+        labels, no_label = self.labels, self._no_label
+        # Ô đầu: xét 8 ô quanh giống RegionTracker._may_split
+        ring = labels[live[:, None], self._ring[heads]] != no_label
+        n, ne, e, se, s, sw, w, nw = ring.T
+        n_free = n.astype(np.int64) + e + s + w
+        joins = (n & ne & e).astype(np.int64) + (e & se & s) + (s & sw & w) + (w & nw & n)
+        split = (n_free > 1) & (n_free - joins > 1)
+        lab = labels[live, heads]
+        self.region_size[lab] -= 1
+        labels[live, heads] = no_label
+
+        # Ô đuôi: gộp vào vùng kề nếu mọi ô kề còn trống cùng một nhãn
+        near = labels[moving[:, None], self._neighbors[tails]]
+        is_free = near != no_label
+        low = np.where(is_free, near, no_label).min(axis=1)
+        high = np.where(is_free, near, -1).max(axis=1)
+        simple = low == high
+        self.region_size[low[simple]] += 1
+        labels[moving[simple], tails[simple]] = low[simple]
+
+        redo = np.union1d(live[split], moving[~simple])
+        self._relabel(redo)
+
+    def get_states(self):
+        """
+        State 11 bit (đã pack) của mọi env, cùng định nghĩa với QTableAgent.get_state:
+        nguy hiểm thẳng/phải/trái, hướng đi, vị trí mồi.
+        """
+        # Ô kề đầu rắn theo 4 hướng tuyệt đối RIGHT, DOWN, LEFT, UP
+        nx = self.head_x[:, None] + DIR_DX[None, :]
+        ny = self.head_y[:, None] + DIR_DY[None, :]
+        inside = (nx >= 0) & (nx < self.grid_w) & (ny >= 0) & (ny < self.grid_h)
+        cells = np.where(inside, ny * self.grid_w + nx, self.n_cells)
+        sizes = self.region_size[self.labels[np.arange(self.num_envs)[:, None], cells]]
+        # Giống is_trap: vùng trống nhỏ hơn hoặc bằng len + 5 (chặn ở 100 nếu "capped") là ngõ cụt
+        limit = self.length + 5
+        if self.trap_mode == "capped":
+            limit = np.minimum(limit, 100)
+        trap = sizes <= limit[:, None]
+
+        rows = np.arange(self.num_envs)
+        d = self.direction
+        fx = self.food % self.grid_w
+        fy = self.food // self.grid_w
+        bits = np.stack([
+            trap[rows, d], trap[rows, (d + 1) % 4], trap[rows, (d - 1) % 4],
+            d == 2, d == 0, d == 3, d == 1,
+            fx < self.head_x, fx > self.head_x, fy < self.head_y, fy > self.head_y,
+        ], axis=1)
+        return pack_states(bits)
+
+    def step(self, actions):
+        """
+        Cho mọi env đi một bước. `actions` là mảng chỉ số (N,) hoặc one-hot (N, 3).
+        Trả về (rewards, dones, scores); env nào kết thúc sẽ tự reset.
+        """
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+        rows = np.arange(self.num_envs)
+        self.frame_iteration += 1
+
+        fx = self.food % self.grid_w
+        fy = self.food // self.grid_w
+        old_dist = np.abs(fx - self.head_x) + np.abs(fy - self.head_y)
+
+        self.direction = (self.direction + TURN[actions]) % 4
+        nx = self.head_x + DIR_DX[self.direction]
+        ny = self.head_y + DIR_DY[self.direction]
+        hit_wall = (nx < 0) | (nx >= self.grid_w) | (ny < 0) | (ny >= self.grid_h)
+        new_cell = np.where(hit_wall, 0, ny * self.grid_w + nx)
+
+        # Giống SingleGame: va chạm xét cả ô đuôi cũ, đói xét độ dài sau khi chèn đầu
+        hit_self = ~hit_wall & self.occupied[rows, new_cell]
+        starved = self.frame_iteration > 100 * (self.length + 1)
+        dones = hit_wall | hit_self | starved
+        alive = ~dones
+        ate = alive & (new_cell == self.food)
+
+        new_dist = np.abs(fx - nx) + np.abs(fy - ny)
+        rewards = np.where(new_dist < old_dist, 1, -2)
+        rewards[ate] = 20
+        rewards[dones] = -20
+
+        # Đuôi rời đi (khi không ăn), đầu tiến lên
+        moving = np.flatnonzero(alive & ~ate)
+        tail_ptr = (self.head_ptr[moving] - self.length[moving] + 1) % self.capacity
+        tails = self.body[moving, tail_ptr]
+        self.occupied[moving, tails] = False
+
+        live = np.flatnonzero(alive)
+        self.head_ptr[live] = (self.head_ptr[live] + 1) % self.capacity
+        self.body[live, self.head_ptr[live]] = new_cell[live]
+        self.occupied[live, new_cell[live]] = True
+        self._update_regions(live, new_cell[live], moving, tails)
+        self.head_x[live] = nx[live]
+        self.head_y[live] = ny[live]
+
+        self.length[ate] += 1
+        self.score[ate] += 1
+        scores = self.score.copy()
+        np.maximum(self.high_scores, scores, out=self.high_scores)
+        self._place_food(np.flatnonzero(ate))
+
+        finished = np.flatnonzero(dones)
+        self.scores[finished] = scores[finished]
+        self.reset(finished)
+        return rewards, dones, scores
+
+    def step_all(self, actions):
+        """Cùng giao diện với HeadlessSnakeGame.step_all để dùng trong vòng training."""
+        rewards, dones, scores = self.step(actions)
+        return rewards, dones, scores, False
@@ -0,0 +1,360 @@
+# benchmark.py
+"""
+Bộ đo hiệu năng cho các đường nóng (hot path) và vòng training.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --out new.json --compare bench.json --threshold 0.10
+
+Mọi bàn cờ được dựng từ seed cố định nên kết quả so sánh được giữa các commit.
+Thoát với mã 1 nếu có kết quả chậm hơn bản so sánh quá `threshold`.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import numpy as np
+
+if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from core import SingleGame, HeadlessSnakeGame
+from batch_core import BatchSnakeEngine
+from agent import QTableAgent
+from qtable import DenseQTable, HashQTable
+from config import RunConfig
+from symmetry import SymmetricQTable
+from settings import Direction, BLOCK_SIZE, BASE_GAME_W, BASE_GAME_H, GRID_W, GRID_H
+
+SNAKE_LENGTHS = [3, 50, 150, 300]
+
+
+# --- Bàn cờ tái lập được ---
+def make_board(length, seed=0):
+    """SingleGame với rắn dài `length` nằm zig-zag từ góc trên trái, mồi đặt theo seed."""
+    random.seed(seed)
+    game = SingleGame(BASE_GAME_W, BASE_GAME_H)
+    path = []
+    for y in range(GRID_H):
+        xs = range(GRID_W) if y % 2 == 0 else range(GRID_W - 1, -1, -1)
+        path.extend(game.cell(x, y) for x in xs)
+    body = path[:length][::-1]
+    direction = Direction.RIGHT
+    if length > 1:
+        direction = {1: Direction.RIGHT, -1: Direction.LEFT,
+                     GRID_W: Direction.DOWN, -GRID_W: Direction.UP}[body[0] - body[1]]
+    game.set_body(body, direction)
+    game._place_food()
+    return game
+
+
+def make_agent(seed=0):
+    """Agent không đọc q_table.pkl, Q-Table điền ngẫu nhiên theo seed."""
+    rng = np.random.default_rng(seed)
+    table = DenseQTable()
+    table.q[:] = rng.normal(size=table.q.shape)
+    table.visited[:] = True
+    return QTableAgent(q_table=table.to_dict())
+
+
+# --- Đo thời gian ---
+def time_op(fn, repeat=5):
+    """Thời gian tốt nhất cho một lần gọi `fn`, tính bằng ns."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def micro_benchmarks(results):
+    rng = random.Random(0)
+    game = make_board(3)
+    actions = [rng.choice([0, 0, 0, 1, 2]) for _ in range(4096)]
+    it = iter(range(1 << 62))
+
+    def play_step():
+        _, done, _ = game.play_step(actions[next(it) & 4095])
+        if done:
+            game.reset()
+    results["core.play_step"] = (time_op(play_step), "ns/op", False)
+
+    for length in SNAKE_LENGTHS:
+        board = make_board(length)
+        neighbors = board.neighbors[board.head]
+        results[f"core.is_trap[len={length}]"] = (
+            time_op(lambda: [board.is_trap(pt) for pt in neighbors]) / 4, "ns/op", False)
+        results[f"core.is_collision[len={length}]"] = (
+            time_op(lambda: [board.is_collision(pt) for pt in neighbors]) / 4, "ns/op", False)
+
+    agent = make_agent()
+    board = make_board(50)
+    state = agent.get_state(board)
+    next_state = agent.get_state(make_board(51))
+    # get_state trả về state đã cache khi bàn cờ chưa đổi; đo cả lần tính thật lẫn lần trúng cache
+    results["agent.get_state"] = (time_op(lambda: agent.encoder.compute(board)), "ns/op", False)
+    results["agent.get_state[cached]"] = (time_op(lambda: agent.get_state(board)), "ns/op", False)
+    results["agent.get_action"] = (time_op(lambda: agent.get_action(state)), "ns/op", False)
+    results["agent.train_step"] = (
+        time_op(lambda: agent.train_step(state, [0, 1, 0], 1, next_state, False)), "ns/op", False)
+
+    # Cùng một lô 256 transition 11 bit cho cả hai backend theo lô
+    np_rng = np.random.default_rng(0)
+    batch = (np_rng.integers(0, 2048, 256), np_rng.integers(0, 3, 256), np_rng.integers(-2, 2, 256),
+             np_rng.integers(0, 2048, 256), np_rng.random(256) < 0.05)
+    for name, table in (("dense", DenseQTable()), ("hash", HashQTable()), ("symmetric", SymmetricQTable())):
+        results[f"qtable.{name}.update_batch[n=256]"] = (
+            time_op(lambda: table.update_batch(*batch, 0.001, 0.95)), "ns/op", False)
+        results[f"qtable.{name}.best_actions[n=256]"] = (
+            time_op(lambda: table.best_actions(batch[0])), "ns/op", False)
+
+    try:
+        import pygame
+        from ui import UIRenderer
+    except ImportError:
+        print("pygame not available, skipping render benchmarks")
+        return
+    surface = pygame.Surface((BASE_GAME_W, BASE_GAME_H))
+    board = make_board(50)
+    results["ui.draw_grid"] = (
+        time_op(lambda: UIRenderer.draw_grid(surface, BASE_GAME_W, BASE_GAME_H, BLOCK_SIZE)), "ns/op", False)
+    results["ui.draw_game_elements"] = (
+        time_op(lambda: UIRenderer.draw_game_elements(surface, board)), "ns/op", False)
+
+
+def _train_loop(env, agent, duration=None, ticks=None):
+    """
+    Giống vòng lặp run_training nhưng không đọc/ghi file; chạy `duration` giây hoặc `ticks` tick.
+    Trả về (env-steps/s, games/s).
+    """
+    num_envs = len(env.games) if hasattr(env, "games") else env.num_envs
+    steps = games = 0
+    states_old = agent.get_states(env)
+    start = time.perf_counter()
+    while (steps < ticks) if ticks is not None else (time.perf_counter() - start < duration):
+        actions = agent.get_actions(states_old)
+        rewards, dones, _, _ = env.step_all(actions)
+        states_new = agent.get_states(env)
+        agent.train_batch(states_old, actions, rewards, states_new, np.asarray(dones, dtype=bool))
+        states_old = states_new
+        steps += 1
+        games += int(np.sum(dones))
+    elapsed = time.perf_counter() - start
+    return steps * num_envs / elapsed, games / elapsed
+
+
+def training_benchmarks(results, duration):
+    def fresh_agent():
+        return QTableAgent(q_table=DenseQTable())
+
+    setups = [
+        ("headless", lambda: HeadlessSnakeGame(16)),
+        ("batch[envs=1024]", lambda: BatchSnakeEngine(1024, seed=0)),
+    ]
+    try:
+        from game import VectorizedSnakeGame
+        setups.append(("render", lambda: VectorizedSnakeGame(16)))
+    except ImportError:
+        print("pygame not available, skipping rendered training benchmark")
+
+    for name, make_env in setups:
+        random.seed(0)
+        np.random.seed(0)
+        steps_per_s, games_per_s = _train_loop(make_env(), fresh_agent(), duration)
+        results[f"train.{name}.env_steps"] = (steps_per_s, "steps/s", True)
+        results[f"train.{name}.games"] = (games_per_s, "games/s", True)
+    # Engine batch phải nhanh hơn từng SingleGame tính theo env-step, nếu không thì chẳng để làm gì
+    results["train.batch_speedup"] = (results["train.batch[envs=1024].env_steps"][0] /
+                                      results["train.headless.env_steps"][0], "x", True)
+
+
+def failed_checks(results):
+    """Các điều kiện phải luôn đúng, không cần baseline để so."""
+    failures = []
+    speedup = results.get("train.batch_speedup")
+    if speedup is not None and speedup[0] <= 1.0:
+        failures.append(f"batch engine is slower per env-step than headless games ({speedup[0]:.2f}x)")
+    return failures
+
+
+def symmetry_benchmarks(results, ticks, eval_games=200):
+    """
+    So vòng training có và không gộp state đối xứng: cùng seed, cùng số tick, rồi đánh giá
+    greedy trên cùng các ván. `agreement` là tỉ lệ state (đã thăm ở cả hai) chọn cùng action.
+    """
+    from evaluate import evaluate
+    policies = {}
+    for name, symmetry in (("off", False), ("on", True)):
+        random.seed(0)
+        np.random.seed(0)
+        config = RunConfig(symmetry=symmetry)
+        table = SymmetricQTable() if symmetry else DenseQTable()
+        agent = QTableAgent(q_table=table, config=config)
+        steps_per_s, _ = _train_loop(HeadlessSnakeGame(16, config), agent, ticks=ticks)
+        report = evaluate(table, n_games=eval_games, seed=0)
+        policies[name] = table.expanded() if symmetry else table
+        results[f"symmetry.{name}.env_steps"] = (steps_per_s, "steps/s", True)
+        results[f"symmetry.{name}.states"] = (len(table), "states", False)
+        results[f"symmetry.{name}.eval_score"] = (report["score"]["mean"], "score", True)
+    both = np.flatnonzero(policies["off"].visited & policies["on"].visited)
+    same = policies["off"].q[both].argmax(axis=1) == policies["on"].q[both].argmax(axis=1)
+    results["symmetry.agreement"] = (float(same.mean()) * 100 if len(both) else 0.0, "%", True)
+
+
+def lookahead_benchmarks(results, depth=8):
+    """
+    Giá của rollout nhìn trước: một rollout `depth` bước trên bàn rồi restore, so với clone bàn cờ;
+    một quyết định của LookaheadSelector; số rollout vừa trong ngân sách 1 ms cho mỗi bước.
+    """
+    from lookahead import LookaheadSelector
+    rng = random.Random(0)
+    actions = [rng.choice([0, 0, 0, 1, 2]) for _ in range(depth)]
+    for length in SNAKE_LENGTHS:
+        board = make_board(length)
+        root = board.snapshot()
+
+        def rollout():
+            for action in actions:
+                if board.play_step(action)[1]:
+                    break
+            board.restore(root)
+        results[f"core.rollout_restore[len={length}]"] = (time_op(rollout), "ns/op", False)
+        board.drop_snapshots()
+        results[f"core.clone[len={length}]"] = (time_op(board.clone), "ns/op", False)
+
+    table = make_agent().q_table
+    dense = DenseQTable.from_dict(table)
+    board = make_board(50)
+    selector = LookaheadSelector(dense, depth=depth, rollouts=4, seed=0)
+    results[f"lookahead.decision[depth={depth},rollouts=4]"] = (time_op(lambda: selector.select(board)), "ns/op", False)
+    selector = LookaheadSelector(dense, seed=0)
+    results["lookahead.decision[default]"] = (time_op(lambda: selector.select(board)), "ns/op", False)
+    selector = LookaheadSelector(dense, depth=depth, rollouts=1000, budget_ms=1.0, seed=0)
+    counts = []
+    for _ in range(200):
+        selector.select(board)
+        counts.append(selector.last_rollouts)
+    results["lookahead.rollouts_per_ms"] = (float(np.mean(counts)), "rollouts", True)
+
+
+# --- Thời gian import ---
+IMPORT_SETS = [
+    ("core", "core"),
+    ("agent", "core, agent, qtable"),
+    ("game", "game"),
+]
+_IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+print(time.perf_counter() - start, "pygame" in sys.modules)
+"""
+
+
+def import_benchmarks(results, repeat=5):
+    """Đo thời gian import trong process mới (không cache module); core/agent không được kéo pygame vào."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name, modules in IMPORT_SETS:
+        best, pygame_loaded = None, False
+        for _ in range(repeat):
+            out = subprocess.check_output([sys.executable, "-c", _IMPORT_PROBE.format(modules=modules)],
+                                          cwd=here, text=True).split()
+            elapsed, pygame_loaded = float(out[-2]), out[-1] == "True"
+            best = elapsed if best is None else min(best, elapsed)
+        results[f"import.{name}"] = (best * 1000, "ms", False)
+        if pygame_loaded and name != "game":
+            print(f"warning: importing {modules} loads pygame")
+
+
+# --- Xuất và so sánh ---
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def to_json(results):
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.time(),
+        },
+        "results": {name: {"value": value, "unit": unit, "higher_is_better": higher}
+                    for name, (value, unit, higher) in results.items()},
+    }
+
+
+def compare(current, baseline, threshold):
+    """In bảng so sánh, trả về danh sách tên các kết quả bị chậm đi quá `threshold`."""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base["value"]:
+            continue
+        ratio = cur["value"] / base["value"]
+        change = ratio - 1 if cur["higher_is_better"] else 1 / ratio - 1   # >0 là nhanh hơn
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:40s} {base['value']:14.1f} -> {cur['value']:14.1f} {cur['unit']:8s} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snake AI benchmarks")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before failing (0.10 = 10%%)")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per end-to-end training run")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-train", action="store_true")
+    parser.add_argument("--skip-import", action="store_true")
+    parser.add_argument("--skip-lookahead", action="store_true")
+    parser.add_argument("--symmetry-ticks", type=int, default=0,
+                        help="also compare training with and without state symmetry for this many ticks")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if not args.skip_micro:
+        micro_benchmarks(results)
+    if not args.skip_train:
+        training_benchmarks(results, args.duration)
+    if not args.skip_lookahead:
+        lookahead_benchmarks(results)
+    if args.symmetry_ticks:
+        symmetry_benchmarks(results, args.symmetry_ticks)
+    if not args.skip_import:
+        import_benchmarks(results)
+    report = to_json(results)
+
+    for name, (value, unit, _) in results.items():
+        print(f"{name:40s} {value:14.1f} {unit}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    failures = failed_checks(results)
+    for failure in failures:
+        print(f"CHECK FAILED: {failure}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# checkpoint.py
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from qtable import DenseQTable, STATE_BITS
+from symmetry import SymmetricQTable
+
+FORMAT_NAME = "snake-qtable"
+FORMAT_VERSION = 1
+STATE_ENCODING = {"name": "danger3-dir4-food4", "bits": STATE_BITS}
+
+
+def atomic_write(path, write_fn, mode="wb"):
+    """Ghi vào file tạm cùng thư mục rồi đổi tên, nên file đích không bao giờ bị ghi dở."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp tạo file 0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_checkpoint(path, q, visited, meta):
+    """Ghi Q-Table (mảng) và metadata ra file .npz có đánh phiên bản."""
+    meta = dict(meta, format=FORMAT_NAME, version=FORMAT_VERSION)
+    meta.setdefault("state_encoding", STATE_ENCODING)
+    meta_str = np.array(json.dumps(meta))
+    atomic_write(path, lambda f: np.savez_compressed(f, q=q, visited=visited, meta=meta_str))
+
+
+def load_checkpoint(path):
+    """Đọc file checkpoint, trả về (DenseQTable, meta). Sai định dạng -> ValueError."""
+    with np.load(path, allow_pickle=False) as data:
+        if "meta" not in data or "q" not in data:
+            raise ValueError(f"{path} is not a Q-table checkpoint")
+        meta = json.loads(str(data["meta"]))
+        if meta.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not a Q-table checkpoint")
+        if meta.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(f"{path} has checkpoint version {meta['version']}, "
+                             f"newest supported is {FORMAT_VERSION}")
+        table = DenseQTable()
+        table.q[:] = data["q"]
+        table.visited[:] = data["visited"]
+    return table, meta
+
+
+def latest_checkpoint(directory):
+    """Checkpoint mới nhất (theo số ván trong tên file) trong `directory`; None nếu chưa có."""
+    paths = sorted(glob.glob(os.path.join(directory, "ckpt_*.npz")))
+    return paths[-1] if paths else None
+
+
+def _as_arrays(q_table):
+    if getattr(q_table, "state_bits", STATE_BITS) > STATE_BITS:
+        raise ValueError("checkpoints hold 11-bit states only; save this Q-table with save_table")
+    if isinstance(q_table, SymmetricQTable):
+        q_table = q_table.expanded()
+    if not isinstance(q_table, DenseQTable):
+        q_table = DenseQTable.from_dict(q_table)
+    return q_table.q, q_table.visited
+
+
+class CheckpointManager:
+    """
+    Lưu checkpoint trên một thread nền để vòng training không bị dừng.
+
+    `save` chụp bản sao Q-Table ngay trên thread gọi rồi giao cho thread nền ghi file;
+    nếu đang có bản chờ ghi thì bản mới thay thế nó. `every_games` / `every_seconds`
+    điều khiển lưu định kỳ qua `maybe_save`, `keep_last` giữ lại K file mới nhất.
+    """
+    def __init__(self, directory="checkpoints", keep_last=5, every_games=None, every_seconds=None):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.every_games = every_games
+        self.every_seconds = every_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        self._last_games = None
+        self._last_time = time.monotonic()
+        self._pending = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def path_for(self, n_games):
+        return os.path.join(self.directory, f"ckpt_{n_games:010d}.npz")
+
+    def list_checkpoints(self):
+        return sorted(glob.glob(os.path.join(self.directory, "ckpt_*.npz")))
+
+    def latest(self):
+        return latest_checkpoint(self.directory)
+
+    def save(self, q_table, n_games, meta=None):
+        q, visited = _as_arrays(q_table)
+        snapshot = (q.copy(), visited.copy(), dict(meta or {}, n_games=n_games, saved_at=time.time()))
+        with self._cond:
+            self._pending = snapshot
+            self._cond.notify()
+        self._last_games = n_games
+        self._last_time = time.monotonic()
+
+    def maybe_save(self, q_table, n_games, meta=None):
+        """Lưu nếu đã tới hạn theo số ván hoặc thời gian; trả về True nếu có lưu."""
+        if self._last_games is None:
+            self._last_games = n_games
+        due = (self.every_games and n_games - self._last_games >= self.every_games) or \
+              (self.every_seconds and time.monotonic() - self._last_time >= self.every_seconds)
+        if due:
+            self.save(q_table, n_games, meta)
+        return bool(due)
+
+    def flush(self):
+        """Chờ tới khi bản chờ ghi (nếu có) đã ghi xong."""
+        with self._cond:
+            while self._pending is not None:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                q, visited, meta = self._pending
+            try:
+                save_checkpoint(self.path_for(meta["n_games"]), q, visited, meta)
+                self._prune()
+            except Exception as e:
+                # Thread ghi không được chết: flush/close đang chờ nó sẽ treo mãi
+                print(f"Error writing checkpoint: {type(e).__name__}: {e}")
+            finally:
+                with self._cond:
+                    if self._pending is not None and self._pending[2] is meta:
+                        self._pending = None
+                    self._cond.notify_all()
+
+    def _prune(self):
+        if not self.keep_last:
+            return
+        for path in self.list_checkpoints()[:-self.keep_last]:
+            os.remove(path)
@@ -0,0 +1,87 @@
+# config.py
+import hashlib
+import json
+from settings import GRID_W, GRID_H, NUM_ENVS
+
+# Hyperparameters mặc định
+# Q learning formula: target = current_val + LR * (reward + GAMMA * max_next_q - current_val)
+LR = 0.001
+GAMMA = 0.95
+EPSILON_START = 80
+DECAY_RATE = 0.05
+
+
+class RunConfig:
+    """
+    Cấu hình của một lần huấn luyện: hyperparameter của agent, kích thước bàn cờ, số env,
+    engine và seed. QTableAgent, SingleGame, HeadlessSnakeGame và BatchSnakeEngine nhận
+    đối tượng này, nên một process có thể chạy nhiều cấu hình khác nhau cùng lúc.
+    `encoder` là tên state encoder (encoders.py); `table_mb` giới hạn bộ nhớ của HashQTable;
+    `symmetry` gộp các state xoay/lật của bàn cờ vào cùng một dòng Q-Table (symmetry.py).
+    """
+    FIELDS = ("lr", "gamma", "epsilon_start", "decay_rate",
+              "grid_w", "grid_h", "num_envs", "trap_mode", "engine", "seed", "encoder", "table_mb",
+              "symmetry")
+    # Trường thêm sau chỉ đưa vào run_id khi khác mặc định, để mã của các run cũ không đổi
+    _LATE_DEFAULTS = {"encoder": "basic", "table_mb": None, "symmetry": False}
+
+    def __init__(self, lr=LR, gamma=GAMMA, epsilon_start=EPSILON_START, decay_rate=DECAY_RATE,
+                 grid_w=GRID_W, grid_h=GRID_H, num_envs=NUM_ENVS, trap_mode="capped",
+                 engine="games", seed=None, encoder="basic", table_mb=None,
+                 symmetry=False):
+        self.lr = lr
+        self.gamma = gamma
+        self.epsilon_start = epsilon_start
+        self.decay_rate = decay_rate
+        self.grid_w = grid_w
+        self.grid_h = grid_h
+        self.num_envs = num_envs
+        self.trap_mode = trap_mode
+        self.engine = engine
+        self.seed = seed
+        self.encoder = encoder
+        self.table_mb = table_mb
+        self.symmetry = symmetry
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown config field(s): {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def replace(self, **changes):
+        return self.from_dict(dict(self.to_dict(), **changes))
+
+    def run_id(self):
+        """Mã ngắn cố định theo nội dung cấu hình (dùng để nhận ra run khi chạy tiếp sweep)."""
+        data = {k: v for k, v in self.to_dict().items()
+                if k not in self._LATE_DEFAULTS or v != self._LATE_DEFAULTS[k]}
+        blob = json.dumps(data, sort_keys=True)
+        return hashlib.sha1(blob.encode()).hexdigest()[:10]
+
+    def hyperparameters(self):
+        return {"lr": self.lr, "gamma": self.gamma,
+                "epsilon_start": self.epsilon_start, "decay_rate": self.decay_rate}
+
+    def make_env(self):
+        """Môi trường headless theo `engine` ("games" hoặc "batch")."""
+        if self.engine == "batch":
+            from batch_core import BatchSnakeEngine
+            return BatchSnakeEngine.from_config(self)
+        if self.engine != "games":
+            raise ValueError(f"Unknown engine: {self.engine}")
+        from core import HeadlessSnakeGame
+        return HeadlessSnakeGame(config=self)
+
+    def __eq__(self, other):
+        return isinstance(other, RunConfig) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "RunConfig(" + ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items()) + ")"
+
+
+DEFAULT_CONFIG = RunConfig()
@@ -2,59 +2,212 @@
 import random
 import numpy as np
 from collections import deque
-from settings import Direction, Point, BLOCK_SIZE
+from regions import RegionTracker
+from profiler import NULL_PROFILER
+from settings import Direction, BLOCK_SIZE, BASE_GAME_W, BASE_GAME_H, NUM_ENVS
+
+# Thứ tự hướng theo chiều kim đồng hồ; cũng là thứ tự cột của bảng láng giềng
+CLOCK_WISE = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+DIR_INDEX = {d: i for i, d in enumerate(CLOCK_WISE)}
+WALL = -1   # "ô" bên ngoài bàn cờ
+_GRID_TABLES = {}
+
+
+def grid_tables(grid_w, grid_h):
+    """
+    Bảng dựng sẵn (dùng chung cho mọi bàn cùng kích thước), ô đánh số y * grid_w + x:
+    neighbors[cell][k] là ô kề theo hướng CLOCK_WISE[k] (WALL nếu ra ngoài), cell_x, cell_y là toạ độ ô.
+    """
+    key = (grid_w, grid_h)
+    tables = _GRID_TABLES.get(key)
+    if tables is None:
+        n_cells = grid_w * grid_h
+        cell_x = [c % grid_w for c in range(n_cells)]
+        cell_y = [c // grid_w for c in range(n_cells)]
+        neighbors = []
+        for c in range(n_cells):
+            x, y = cell_x[c], cell_y[c]
+            neighbors.append((c + 1 if x + 1 < grid_w else WALL,
+                              c + grid_w if y + 1 < grid_h else WALL,
+                              c - 1 if x > 0 else WALL,
+                              c - grid_w if y > 0 else WALL))
+        tables = _GRID_TABLES[key] = (neighbors, cell_x, cell_y)
+    return tables
+
+class FreeCells:
+    """Tập ô trống: thêm, xoá và lấy ngẫu nhiên đều O(1) (list + chỉ số vị trí)."""
+    def __init__(self, cells):
+        self.cells = list(cells)
+        self.index = {c: i for i, c in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return cell in self.index
+
+    def add(self, cell):
+        if cell not in self.index:
+            self.index[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def remove(self, cell):
+        """Xoá `cell`, trả về vị trí cũ của nó (để undo_remove) hoặc None nếu không có."""
+        i = self.index.pop(cell, None)
+        if i is None:
+            return None
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.index[last] = i
+        return i
+
+    # Hai hàm undo đưa list về đúng thứ tự cũ, nên sample sau đó chọn giống hệt như chưa từng đổi
+    def undo_remove(self, cell, i):
+        if i < len(self.cells):
+            last = self.cells[i]
+            self.index[last] = len(self.cells)
+            self.cells.append(last)
+            self.cells[i] = cell
+        else:
+            self.cells.append(cell)
+        self.index[cell] = i
+
+    def undo_add(self, cell):
+        """Ngược lại add(cell) vừa thêm `cell` vào cuối."""
+        self.cells.pop()
+        del self.index[cell]
+
+    def sample(self, rng=random):
+        return rng.choice(self.cells)
+
+    def copy(self):
+        clone = FreeCells.__new__(FreeCells)
+        clone.cells = self.cells[:]
+        clone.index = self.index.copy()
+        return clone
+
 
 class SingleGame:
-    def __init__(self, w, h):
+    """
+    Một bàn cờ. Mọi vị trí (thân rắn, đầu, mồi) là chỉ số ô nguyên y * grid_w + x;
+    chỉ khi vẽ mới đổi sang pixel (xem ui.py).
+    """
+    def __init__(self, w, h, trap_mode="capped", rng=None):
+        """
+        trap_mode="capped": is_trap giữ ngưỡng cũ min(len(snake) + 5, 100).
+        trap_mode="exact": bỏ giới hạn 100, so sánh kích thước vùng thật với len(snake) + 5.
+        rng: random.Random riêng cho vị trí mồi. Mặc định là một Random của riêng bàn này, seed từ
+        module random lúc tạo (vẫn theo random.seed): restore chỉ lùi RNG của bàn, không đụng RNG chung.
+        """
+        self.rng = rng if rng is not None else random.Random(random.getrandbits(64))
         self.w = w
         self.h = h
+        self.grid_w = int(w // BLOCK_SIZE)
+        self.grid_h = int(h // BLOCK_SIZE)
+        self.n_cells = self.grid_w * self.grid_h
+        self.trap_mode = trap_mode
+        self.neighbors, self.cell_x, self.cell_y = grid_tables(self.grid_w, self.grid_h)
+        self.regions = RegionTracker(self.grid_w, self.grid_h)
+        self._start_free_cells = None   # ô trống lúc bắt đầu ván, giống nhau mọi lần reset
+        # Tăng mỗi khi bàn cờ đổi (play_step, set_body, đặt mồi): state tính theo version cũ còn dùng được
+        self.version = 0
+        self.state_cache = None   # (tên encoder, version, features, state đã pack), xem encoders.py
+        self.recorder = None      # GameRecorder (replay.py) nếu đang ghi lại các ván
+        self._journal = None      # các bước đã đi từ snapshot đầu tiên, để restore chạy ngược lại
         self.reset()
 
+    @classmethod
+    def from_config(cls, config, rng=None):
+        """Bàn cờ grid_w x grid_h ô với trap_mode lấy từ RunConfig."""
+        return cls(config.grid_w * BLOCK_SIZE, config.grid_h * BLOCK_SIZE, config.trap_mode, rng)
+
+    def cell(self, x, y):
+        return y * self.grid_w + x
+
     def reset(self):
-        self.direction = Direction.RIGHT
-        self.head = Point(self.w/2, self.h/2)
-        self.snake = [self.head, 
-                      Point(self.head.x-BLOCK_SIZE, self.head.y), 
-                      Point(self.head.x-(2*BLOCK_SIZE), self.head.y)]
+        # Đầu rắn ở ô giữa bàn, thân kéo dài sang trái
+        head = self.cell(self.grid_w // 2, self.grid_h // 2)
+        self.set_body([head, head - 1, head - 2], Direction.RIGHT,
+                      free_cells=self._start_free_cells and self._start_free_cells.copy())
+        if self._start_free_cells is None:
+            self._start_free_cells = self.free_cells.copy()
         self.score = 0
         self.food = None
         self._place_food()
         self.frame_iteration = 0
+        self.death_cause = None   # "wall", "self" hoặc "starvation" khi ván kết thúc
+        if self.recorder is not None:
+            self.recorder.start(self)
         return self
 
+    def set_body(self, cells, direction, free_cells=None):
+        """
+        Đặt thân rắn (các ô, đầu trước) và hướng đi, dựng lại các cấu trúc phụ:
+        deque thân rắn, tập ô bị chiếm, danh sách ô trống và nhãn vùng trống.
+        """
+        self.version += 1
+        self.drop_snapshots()   # dựng lại cả bàn: các snapshot cũ không còn dùng được
+        self.snake = deque(cells)
+        self.head = self.snake[0]
+        self.direction = direction
+        self.body_set = set(self.snake)
+        if free_cells is None:
+            free_cells = FreeCells(c for c in range(self.n_cells) if c not in self.body_set)
+        self.free_cells = free_cells
+        self.regions.rebuild(self.snake)
+
     def _place_food(self):
-        x = random.randint(0, (self.w-BLOCK_SIZE )//BLOCK_SIZE )*BLOCK_SIZE
-        y = random.randint(0, (self.h-BLOCK_SIZE )//BLOCK_SIZE )*BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        # Lấy thẳng từ các ô trống thay vì thử ngẫu nhiên rồi đệ quy
+        self.version += 1
+        if len(self.free_cells):
+            self.food = self.free_cells.sample(self.rng)
+
+    def food_distance(self):
+        """Khoảng cách Manhattan (số ô) từ đầu rắn tới mồi."""
+        return (abs(self.cell_x[self.food] - self.cell_x[self.head]) +
+                abs(self.cell_y[self.food] - self.cell_y[self.head]))
 
     def play_step(self, action):
+        self.version += 1
         self.frame_iteration += 1
         
         # 1. Tính khoảng cách cũ
-        old_dist = abs(self.food.x - self.head.x) + abs(self.food.y - self.head.y)
+        old_dist = self.food_distance()
 
-        # 2. Di chuyển
-        self._move(action)
-        self.snake.insert(0, self.head)
+        # 2. Di chuyển (kiểm tra va chạm trước khi thêm đầu mới vào tập ô bị chiếm)
+        move = self._move(action)
+        hit = self.is_collision()
+        self.snake.appendleft(self.head)
         
         reward = 0
         game_over = False
         
         # 3. Check va chạm hoặc đói chết
-        if self.is_collision() or self.frame_iteration > 100*len(self.snake):
+        if hit or self.frame_iteration > 100*len(self.snake):
             game_over = True
+            if not hit: self.death_cause = "starvation"
+            elif self.head in self.body_set: self.death_cause = "self"
+            else: self.death_cause = "wall"
             reward = -20 # Phạt nặng khi chết
+            if self._journal is not None:
+                self._journal.append((self.head, -1, None))
+            if self.recorder is not None:
+                self.recorder.finish(self, move)
             return reward, game_over, self.score
 
+        self.body_set.add(self.head)
+        free_index = self.free_cells.remove(self.head)
+        self.regions.occupy(self.head)
+        tail = None
+
         # 4. Logic Thưởng/Phạt
         if self.head == self.food:
             self.score += 1
             reward = 20 # Thưởng lớn khi ăn
             self._place_food()
         else:
-            new_dist = abs(self.food.x - self.head.x) + abs(self.food.y - self.head.y)
+            new_dist = self.food_distance()
             
             # Thêm logic phạt ngõ cụt: Nếu đi vào ngõ cụt (kể cả chưa chết ngay) -> Phạt
             # Nhưng để tiết kiệm hiệu năng, ta để logic tránh ngõ cụt cho Agent xử lý qua State
@@ -64,83 +217,151 @@ class SingleGame:
             else:
                 reward = -2 
             
-            self.snake.pop()
-        
+            tail = self.snake.pop()
+            self.body_set.discard(tail)
+            self.free_cells.add(tail)
+            self.regions.release(tail)
+
+        if self._journal is not None:
+            self._journal.append((self.head, free_index, tail))
+        if self.recorder is not None:
+            self.recorder.step(self, move)
         return reward, game_over, self.score
 
-    def is_collision(self, pt=None):
-        if pt is None: pt = self.head
+    # --- Snapshot / restore cho rollout nhìn trước ---
+    def snapshot(self):
+        """
+        Ghi nhớ trạng thái hiện tại (thân, hướng, mồi, điểm, bộ đếm khung, trạng thái RNG) và trả về
+        một token cho restore. Không chép thân rắn: từ đây mỗi play_step ghi lại ô đầu mới/ô đuôi cũ,
+        restore chạy ngược các bước đó nên tốn O(số bước đã đi). Có thể restore một token nhiều lần
+        và lồng nhiều snapshot; gọi drop_snapshots khi xong để play_step thôi ghi nhật ký.
+        Recorder (nếu có) tạm ngắt trong lúc này để các bước thử không bị ghi thành ván.
+        """
+        if self._journal is None:
+            self._journal = []
+            self._paused_recorder, self.recorder = self.recorder, None
+        return (len(self._journal), self.head, self.direction, self.food, self.score,
+                self.frame_iteration, self.death_cause, self.rng.getstate())
+
+    def restore(self, token):
+        length, head, direction, food, score, frame, death_cause, rng_state = token
+        journal = self._journal
+        if journal is None or len(journal) < length:
+            raise ValueError("snapshot is no longer valid (board was rebuilt or restored past it)")
+        ate = False
+        while len(journal) > length:
+            cell, free_index, tail = journal.pop()
+            if free_index >= 0:
+                if tail is None:
+                    ate = True
+                else:
+                    self.regions.occupy(tail)
+                    self.free_cells.undo_add(tail)
+                    self.body_set.add(tail)
+                    self.snake.append(tail)
+                self.regions.release(cell)
+                self.free_cells.undo_remove(cell, free_index)
+                self.body_set.discard(cell)
+            self.snake.popleft()
+        if ate:
+            self.rng.setstate(rng_state)
+        self.head, self.direction, self.food = head, direction, food
+        self.score, self.frame_iteration, self.death_cause = score, frame, death_cause
+        # Không lùi version: state cache của các bước thử không được trùng với bàn đã restore
+        self.version += 1
+        return self
+
+    @property
+    def has_snapshots(self):
+        return self._journal is not None
+
+    def drop_snapshots(self):
+        """Bỏ mọi snapshot, play_step thôi ghi nhật ký và recorder được gắn lại."""
+        if self._journal is not None:
+            self._journal = None
+            self.recorder = self._paused_recorder
+
+    def clone(self):
+        """Bàn cờ độc lập có cùng trạng thái (kể cả RNG), dùng chung các bảng chỉ đọc của lưới."""
+        twin = SingleGame.__new__(SingleGame)
+        twin.__dict__.update(self.__dict__)
+        twin.snake = self.snake.copy()
+        twin.body_set = self.body_set.copy()
+        twin.free_cells = self.free_cells.copy()
+        twin.regions = self.regions.copy()
+        twin.rng = random.Random(0)   # seed cố định: Random() không tham số đọc os.urandom, chậm
+        twin.rng.setstate(self.rng.getstate())
+        twin.recorder = None
+        twin._journal = None
+        return twin
+
+    def is_collision(self, cell=None):
+        if cell is None: cell = self.head
         # Hit wall
-        if pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0:
-            return True
-        # Hit self
-        if pt in self.snake[1:]:
+        if cell == WALL:
             return True
-        return False
+        # Hit self: tra tập ô bị chiếm O(1), bỏ qua ô đầu hiện tại như snake[1:]
+        return cell in self.body_set and cell != self.snake[0]
+
+    def region_size(self, cell):
+        """Số ô trống liên thông với `cell` (chính xác, không giới hạn); 0 nếu là tường/thân rắn."""
+        if cell == WALL:
+            return 0
+        return self.regions.size(cell)
 
     # --- PHÁT HIỆN NGÕ CỤT (Flood Fill) ---
-    # Use BFS to determine if moving to point pt will lead to a trap
-    def is_trap(self, pt):
+    # Vùng trống được gán nhãn sẵn trong RegionTracker, nên mỗi lần hỏi chỉ là tra cứu
+    def is_trap(self, cell):
         """
-        Kiểm tra xem đi vào điểm pt có bị kẹt không.
-        Trả về True nếu vùng không gian tại pt nhỏ hơn chiều dài rắn (hoặc một ngưỡng an toàn).
+        Kiểm tra xem đi vào ô `cell` có bị kẹt không.
+        Trả về True nếu vùng không gian tại đó nhỏ hơn chiều dài rắn (hoặc một ngưỡng an toàn).
         """
-        # Nếu điểm đó là tường hoặc thân rắn thì coi như là trap luôn
-        if self.is_collision(pt):
-            return True
-
-        # Bắt đầu Flood Fill (Loang)
-        # Giới hạn tìm kiếm: Không cần loang hết bản đồ, chỉ cần loang đủ số bước = chiều dài rắn
-        # Nếu tìm được số ô trống > chiều dài rắn thì an toàn.
-        
-        search_limit = len(self.snake) + 5 # Ngưỡng an toàn
-        if search_limit > 100: search_limit = 100 # Cap lại để không bị lag game khi rắn quá dài
-        
-        queue = deque([pt])
-        visited = {pt}
-        count = 0
-        
-        # Chuyển thân rắn thành set để tra cứu O(1)
-        snake_set = set(self.snake)
-
-        while queue:
-            curr = queue.popleft()
-            count += 1
-            if count > search_limit:
-                return False # An toàn, không gian đủ rộng
-
-            # Kiểm tra 4 hướng xung quanh
-            neighbors = [
-                Point(curr.x + BLOCK_SIZE, curr.y),
-                Point(curr.x - BLOCK_SIZE, curr.y),
-                Point(curr.x, curr.y + BLOCK_SIZE),
-                Point(curr.x, curr.y - BLOCK_SIZE)
-            ]
-
-            for n in neighbors:
-                if n not in visited:
-                    # Kiểm tra biên map
-                    if 0 <= n.x <= self.w - BLOCK_SIZE and 0 <= n.y <= self.h - BLOCK_SIZE:
-                        # Kiểm tra va chạm thân rắn
-                        if n not in snake_set:
-                            visited.add(n)
-                            queue.append(n)
-        
-        # Nếu chạy hết vòng lặp mà count vẫn <= search_limit -> Bị kẹt
-        return True
+        # Tường hoặc thân rắn có kích thước vùng 0 nên luôn là trap
+        limit = len(self.snake) + 5 # Ngưỡng an toàn
+        if self.trap_mode == "capped" and limit > 100: limit = 100
+        return self.region_size(cell) <= limit
 
     def _move(self, action):
-        clock_wise = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
-        idx = clock_wise.index(self.direction)
-        if np.array_equal(action, [1, 0, 0]): new_dir = clock_wise[idx]
-        elif np.array_equal(action, [0, 1, 0]): new_dir = clock_wise[(idx + 1) % 4]
-        else: new_dir = clock_wise[(idx - 1) % 4]
-        self.direction = new_dir
-        
-        x = self.head.x
-        y = self.head.y
-        if self.direction == Direction.RIGHT: x += BLOCK_SIZE
-        elif self.direction == Direction.LEFT: x -= BLOCK_SIZE
-        elif self.direction == Direction.DOWN: y += BLOCK_SIZE
-        elif self.direction == Direction.UP: y -= BLOCK_SIZE
-        self.head = Point(x, y)
\ No newline at end of file
+        idx = DIR_INDEX[self.direction]
+        # action là chỉ số (0 thẳng, 1 phải, 2 trái) hoặc one-hot [thẳng, phải, trái]
+        move = int(action) if isinstance(action, (int, np.integer)) else int(np.argmax(action))
+        if move == 1: idx = (idx + 1) % 4
+        elif move == 2: idx = (idx - 1) % 4
+        self.direction = CLOCK_WISE[idx]
+        self.head = self.neighbors[self.head][idx]
+        return move
+
+
+class HeadlessSnakeGame:
+    """
+    Môi trường song song không cần cửa sổ pygame (chạy ở tốc độ mô phỏng thuần).
+    `config` (RunConfig) cho kích thước bàn, trap_mode và số env khi không truyền `num_envs`.
+    """
+    def __init__(self, num_envs=None, config=None):
+        if num_envs is None:
+            num_envs = config.num_envs if config is not None else NUM_ENVS
+        self.num_envs = num_envs
+        if config is None:
+            self.games = [SingleGame(BASE_GAME_W, BASE_GAME_H) for _ in range(num_envs)]
+        else:
+            self.games = [SingleGame.from_config(config) for _ in range(num_envs)]
+        self.scores = [0] * num_envs
+        self.high_scores = [0] * num_envs
+        self.profiler = NULL_PROFILER
+
+    def step_all(self, actions):
+        with self.profiler.phase("play_step"):
+            return self._play_all(actions)
+
+    def _play_all(self, actions):
+        rewards, dones, scores = [], [], []
+        for i, game in enumerate(self.games):
+            reward, done, score = game.play_step(actions[i])
+            if score > self.high_scores[i]: self.high_scores[i] = score
+            if done:
+                game.reset()
+                self.scores[i] = score
+            rewards.append(reward)
+            dones.append(done)
+            scores.append(score)
+        return rewards, dones, scores, False
@@ -0,0 +1,155 @@
+# encoders.py
+import numpy as np
+from settings import Direction
+from qtable import STATE_BITS, pack_state
+from core import DIR_INDEX
+
+
+def basic_state(game):
+    """State 11 bit gốc: nguy hiểm (thẳng, phải, trái), hướng đi (4 bit), vị trí mồi (4 bit)."""
+    head = game.snake[0]
+
+    # Calculate danger in all 4 directions (bảng láng giềng theo thứ tự R, D, L, U)
+    cell_r, cell_d, cell_l, cell_u = game.neighbors[head]
+
+    dir_l = game.direction == Direction.LEFT
+    dir_r = game.direction == Direction.RIGHT
+    dir_u = game.direction == Direction.UP
+    dir_d = game.direction == Direction.DOWN
+
+    # is_trap function will return True if moving to that cell leads to a trap
+    is_danger_l = game.is_trap(cell_l)
+    is_danger_r = game.is_trap(cell_r)
+    is_danger_u = game.is_trap(cell_u)
+    is_danger_d = game.is_trap(cell_d)
+
+    head_x, head_y = game.cell_x[head], game.cell_y[head]
+    food_x, food_y = game.cell_x[game.food], game.cell_y[game.food]
+
+    state = [
+        # Danger Straight
+        (dir_r and is_danger_r) or
+        (dir_l and is_danger_l) or
+        (dir_u and is_danger_u) or
+        (dir_d and is_danger_d),
+
+        # Danger Right
+        (dir_u and is_danger_r) or
+        (dir_d and is_danger_l) or
+        (dir_l and is_danger_u) or
+        (dir_r and is_danger_d),
+
+        # Danger Left
+        (dir_d and is_danger_r) or
+        (dir_u and is_danger_l) or
+        (dir_r and is_danger_u) or
+        (dir_l and is_danger_d),
+
+        # Move Direction
+        dir_l, dir_r, dir_u, dir_d,
+
+        # Food Location
+        food_x < head_x, # Food Left
+        food_x > head_x, # Food Right
+        food_y < head_y, # Food Up
+        food_y > head_y  # Food Down
+    ]
+
+    return tuple(map(int, state))
+
+
+class StateEncoder:
+    """
+    Giao diện mã hoá state: `features(game)` trả về tuple bit (dùng làm key của Q-Table dict),
+    `encode(game)` trả về số nguyên trong [0, 2**bits) cho các bảng mảng (DenseQTable, HashQTable).
+    Lớp con chỉ cần viết `compute(game)`; kết quả được giữ trong game.state_cache theo
+    game.version, nên hỏi lại cùng một bàn cờ chưa đổi không chạy lại flood fill.
+    """
+    name = None
+    bits = None
+
+    def compute(self, game):
+        raise NotImplementedError
+
+    def _cached(self, game):
+        cache = getattr(game, "state_cache", None)
+        if cache is not None and cache[1] == game.version and cache[0] == self.name:
+            return cache
+        features = self.compute(game)
+        cache = (self.name, getattr(game, "version", None), features, pack_state(features))
+        if hasattr(game, "version"):
+            game.state_cache = cache
+        return cache
+
+    def features(self, game):
+        return self._cached(game)[2]
+
+    def encode(self, game):
+        return self._cached(game)[3]
+
+    def encode_all(self, env):
+        """States đã pack cho mọi env của HeadlessSnakeGame/VectorizedSnakeGame."""
+        if not hasattr(env, "games"):
+            raise ValueError(f"state encoder '{self.name}' needs an env of SingleGame boards")
+        return np.fromiter((self.encode(game) for game in env.games), dtype=np.int64, count=len(env.games))
+
+    def spec(self):
+        return {"name": self.name, "bits": self.bits}
+
+
+class BasicEncoder(StateEncoder):
+    """11 bit của basic_state; BatchSnakeEngine tính sẵn đúng encoding này."""
+    name = "danger3-dir4-food4"
+    bits = STATE_BITS
+
+    def compute(self, game):
+        return basic_state(game)
+
+    def encode_all(self, env):
+        if hasattr(env, "get_states"):
+            return env.get_states()
+        return super().encode_all(env)
+
+
+def _bucket(value, bounds):
+    """Số ngưỡng trong `bounds` mà value vượt qua (0..len(bounds))."""
+    return sum(value > b for b in bounds)
+
+
+class RichEncoder(StateEncoder):
+    """
+    11 bit cơ bản cộng thêm 10 bit (tổng 21 bit, cần HashQTable):
+    - kích thước vùng trống (region_size) ở ô thẳng/phải/trái, 2 bit mỗi ô:
+      0 = tường/thân, 1 = không đủ chứa rắn, 2 = tới 4 lần chiều dài, 3 = rộng hơn;
+    - khoảng cách Manhattan tới mồi (ô): <= 2, <= 5, <= 10, xa hơn;
+    - vị trí đuôi so với đầu: đuôi ở bên trái, đuôi ở phía trên.
+    """
+    name = "danger3-dir4-food4-region6-dist2-tail2"
+    bits = STATE_BITS + 10
+
+    def compute(self, game):
+        head = game.snake[0]
+        idx = DIR_INDEX[game.direction]
+        length = len(game.snake)
+        regions = []
+        for turn in (0, 1, -1):   # thẳng, phải, trái
+            size = game.region_size(game.neighbors[head][(idx + turn) % 4])
+            level = 0 if size == 0 else 1 + _bucket(size, (length, 4 * length))
+            regions += [level >> 1, level & 1]
+        dist_level = _bucket(game.food_distance(), (2, 5, 10))
+        tail = game.snake[-1]
+        return basic_state(game) + tuple(regions) + (
+            dist_level >> 1, dist_level & 1,
+            int(game.cell_x[tail] < game.cell_x[head]), int(game.cell_y[tail] < game.cell_y[head]))
+
+
+ENCODERS = {"basic": BasicEncoder, "rich": RichEncoder}
+
+
+def get_encoder(encoder="basic"):
+    """Tên trong ENCODERS hoặc một StateEncoder có sẵn."""
+    if isinstance(encoder, StateEncoder):
+        return encoder
+    if encoder not in ENCODERS:
+        raise ValueError(f"Unknown state encoder: {encoder} (choose from {', '.join(ENCODERS)})")
+    return ENCODERS[encoder]()
@@ -0,0 +1,134 @@
+# evaluate.py
+import multiprocessing as mp
+import random
+import time
+import numpy as np
+from core import SingleGame
+from qtable import DenseQTable, pack_state
+from settings import BASE_GAME_W, BASE_GAME_H
+
+DEATH_CAUSES = ("wall", "self", "starvation")
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+
+def game_rng(seed, game_index, stream=0):
+    """
+    RNG riêng cho ván `game_index`: kết quả không phụ thuộc số worker hay số env chạy cùng lúc.
+    `stream` khác 0 cho một RNG độc lập khác của cùng ván (stream 1: rollout nhìn trước).
+    """
+    key = (game_index, stream) if stream else (game_index,)
+    return random.Random(int(np.random.SeedSequence(seed, spawn_key=key).generate_state(1)[0]))
+
+
+def play_games(q, game_indices, seed, num_envs=64, lookahead=None):
+    """
+    Chơi greedy (như get_action(train_mode=False)) các ván trong `game_indices`,
+    `num_envs` ván cùng lúc để chọn action theo lô. Trả về {index: (điểm, số bước, nguyên nhân chết)}.
+    `lookahead` (dict tham số của LookaheadSelector) chọn action bằng rollout thay vì greedy.
+    """
+    from agent import QTableAgent
+    table = DenseQTable()
+    table.q[:] = q
+    agent = QTableAgent(q_table=table)
+    selector = None
+    if lookahead:
+        from lookahead import LookaheadSelector
+        selector = LookaheadSelector(table, seed=seed, **lookahead)
+    pending = list(reversed(game_indices))
+    games = []
+    rollout_rngs = {}   # index ván -> RNG rollout của ván đó, để lookahead không phụ thuộc các ván chạy cùng
+    for _ in range(min(num_envs, len(pending))):
+        index = pending.pop()
+        games.append((index, SingleGame(BASE_GAME_W, BASE_GAME_H, rng=game_rng(seed, index))))
+        rollout_rngs[index] = game_rng(seed, index, stream=1)
+    results = {}
+    steps = 0
+    while games:
+        if selector is not None:
+            actions = [selector.select(game, rollout_rngs[index]) for index, game in games]
+        else:
+            states = np.fromiter((pack_state(agent.get_state(game)) for _, game in games),
+                                 dtype=np.int64, count=len(games))
+            actions = table.best_actions(states)
+        still_running = []
+        for (index, game), action in zip(games, actions):
+            _, done, score = game.play_step(int(action))
+            steps += 1
+            if not done:
+                still_running.append((index, game))
+                continue
+            results[index] = (score, game.frame_iteration, game.death_cause)
+            del rollout_rngs[index]
+            if pending:
+                index = pending.pop()
+                game.rng = game_rng(seed, index)
+                rollout_rngs[index] = game_rng(seed, index, stream=1)
+                still_running.append((index, game.reset()))
+        games = still_running
+    return results, steps
+
+
+def _worker(args):
+    q, game_indices, seed, num_envs, lookahead = args
+    return play_games(q, game_indices, seed, num_envs, lookahead)
+
+
+def evaluate(q_table, n_games=1000, seed=0, workers=1, num_envs=64, lookahead=None):
+    """
+    Đánh giá một Q-Table (DenseQTable hoặc dict) trên `n_games` ván cố định bởi `seed`.
+    Ván thứ i luôn có cùng chuỗi vị trí mồi, nên hai checkpoint được so trên đúng cùng các ván.
+    `lookahead` (dict tham số của LookaheadSelector, xem lookahead.py) bật chọn action bằng rollout.
+    """
+    if not isinstance(q_table, DenseQTable):
+        q_table = DenseQTable.from_dict(q_table)
+    start = time.perf_counter()
+    indices = list(range(n_games))
+    if workers > 1:
+        chunks = [(q_table.q, indices[w::workers], seed, num_envs, lookahead) for w in range(workers)]
+        with mp.Pool(workers) as pool:
+            parts = pool.map(_worker, chunks)
+            pool.close()
+            pool.join()
+    else:
+        parts = [play_games(q_table.q, indices, seed, num_envs, lookahead)]
+    elapsed = time.perf_counter() - start
+    results = {}
+    steps = 0
+    for part, part_steps in parts:
+        results.update(part)
+        steps += part_steps
+    return summarize([results[i] for i in indices], elapsed, steps, seed)
+
+
+def summarize(results, elapsed, steps, seed):
+    scores = np.array([r[0] for r in results])
+    lengths = np.array([r[1] for r in results])
+    causes = [r[2] for r in results]
+    n = len(results)
+
+    def dist(values):
+        out = {"mean": float(values.mean()), "std": float(values.std()),
+               "min": int(values.min()), "max": int(values.max())}
+        out.update({f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES})
+        return out
+
+    return {
+        "seed": seed,
+        "games": n,
+        "score": dist(scores),
+        "length": dist(lengths),
+        "deaths": {c: causes.count(c) / n for c in DEATH_CAUSES},
+        "elapsed_s": elapsed,
+        "games_per_s": n / elapsed,
+        "steps_per_s": steps / elapsed,
+    }
+
+
+def format_report(name, report):
+    s, l, d = report["score"], report["length"], report["deaths"]
+    return (f"{name}: {report['games']} games (seed {report['seed']})\n"
+            f"  score   mean {s['mean']:.2f} ± {s['std']:.2f}  p10 {s['p10']:.0f}  p50 {s['p50']:.0f}  "
+            f"p90 {s['p90']:.0f}  p99 {s['p99']:.0f}  max {s['max']}\n"
+            f"  length  mean {l['mean']:.0f}  p50 {l['p50']:.0f}  max {l['max']}\n"
+            f"  deaths  wall {d['wall']:.1%}  self {d['self']:.1%}  starvation {d['starvation']:.1%}\n"
+            f"  speed   {report['games_per_s']:,.1f} games/s, {report['steps_per_s']:,.0f} steps/s")
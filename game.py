@@ -1,86 +1,95 @@
 # game.py
 import pygame
-from settings import *
-from core import SingleGame
-from ui import UIRenderer
+import settings
+from settings import Theme, BLOCK_SIZE, SPEED_TRAIN, SPEED_DEMO, BASE_GAME_W, BASE_GAME_H, init_pygame
+from settings import grid_layout, screen_limits, fit_window
+from core import SingleGame, HeadlessSnakeGame
+from ui import UIRenderer, GridRenderer
+import math
 import os
 
-class VectorizedSnakeGame:
-    def __init__(self):
+class VectorizedSnakeGame(HeadlessSnakeGame):
+    def __init__(self, num_envs=None, render_every=1, show_stats=False, config=None, cols=None):
+        super().__init__(num_envs, config)
+        num_envs = self.num_envs
+        board_w, board_h = self.games[0].w, self.games[0].h
         
         os.environ['SDL_VIDEO_CENTERED'] = '1'
+        init_pygame()
+
+        # Chỉ vẽ lại cửa sổ mỗi `render_every` bước để không làm chậm mô phỏng
+        self.render_every = max(1, render_every)
+        self.step_count = 0
+        # Xếp lưới theo số env và màn hình; cửa sổ lớn hơn màn hình thì thu nhỏ (renderer tự co giãn)
+        max_w, max_h = screen_limits()
+        self.cols = cols or grid_layout(num_envs, board_w, board_h, max_w, max_h)[0]
+        self.rows = math.ceil(num_envs / self.cols)
+        self.width = board_w * self.cols
+        self.height = board_h * self.rows + 50
 
-        self.display = pygame.display.set_mode((BASE_WIDTH, BASE_HEIGHT), pygame.RESIZABLE)
+        self.display = pygame.display.set_mode(fit_window(self.width, self.height, max_w, max_h), pygame.RESIZABLE)
         pygame.display.set_caption('Snake AI Training Cluster')
-        self.canvas = pygame.Surface((BASE_WIDTH, BASE_HEIGHT))
         self.clock = pygame.time.Clock()
-        self.games = [SingleGame(BASE_GAME_W, BASE_GAME_H) for _ in range(NUM_ENVS)]
-        self.scores = [0] * NUM_ENVS
-        self.high_scores = [0] * NUM_ENVS
+        # Lưới tĩnh vẽ sẵn, mỗi khung hình chỉ cập nhật các ô thay đổi
+        self.renderer = GridRenderer(num_envs, self.cols, board_w, board_h)
+        self.canvas = self.renderer.canvas
         
-        self.stop_btn_rect = pygame.Rect(BASE_WIDTH // 2 - 80, BASE_HEIGHT - 40, 160, 30)
+        self.stop_btn_rect = pygame.Rect(self.width // 2 - 80, self.height - 40, 160, 30)
+        self.mouse_pos = (0, 0)
+        # Hiện thống kê của profiler ở thanh dưới (cập nhật tối đa 2 lần/giây)
+        self.show_stats = show_stats
+        self._stats_lines = []
+        self._stats_time = 0
 
     def _get_scaled_mouse_pos(self, mouse_pos):
         win_w, win_h = self.display.get_size()
-        scale_x = win_w / BASE_WIDTH
-        scale_y = win_h / BASE_HEIGHT
+        scale_x = win_w / self.width
+        scale_y = win_h / self.height
         return (mouse_pos[0] / scale_x, mouse_pos[1] / scale_y)
 
     def step_all(self, actions):
+        self.step_count += 1
+        if self.step_count % self.render_every:
+            return super().step_all(actions)
+
         stop_requested = False
-        mouse_pos_virtual = (0,0)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); quit()
-            if event.type == pygame.MOUSEMOTION:
-                mouse_pos_virtual = self._get_scaled_mouse_pos(event.pos)
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                real_mouse_pos = self._get_scaled_mouse_pos(event.pos)
-                if self.stop_btn_rect.collidepoint(real_mouse_pos):
-                    stop_requested = True 
+        with self.profiler.phase("events"):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit(); quit()
+                if event.type == pygame.VIDEORESIZE:
+                    self.renderer.invalidate()
+                if event.type == pygame.MOUSEMOTION:
+                    self.mouse_pos = self._get_scaled_mouse_pos(event.pos)
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    real_mouse_pos = self._get_scaled_mouse_pos(event.pos)
+                    if self.stop_btn_rect.collidepoint(real_mouse_pos):
+                        stop_requested = True 
 
-        rewards, dones, scores = [], [], []
-        for i, game in enumerate(self.games):
-            reward, done, score = game.play_step(actions[i])
-            if score > self.high_scores[i]: self.high_scores[i] = score
-            if done:
-                game.reset()
-                self.scores[i] = score
-            rewards.append(reward)
-            dones.append(done)
-            scores.append(score)
+        rewards, dones, scores, _ = super().step_all(actions)
             
-        self._update_ui(mouse_pos_virtual)
-        self.clock.tick(SPEED_TRAIN)
+        with self.profiler.phase("render"):
+            self._update_ui(self.mouse_pos)
+        with self.profiler.phase("clock"):
+            self.clock.tick(SPEED_TRAIN)
         return rewards, dones, scores, stop_requested
 
     def _update_ui(self, mouse_pos):
-        self.canvas.fill(Theme.BG_DARK)
-        
-        for idx, game in enumerate(self.games):
-            ox = (idx % COLS) * BASE_GAME_W
-            oy = (idx // COLS) * BASE_GAME_H
-            
-            UIRenderer.draw_grid(self.canvas, BASE_GAME_W, BASE_GAME_H, BLOCK_SIZE, ox, oy)
-            UIRenderer.draw_game_elements(self.canvas, game, ox, oy)
-            
-            score_txt = font_main.render(f"{game.score}", True, Theme.TEXT_MAIN)
-            hi_txt = font_main.render(f"H:{self.high_scores[idx]}", True, Theme.ACCENT)
-            self.canvas.blit(score_txt, (ox + 4, oy + 2))
-            self.canvas.blit(hi_txt, (ox + 35, oy + 2))
-
-        pygame.draw.rect(self.canvas, (30,30,35), (0, BASE_HEIGHT - 50, BASE_WIDTH, 50))
-        UIRenderer.draw_button(self.canvas, self.stop_btn_rect, "STOP & SAVE", mouse_pos, is_reset=True)
-
-        scaled_surf = pygame.transform.scale(self.canvas, self.display.get_size())
-        self.display.blit(scaled_surf, (0, 0))
-        pygame.display.flip()
+        if self.show_stats and self.profiler.enabled:
+            now = pygame.time.get_ticks()
+            if now - self._stats_time > 500:
+                self._stats_lines = self.profiler.summary_lines()
+                self._stats_time = now
+        dirty = self.renderer.draw(self.games, self.high_scores, self.stop_btn_rect,
+                                   "STOP & SAVE", mouse_pos, self._stats_lines)
+        self.renderer.present(self.display, dirty)
 
 class DemoGame:
     def __init__(self):
         self.base_w = BASE_GAME_W
         self.base_h = BASE_GAME_H
+        init_pygame()
         self.display = pygame.display.set_mode((self.base_w * 2, self.base_h * 2), pygame.RESIZABLE)
         pygame.display.set_caption('AI Demonstration Mode')
         self.canvas = pygame.Surface((self.base_w, self.base_h))
@@ -107,7 +116,7 @@ class DemoGame:
         UIRenderer.draw_grid(self.canvas, self.base_w, self.base_h, BLOCK_SIZE)
         UIRenderer.draw_game_elements(self.canvas, self.game)
         
-        score_surf = font_main.render(f"SCORE: {self.game.score}", True, Theme.TEXT_MAIN)
+        score_surf = settings.font_main.render(f"SCORE: {self.game.score}", True, Theme.TEXT_MAIN)
         bg_score_rect = score_surf.get_rect(topleft=(5, 5))
         bg_score_rect.inflate_ip(10, 6)
         pygame.draw.rect(self.canvas, (0, 0, 0, 150), bg_score_rect, border_radius=5)
@@ -115,4 +124,4 @@ class DemoGame:
         
         scaled_surf = pygame.transform.scale(self.canvas, self.display.get_size())
         self.display.blit(scaled_surf, (0, 0))
-        pygame.display.flip()
\ No newline at end of file
+        pygame.display.flip()
@@ -0,0 +1,230 @@
+# livetable.py
+"""
+Q-Table dùng chung qua một file map vào bộ nhớ (mmap).
+
+Trainer cập nhật thẳng trong file; demo, eval, serve map file ở chế độ chỉ đọc và thấy giá trị
+mới ở mỗi bước mà không phải nạp lại hay chép cả bảng. Mỗi lần ghi được bao bởi một seqlock:
+bộ đếm `seq` trong header lẻ khi đang ghi, chẵn khi ghi xong; người đọc đọc lại nếu `seq` đổi
+giữa chừng. q_table.pkl (save_table) vẫn là định dạng để xuất và lưu trữ.
+
+Bố cục file: header 64 byte (magic, version, số bit state, cờ, seq, n_games) rồi tới
+vùng nhớ của DenseQTable (xem DenseQTable.BUFFER_SIZE).
+"""
+import mmap
+import os
+import struct
+import time
+import numpy as np
+from checkpoint import atomic_write
+from qtable import DenseQTable, STATE_BITS
+from symmetry import SymmetricQTable
+
+LIVE_TABLE_PATH = "q_table.live"
+MAGIC = b"SNAKEQLV"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+FILE_SIZE = HEADER_SIZE + DenseQTable.BUFFER_SIZE
+FLAG_SYMMETRY = 1
+_HEADER = struct.Struct("<8sIII")   # magic, version, state bits, cờ
+_SEQ, _N_GAMES = 3, 4               # vị trí (word uint64) trong header
+# Người ghi chết giữa lúc ghi thì seq lẻ mãi: quá thời gian này người đọc đọc luôn
+STALE_WRITE_S = 1.0
+
+
+def _map(path, writable):
+    with open(path, "r+b" if writable else "rb") as f:
+        if os.fstat(f.fileno()).st_size != FILE_SIZE:
+            raise ValueError(f"{path} is not a live Q-table")
+        mm = mmap.mmap(f.fileno(), FILE_SIZE, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    magic, version, bits, flags = _HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        mm.close()
+        raise ValueError(f"{path} is not a live Q-table")
+    if version > FORMAT_VERSION or bits != STATE_BITS:
+        mm.close()
+        raise ValueError(f"{path} has live table version {version} with {bits}-bit states, "
+                         f"supported is version {FORMAT_VERSION} with {STATE_BITS}-bit states")
+    return mm, flags
+
+
+class _MappedTable(DenseQTable):
+    """DenseQTable có q/visited nằm trong file đã map."""
+    def _attach(self, path, mm, flags):
+        self.path = path
+        self._mm = mm
+        self._header = np.ndarray((HEADER_SIZE // 8,), dtype=np.uint64, buffer=mm)
+        view = DenseQTable.from_buffer(mm, HEADER_SIZE)
+        self.q, self.visited = view.q, view.visited
+        self.symmetry = bool(flags & FLAG_SYMMETRY)
+
+    @property
+    def generation(self):
+        """Số lần ghi đã hoàn tất."""
+        return int(self._header[_SEQ]) // 2
+
+    @property
+    def n_games(self):
+        return int(self._header[_N_GAMES])
+
+    def close(self):
+        # Bỏ mọi view numpy trước khi đóng mmap
+        self.q = self.visited = self._header = None
+        self._mm.close()
+
+
+class LiveQTable(_MappedTable):
+    """Phía trainer (một người ghi duy nhất): mọi lần ghi bảng đều đi qua seqlock."""
+    @classmethod
+    def create(cls, path, source=None, symmetry=False, n_games=0):
+        """Tạo file mới từ `source` (DenseQTable, mặc định bảng rỗng) rồi map để ghi."""
+        source = source if source is not None else DenseQTable()
+        header = bytearray(HEADER_SIZE)
+        _HEADER.pack_into(header, 0, MAGIC, FORMAT_VERSION, STATE_BITS, FLAG_SYMMETRY if symmetry else 0)
+        struct.pack_into("<Q", header, _N_GAMES * 8, n_games)
+
+        def write(f):
+            f.write(header)
+            f.write(np.ascontiguousarray(source.q, dtype=np.float64).tobytes())
+            f.write(np.ascontiguousarray(source.visited, dtype=bool).tobytes())
+        # Đổi tên vào chỗ: người đọc đang map file cũ không bị cắt ngang
+        atomic_write(path, write)
+        table = cls.__new__(cls)
+        table._attach(path, *_map(path, writable=True))
+        return table
+
+    @property
+    def n_games(self):
+        return int(self._header[_N_GAMES])
+
+    @n_games.setter
+    def n_games(self, value):
+        self._header[_N_GAMES] = value
+
+    def _write(self, fn, *args):
+        self._header[_SEQ] += 1
+        try:
+            return fn(*args)
+        finally:
+            self._header[_SEQ] += 1
+
+    def __setitem__(self, state, values):
+        self._write(super().__setitem__, state, values)
+
+    def update_batch(self, *args):
+        self._write(super().update_batch, *args)
+
+    def update_grouped(self, *args):
+        self._write(super().update_grouped, *args)
+
+    def flush(self):
+        self._mm.flush()
+
+
+class LiveQTableReader(_MappedTable):
+    """
+    Phía người đọc: map chỉ đọc, mỗi lần tra chỉ chép các dòng cần dùng. State chưa thăm đọc ra
+    Q = 0 như get_q_values. Khi trainer tạo lại file, người đọc tự map sang file mới (kiểm tra
+    mỗi `check_every` giây).
+    """
+    check_every = 1.0
+
+    @classmethod
+    def open(cls, path):
+        table = cls.__new__(cls)
+        table._attach(path, *_map(path, writable=False))
+        table._inode = os.stat(path).st_ino
+        table._checked = time.monotonic()
+        return table
+
+    def _maybe_remap(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_every:
+            return
+        self._checked = now
+        try:
+            inode = os.stat(self.path).st_ino
+            if inode == self._inode:
+                return
+            mm, flags = _map(self.path, writable=False)
+        except (OSError, ValueError):
+            return   # file đang được tạo lại hoặc đã bị xoá: giữ bản đang map
+        old = self._mm
+        self._attach(self.path, mm, flags)
+        self._inode = inode
+        try:
+            old.close()
+        except BufferError:
+            pass     # còn view cũ ở đâu đó; mmap được giải phóng khi view bị thu gom
+
+    def _read(self, fn):
+        """Gọi `fn` (chỉ đọc, trả về bản sao) cho tới khi không có lần ghi nào chen giữa."""
+        self._maybe_remap()
+        deadline = None
+        while True:
+            seq = int(self._header[_SEQ])
+            if seq & 1:
+                deadline = deadline or time.monotonic() + STALE_WRITE_S
+                if time.monotonic() < deadline:
+                    time.sleep(0)
+                    continue
+            out = fn()
+            if int(self._header[_SEQ]) == seq or (deadline and time.monotonic() >= deadline):
+                return out
+
+    # --- Giao diện dict (chỉ đọc) ---
+    def __contains__(self, state):
+        return True
+
+    def __getitem__(self, state):
+        idx = self._index(state)
+        return self._read(lambda: self.q[idx].copy())
+
+    def __setitem__(self, state, values):
+        raise TypeError(f"{self.path} is mapped read-only")
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def items(self):
+        return self.snapshot().items()
+
+    # --- Thao tác theo lô ---
+    def lookup(self, states):
+        return self._read(lambda: self.q[states])
+
+    def best_actions(self, states):
+        return self.lookup(states).argmax(axis=1)
+
+    def peek(self, states):
+        return self.lookup(states)
+
+    def update_batch(self, *args):
+        raise TypeError(f"{self.path} is mapped read-only")
+
+    update_grouped = update_batch
+
+    def snapshot(self):
+        """Bản sao DenseQTable nhất quán của bảng hiện tại."""
+        table = DenseQTable()
+        table.q[:], table.visited[:] = self._read(lambda: (self.q.copy(), self.visited.copy()))
+        return table
+
+
+def publish(path, q_table, n_games=0):
+    """
+    Chuyển Q-Table của trainer sang file live ở `path`. Trả về (bảng để train tiếp, LiveQTable):
+    bảng thứ nhất là LiveQTable, hoặc SymmetricQTable bọc nó nếu `q_table` là SymmetricQTable.
+    """
+    if isinstance(q_table, SymmetricQTable):
+        live = LiveQTable.create(path, q_table.table, symmetry=True, n_games=n_games)
+        return SymmetricQTable(live), live
+    if not isinstance(q_table, DenseQTable):
+        raise ValueError("live tables hold the dense 11-bit Q-table; train with the basic encoder")
+    live = LiveQTable.create(path, q_table, n_games=n_games)
+    return live, live
+
+
+def open_live(path):
+    """Q-Table chỉ đọc trên file live, bọc SymmetricQTable nếu trainer dùng symmetry."""
+    reader = LiveQTableReader.open(path)
+    return (SymmetricQTable(reader) if reader.symmetry else reader), reader
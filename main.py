@@ -1,8 +1,18 @@
-from ui import MainMenu
-from agent import run_training, run_demo, clear_q_table
-import pygame
+import argparse
+import random
+import sys
+from agent import run_training, run_demo, clear_q_table, Q_TABLE_PATH
+from config import RunConfig, LR, GAMMA, EPSILON_START, DECAY_RATE
+from encoders import ENCODERS
+from qtable import DenseQTable
+from settings import NUM_ENVS, GRID_W, GRID_H
+from spectator import SPECTATOR_NAME
+from livetable import LIVE_TABLE_PATH
+from autotune import TUNE_PROFILE_PATH
 
-if __name__ == "__main__":
+
+def show_menu():
+    from ui import MainMenu
     menu = MainMenu()
     
     while True:
@@ -17,5 +27,359 @@ if __name__ == "__main__":
             # Sau khi xóa xong, vòng lặp while tiếp tục quay lại hiển thị Menu
         elif mode == "QUIT":
             break
-            
-    pygame.quit()
\ No newline at end of file
+
+
+def _add_config_args(parser):
+    parser.add_argument("--lr", type=float, default=LR)
+    parser.add_argument("--gamma", type=float, default=GAMMA)
+    parser.add_argument("--epsilon-start", type=float, default=EPSILON_START)
+    parser.add_argument("--decay-rate", type=float, default=DECAY_RATE)
+    parser.add_argument("--grid-w", type=int, default=GRID_W, help="board width in cells")
+    parser.add_argument("--grid-h", type=int, default=GRID_H, help="board height in cells")
+    parser.add_argument("--encoder", choices=sorted(ENCODERS), default="basic",
+                        help="state encoding (rich adds region sizes, food distance and tail side)")
+    parser.add_argument("--table-mb", type=float, default=None,
+                        help="memory cap of the hash Q-table used by multi-bit encoders")
+    parser.add_argument("--symmetry", action="store_true",
+                        help="share Q-values between rotated and mirrored boards (basic encoder only)")
+
+
+def _config_from_args(args):
+    return RunConfig(lr=args.lr, gamma=args.gamma, epsilon_start=args.epsilon_start,
+                     decay_rate=args.decay_rate, grid_w=args.grid_w, grid_h=args.grid_h,
+                     num_envs=args.envs, engine=args.engine, seed=args.seed,
+                     encoder=args.encoder, table_mb=args.table_mb, symmetry=args.symmetry)
+
+
+# Giá trị mặc định của các cờ mà profile của `tune` có thể điền (cờ trên dòng lệnh luôn thắng)
+TRAIN_DEFAULTS = {"envs": NUM_ENVS, "workers": 1, "engine": "games", "render_every": 0}
+
+
+def _render_every_arg(text):
+    return text if text == "auto" else int(text)
+
+
+def _resolve_train_args(args, parser):
+    """Điền --envs/--workers/--engine/--render-every chưa đặt từ profile (--profile) hoặc mặc định."""
+    tuned = {}
+    if args.profile:
+        from autotune import load_profile, profile_warnings
+        try:
+            profile = load_profile(args.profile)
+        except FileNotFoundError:
+            parser.error(f"{args.profile} not found (create it with: main.py tune)")
+        window = args.render_every not in (None, 0)
+        if window:
+            if not profile.get("window"):
+                parser.error(f"{args.profile} has no window settings (run main.py tune with a display or --window)")
+            tuned = {k: profile["window"][k] for k in ("envs", "render_every")}
+        else:
+            tuned = {k: profile["train"][k] for k in ("envs", "workers", "engine")}
+            if args.record or args.record_games or args.live:
+                tuned.pop("workers")   # các tuỳ chọn này chỉ chạy trên một process
+            if args.encoder != "basic" and (tuned["engine"] != "games" or tuned.get("workers", 1) > 1):
+                # Encoder khác basic chỉ chạy engine games trên một process
+                print(f"Note: ignoring the profile's engine/workers for the {args.encoder} encoder")
+                tuned.update(engine="games", workers=1)
+        config = RunConfig(grid_w=args.grid_w, grid_h=args.grid_h, encoder=args.encoder)
+        for warning in profile_warnings(profile, config):
+            print(f"Warning: {warning}")
+    if args.render_every == "auto":
+        if "render_every" not in tuned:
+            parser.error("--render-every auto needs --profile")
+        args.render_every = None
+    for name, default in TRAIN_DEFAULTS.items():
+        if getattr(args, name) is None:
+            setattr(args, name, tuned.get(name, default))
+    if tuned:
+        print(f"Profile {args.profile}: engine {args.engine}, {args.envs} envs x {args.workers} worker(s)"
+              + (f", redraw every {args.render_every} tick(s)" if args.render_every else ""))
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def train_cli(args):
+    """Huấn luyện trực tiếp từ dòng lệnh, bỏ qua MainMenu."""
+    config = _config_from_args(args)
+    profiler = None
+    if args.stats_file or args.stats_overlay:
+        from profiler import PhaseProfiler
+        profiler = PhaseProfiler(export_path=args.stats_file, export_every=args.stats_every)
+    checkpoints = None
+    if args.checkpoint_dir:
+        from checkpoint import CheckpointManager
+        checkpoints = CheckpointManager(args.checkpoint_dir, keep_last=args.keep_last,
+                                        every_games=args.checkpoint_every)
+    if args.workers > 1:
+        from parallel import run_parallel_training
+        run_parallel_training(args.workers, args.envs, args.engine, max_steps=args.steps,
+                              max_games=args.games, seed=args.seed, sync_every=args.sync_every,
+                              checkpoints=checkpoints, load_path=args.load, profiler=profiler,
+                              spectate=args.spectate, config=config)
+        return
+    if args.seed is not None:
+        # Mỗi bàn lấy seed RNG mồi từ random lúc tạo env, nên phải seed trước khi tạo
+        random.seed(args.seed)
+    if args.render_every > 0 and args.engine == "games":
+        from game import VectorizedSnakeGame
+        env = VectorizedSnakeGame(render_every=args.render_every, show_stats=args.stats_overlay, config=config)
+    else:
+        env = config.make_env()
+    run_training(env, max_steps=args.steps, max_games=args.games, seed=args.seed,
+                 checkpoints=checkpoints, load_path=args.load, profiler=profiler, spectate=args.spectate,
+                 record_dir=args.record, config=config, live_path=args.live,
+                 replay_dir=args.record_games, replay_min_score=args.record_min_score)
+
+
+def sweep_cli(args):
+    """Chạy nhiều cấu hình song song, ghi tiến độ ra file JSONL, chạy tiếp được khi bị ngắt."""
+    from sweep import grid_configs, run_sweep, MedianStopper
+    grid = {}
+    for item in args.grid:
+        name, _, values = item.partition("=")
+        name = name.replace("-", "_")
+        if name not in RunConfig.FIELDS or not values:
+            raise SystemExit(f"bad --grid entry '{item}' (expected name=v1,v2 with name in {', '.join(RunConfig.FIELDS)})")
+        grid[name] = [_parse_value(v) for v in values.split(",")]
+    seeds = args.seeds if args.seeds else [None]
+    configs = grid_configs(_config_from_args(args), grid, seeds)
+    run_sweep(configs, args.results, max_jobs=args.jobs, max_games=args.games, max_steps=args.steps,
+              report_every=args.report_every, out_dir=args.out_dir,
+              stopper=MedianStopper(args.grace_games, args.min_peers))
+
+
+def watch_cli(args):
+    """Mở cửa sổ xem một trainer đang chạy với --spectate."""
+    from spectator import run_viewer
+    boards = [int(b) for b in args.boards.split(",")] if args.boards else None
+    run_viewer(args.name, boards, fps=args.fps, cols=args.cols)
+
+
+def eval_cli(args):
+    """Đánh giá greedy một hoặc nhiều Q-Table trên cùng các ván đã seed."""
+    import json
+    import os
+    from agent import QTableAgent
+    from evaluate import evaluate, format_report
+    lookahead = None
+    if args.lookahead:
+        lookahead = {"depth": args.lookahead, "rollouts": args.rollouts, "budget_ms": args.budget_ms}
+    reports = {}
+    for path in args.load:
+        if not os.path.exists(path):
+            print(f"{path}: file not found")
+            continue
+        table = QTableAgent(backend="dense", path=path).q_table
+        reports[path] = evaluate(table, args.games, seed=args.seed, workers=args.workers, num_envs=args.envs,
+                                 lookahead=lookahead)
+        print(format_report(path, reports[path]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+def offline_cli(args):
+    """Học Q-Table từ log transition đã ghi bằng `train --record`."""
+    from agent import QTableAgent
+    from trajectory import TrajectoryStore, offline_train
+    store = TrajectoryStore(args.log)
+    print(f"{len(store):,} transitions in {len(store.paths)} chunk(s)")
+    agent = QTableAgent(backend="dense", path=args.init) if args.init else QTableAgent(q_table=DenseQTable())
+    offline_train(store, agent.q_table, lr=args.lr, gamma=args.gamma, sweeps=args.sweeps, batch_size=args.batch_size)
+    agent.save_table(args.out)
+
+
+def demo_cli(args):
+    """Mở cửa sổ Demo với một Q-Table (file .live: theo dõi trainer đang chạy)."""
+    run_demo(args.load, replay_dir=args.record_games)
+
+
+def replay_cli(args):
+    """Phát lại / xuất khung một file .snkr, hoặc thống kê mọi bản ghi trong một thư mục."""
+    import os
+    from replay import ReplayPlayer, load_recording, scan_recordings, scan_stats, format_scan
+    if os.path.isdir(args.path):
+        infos = scan_recordings(args.path)
+        if not infos:
+            raise SystemExit(f"no recordings in {args.path}")
+        print(format_scan(scan_stats(infos, top=args.top)))
+        return
+    player = ReplayPlayer(load_recording(args.path), speed=args.speed)
+    if args.export:
+        count = player.export(args.export, start=args.frame, end=args.end, every=args.every)
+        print(f"Wrote {count} frames to {args.export}")
+    else:
+        player.run(frame=args.frame)
+
+
+def tune_cli(args):
+    """Đo vài cấu hình training ngắn và lưu cấu hình nhanh nhất thành profile (xem autotune.py)."""
+    from autotune import autotune, save_profile, format_profile
+    profile = autotune(_config_from_args(args), duration=args.duration, max_workers=args.max_workers,
+                       window=args.window)
+    save_profile(profile, args.out)
+    print(format_profile(profile))
+    print(f"Saved profile to {args.out} (use: main.py train --profile {args.out})")
+
+
+def serve_cli(args):
+    """Phục vụ action của một Q-Table cho process khác qua socket (xem serve.py)."""
+    from serve import run_server
+    run_server(args.load, host=args.host, port=args.port, socket_path=args.socket,
+               max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+               watch_every=args.watch, log_every=args.log_every)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Snake AI - Q-Learning")
+    sub = parser.add_subparsers(dest="command")
+
+    train = sub.add_parser("train", help="train without the menu (headless by default)")
+    _add_config_args(train)
+    train.add_argument("--envs", type=int, default=None, help=f"number of parallel envs (default {NUM_ENVS})")
+    train.add_argument("--steps", type=int, default=None, help="stop after this many ticks (every env moves once per tick)")
+    train.add_argument("--games", type=int, default=None, help="stop after this many finished games")
+    train.add_argument("--seed", type=int, default=None, help="seed for python and numpy RNGs")
+    train.add_argument("--render-every", type=_render_every_arg, default=None, metavar="N",
+                       help="open a window and redraw every N ticks (0 = headless, auto = tuned rate from --profile)")
+    train.add_argument("--engine", choices=["games", "batch"], default=None,
+                       help="games = list of SingleGame, batch = NumPy BatchSnakeEngine (headless only)")
+    train.add_argument("--workers", type=int, default=None, help="training processes sharing one Q-table (--envs is per worker)")
+    train.add_argument("--profile", nargs="?", const=TUNE_PROFILE_PATH, default=None, metavar="PATH",
+                       help="take unset --envs/--workers/--engine/--render-every from a profile written by `tune`")
+    train.add_argument("--sync-every", type=int, default=100, help="ticks between syncing game counters across workers")
+    train.add_argument("--load", default=Q_TABLE_PATH, help="Q-table to continue from (q_table.pkl, a .npz checkpoint or a .live file)")
+    train.add_argument("--checkpoint-dir", default=None, help="write background .npz checkpoints to this directory")
+    train.add_argument("--checkpoint-every", type=int, default=None, help="also checkpoint every N finished games")
+    train.add_argument("--keep-last", type=int, default=5, help="number of checkpoints to keep (0 = keep all)")
+    train.add_argument("--stats-file", default=None, help="append per-phase timing stats as JSON lines to this file")
+    train.add_argument("--stats-every", type=float, default=10.0, help="seconds between stats exports")
+    train.add_argument("--stats-overlay", action="store_true", help="show timing stats in the window's bottom bar")
+    train.add_argument("--spectate", nargs="?", const=SPECTATOR_NAME, default=None, metavar="NAME",
+                       help="share live boards for `main.py watch` under this shared-memory name")
+    train.add_argument("--record", default=None, metavar="DIR", help="append every transition to a trajectory log in DIR")
+    train.add_argument("--record-games", default=None, metavar="DIR",
+                       help="save finished games as compact .snkr recordings in DIR (see: main.py replay)")
+    train.add_argument("--record-min-score", type=int, default=0, help="only save games scoring at least this much")
+    train.add_argument("--live", nargs="?", const=LIVE_TABLE_PATH, default=None, metavar="PATH",
+                       help="keep the Q-table in a memory-mapped file that demo/eval/serve can read while training")
+    train.set_defaults(func=train_cli)
+
+    tune = sub.add_parser("tune", help="time short training bursts and save the fastest env/worker/render settings")
+    _add_config_args(tune)
+    tune.add_argument("--duration", type=float, default=1.0, help="seconds per calibration burst")
+    tune.add_argument("--max-workers", type=int, default=None, help="largest worker count to try (default: CPU count)")
+    tune.add_argument("--window", action=argparse.BooleanOptionalAction, default=None,
+                      help="also tune the training window (default: only when a display is available)")
+    tune.add_argument("--out", default=TUNE_PROFILE_PATH, help="where to save the profile")
+    tune.set_defaults(func=tune_cli, envs=NUM_ENVS, engine="games", seed=None)
+
+    sweep = sub.add_parser("sweep", help="train many configurations over a process pool")
+    sweep.add_argument("--grid", nargs="+", default=[], metavar="NAME=V1,V2",
+                       help="values to sweep, e.g. lr=0.001,0.01 gamma=0.9,0.95")
+    sweep.add_argument("--seeds", type=int, nargs="*", default=[0], help="repeat every configuration for these seeds")
+    _add_config_args(sweep)
+    sweep.add_argument("--envs", type=int, default=NUM_ENVS, help="envs per run")
+    sweep.add_argument("--engine", choices=["games", "batch"], default="games")
+    sweep.add_argument("--seed", type=int, default=None, help=argparse.SUPPRESS)
+    sweep.add_argument("--games", type=int, default=2000, help="finished games per run")
+    sweep.add_argument("--steps", type=int, default=None, help="also cap ticks per run")
+    sweep.add_argument("--jobs", type=int, default=None, help="runs in parallel (default: CPU count)")
+    sweep.add_argument("--results", default="sweep_results.jsonl", help="progress and results, one JSON event per line")
+    sweep.add_argument("--out-dir", default=None, help="save each run's Q-table here as <run id>.pkl")
+    sweep.add_argument("--report-every", type=int, default=100, help="games between progress events")
+    sweep.add_argument("--grace-games", type=int, default=500, help="games before a run may be stopped early")
+    sweep.add_argument("--min-peers", type=int, default=3, help="other runs needed to compare against before stopping one")
+    sweep.set_defaults(func=sweep_cli)
+
+    offline = sub.add_parser("offline", help="update a Q-table from a recorded trajectory log, without playing")
+    offline.add_argument("--log", required=True, help="directory written by train --record")
+    offline.add_argument("--sweeps", type=int, default=1, help="passes over the whole log")
+    offline.add_argument("--lr", type=float, default=LR)
+    offline.add_argument("--gamma", type=float, default=GAMMA)
+    offline.add_argument("--batch-size", type=int, default=1 << 18, help="transitions per vectorized update")
+    offline.add_argument("--init", default=None, help="start from this Q-table instead of an empty one")
+    offline.add_argument("--out", default="q_table_offline.pkl", help="where to save the resulting Q-table")
+    offline.set_defaults(func=offline_cli)
+
+    demo = sub.add_parser("demo", help="watch the greedy policy play in a window")
+    demo.add_argument("--load", default=Q_TABLE_PATH, help="Q-table to play (.pkl, or a .live file of a running trainer)")
+    demo.add_argument("--record-games", default=None, metavar="DIR", help="save every game as a .snkr recording in DIR")
+    demo.set_defaults(func=demo_cli)
+
+    replay = sub.add_parser("replay", help="play back a .snkr recording, export its frames, or scan a directory of them")
+    replay.add_argument("path", help="a .snkr file, or a directory to summarize")
+    replay.add_argument("--frame", type=int, default=0, help="start at this frame")
+    replay.add_argument("--speed", type=float, default=30, help="playback speed in frames per second")
+    replay.add_argument("--export", default=None, metavar="DIR", help="write frames as PNG files to DIR instead of opening a window")
+    replay.add_argument("--end", type=int, default=None, help="last frame to export (default: the final one)")
+    replay.add_argument("--every", type=int, default=1, help="export every Nth frame")
+    replay.add_argument("--top", type=int, default=5, help="best games to list when scanning a directory")
+    replay.set_defaults(func=replay_cli)
+
+    evaluate = sub.add_parser("eval", help="play seeded greedy games headless and report score statistics")
+    evaluate.add_argument("--load", nargs="+", default=[Q_TABLE_PATH], help="Q-table(s) to evaluate (.pkl, .npz checkpoints or a .live snapshot)")
+    evaluate.add_argument("--games", type=int, default=1000, help="games per Q-table")
+    evaluate.add_argument("--seed", type=int, default=0, help="fixes food positions of every game")
+    evaluate.add_argument("--workers", type=int, default=1, help="evaluation processes")
+    evaluate.add_argument("--envs", type=int, default=64, help="games played side by side in each process")
+    evaluate.add_argument("--json", default=None, help="also write the reports to this JSON file")
+    evaluate.add_argument("--lookahead", type=int, default=0, metavar="DEPTH",
+                          help="pick each move by rollouts of DEPTH steps instead of the greedy action")
+    evaluate.add_argument("--rollouts", type=int, default=2, help="rollouts per first action with --lookahead")
+    evaluate.add_argument("--budget-ms", type=float, default=None, help="time limit of one --lookahead decision")
+    evaluate.set_defaults(func=eval_cli)
+
+    serve = sub.add_parser("serve", help="answer action queries from other processes over a socket")
+    serve.add_argument("--load", default=Q_TABLE_PATH, help="Q-table to serve (.pkl, .npz, .live, or a checkpoint directory)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--socket", default=None, help="listen on this UNIX socket instead of TCP")
+    serve.add_argument("--max-batch", type=int, default=256, help="queries answered by one vectorized lookup")
+    serve.add_argument("--max-wait-ms", type=float, default=0.5, help="time to wait for more queries before a lookup")
+    serve.add_argument("--watch", type=float, default=None, metavar="SECONDS",
+                       help="reload when the Q-table file (or newest checkpoint) changes")
+    serve.add_argument("--log-every", type=float, default=None, metavar="SECONDS", help="print latency/throughput stats")
+    serve.set_defaults(func=serve_cli)
+
+    watch = sub.add_parser("watch", help="attach a viewer window to a trainer started with --spectate")
+    watch.add_argument("--name", default=SPECTATOR_NAME, help="shared-memory name given to train --spectate")
+    watch.add_argument("--boards", default=None, help="comma-separated board indices to show (default: all shared)")
+    watch.add_argument("--fps", type=int, default=30, help="viewer frame rate")
+    watch.add_argument("--cols", type=int, default=None, help="boards per row")
+    watch.set_defaults(func=watch_cli)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == "train":
+        _resolve_train_args(args, parser)
+    if args.command == "train" and args.render_every > 0 and (args.engine == "batch" or args.workers > 1):
+        parser.error("--render-every only works with --engine games and a single worker")
+    if args.command == "train" and args.record and args.workers > 1:
+        parser.error("--record only works with a single worker")
+    if args.command == "train" and args.record_games and args.workers > 1:
+        parser.error("--record-games only works with a single worker")
+    if args.command == "train" and args.encoder != "basic" and (args.engine == "batch" or args.workers > 1):
+        parser.error(f"--encoder {args.encoder} only works with --engine games and a single worker")
+    if args.command == "train" and args.checkpoint_dir and args.encoder != "basic":
+        parser.error("--checkpoint-dir stores 11-bit states; it only works with --encoder basic")
+    if args.command == "train" and args.live and args.workers > 1:
+        parser.error("--live only works with a single worker")
+    if args.command is None:
+        show_menu()
+    else:
+        args.func(args)
+
+    # pygame chỉ được nạp khi có mở cửa sổ
+    if "pygame" in sys.modules:
+        sys.modules["pygame"].quit()
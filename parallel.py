@@ -0,0 +1,183 @@
+# parallel.py
+import multiprocessing as mp
+import os
+import random
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from agent import QTableAgent, Q_TABLE_PATH
+from config import RunConfig
+from qtable import DenseQTable
+from symmetry import SymmetricQTable
+from settings import NUM_ENVS
+
+# Vị trí các bộ đếm dùng chung giữa các worker
+N_GAMES, STEPS, RECORD = 0, 1, 2
+
+
+def _make_env(engine, num_envs, seed, config):
+    if engine == "batch":
+        from batch_core import BatchSnakeEngine
+        return BatchSnakeEngine(num_envs, config.grid_w, config.grid_h, seed=seed, trap_mode=config.trap_mode)
+    from core import HeadlessSnakeGame
+    return HeadlessSnakeGame(num_envs, config)
+
+
+def _budget_reached(counters, max_steps, max_games, start_games):
+    return (max_steps is not None and counters[STEPS] >= max_steps) or \
+           (max_games is not None and counters[N_GAMES] - start_games >= max_games)
+
+
+def _worker(worker_id, shm_name, counters, stop, opts):
+    """
+    Một process huấn luyện: chạy env riêng, đọc/ghi thẳng Q-Table trong shared memory
+    (không khoá, kiểu Hogwild) và đồng bộ bộ đếm chung mỗi `sync_every` tick.
+    """
+    seed = opts["seed"]
+    if seed is not None:
+        seed += worker_id
+        random.seed(seed)
+        np.random.seed(seed)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    spectator = None   # gán trước try: lỗi lúc khởi tạo không bị NameError trong finally che mất
+    try:
+        config = RunConfig.from_dict(opts["config"])
+        table = DenseQTable.from_buffer(shm.buf)
+        if config.symmetry:
+            table = SymmetricQTable(table)
+        agent = QTableAgent(q_table=table, config=config)
+        agent.n_games = counters[N_GAMES]
+        env = _make_env(opts["engine"], opts["num_envs"], seed, config)
+        if worker_id == 0 and opts["spectate"]:
+            # Worker đầu tiên chia sẻ các bàn của nó cho viewer
+            from spectator import SnapshotRing, SpectatorPublisher
+            spectator = SpectatorPublisher(env, ring=SnapshotRing.attach(opts["spectate"], untrack=False))
+        new_games = new_steps = record = 0
+        states_old = agent.get_states(env)
+        while not stop.is_set():
+            final_moves = agent.get_actions(states_old, train_mode=True)
+            rewards, dones, scores, _ = env.step_all(final_moves)
+            states_new = agent.get_states(env)
+            dones = np.asarray(dones, dtype=bool)
+            agent.train_batch(states_old, final_moves, rewards, states_new, dones)
+            states_old = states_new
+            if spectator is not None:
+                spectator.maybe_publish(env)
+
+            n_done = int(dones.sum())
+            if n_done:
+                agent.n_games += n_done
+                new_games += n_done
+                record = max(record, int(np.max(np.asarray(scores)[dones])))
+            new_steps += 1
+            if new_steps >= opts["sync_every"]:
+                with counters.get_lock():
+                    counters[N_GAMES] += new_games
+                    counters[STEPS] += new_steps
+                    counters[RECORD] = max(counters[RECORD], record)
+                    # Epsilon giảm theo tổng số ván của mọi worker
+                    agent.n_games = counters[N_GAMES]
+                    if _budget_reached(counters, opts["max_steps"], opts["max_games"], opts["start_games"]):
+                        stop.set()
+                new_games = new_steps = 0
+    finally:
+        # Phải bỏ mọi view numpy trước khi đóng shared memory
+        agent = table = None
+        shm.close()
+        if spectator is not None:
+            spectator.close()
+
+
+def run_parallel_training(num_workers=None, envs_per_worker=NUM_ENVS, engine="games",
+                          max_steps=None, max_games=None, seed=None, sync_every=100,
+                          checkpoints=None, load_path=Q_TABLE_PATH, profiler=None, spectate=None,
+                          config=None):
+    """
+    Huấn luyện trên nhiều process với một Q-Table dùng chung.
+
+    Mỗi worker chạy `envs_per_worker` env; `max_steps` tính tổng số tick của mọi worker,
+    `max_games` tổng số ván kết thúc trong lần chạy này. n_games, epsilon và record
+    được gộp qua bộ đếm chung. Kết quả được lưu vào q_table.pkl như run_training;
+    `checkpoints` (CheckpointManager) nhận các lần lưu định kỳ từ process chính.
+    `profiler` (PhaseProfiler) ở process chính chỉ ghi tốc độ và kích thước Q-Table
+    từ bộ đếm chung, không đo các pha bên trong worker. `spectate` (tên shared memory)
+    chia sẻ các bàn của worker 0 cho viewer; nút STOP & SAVE của viewer dừng mọi worker.
+    `config` (RunConfig) cho hyperparameter và kích thước bàn của mọi worker; với
+    config.symmetry bảng dùng chung chỉ chứa các state đại diện (xem symmetry.py).
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    config = config if config is not None else RunConfig()
+    if config.encoder != "basic":
+        raise ValueError("parallel training shares a dense Q-table; use the basic encoder")
+    agent = QTableAgent(backend="dense", path=load_path, config=config)
+    shm = shared_memory.SharedMemory(create=True, size=DenseQTable.BUFFER_SIZE)
+    table = DenseQTable.from_buffer(shm.buf)
+    table.q[:] = agent.q_table.q
+    table.visited[:] = agent.q_table.visited
+    if config.symmetry:
+        table = SymmetricQTable(table)
+
+    start_games = agent.n_games
+    ring = None
+    if spectate:
+        from spectator import SnapshotRing
+        ring = SnapshotRing.create(spectate, min(envs_per_worker, 64), config.grid_w, config.grid_h)
+    counters = mp.Array('q', [start_games, 0, 0])
+    stop = mp.Event()
+    opts = {
+        "engine": engine, "num_envs": envs_per_worker, "seed": seed, "sync_every": sync_every,
+        "max_steps": max_steps, "max_games": max_games, "start_games": start_games,
+        "spectate": spectate, "config": config.to_dict(),
+    }
+    workers = [mp.Process(target=_worker, args=(i, shm.name, counters, stop, opts), daemon=True)
+               for i in range(num_workers)]
+    print(f"Starting {num_workers} workers x {envs_per_worker} envs...")
+    start = time.perf_counter()
+    last_steps, last_games = 0, start_games
+    last_report = start
+    try:
+        for w in workers:
+            w.start()
+        while any(w.is_alive() for w in workers):
+            # Có viewer thì kiểm tra cờ dừng mỗi giây, báo tiến độ vẫn mỗi 5 giây
+            if stop.wait(1 if ring is not None else 5):
+                for w in workers:
+                    w.join()
+            if ring is not None and ring.stop_requested():
+                stop.set()
+            if time.perf_counter() - last_report < 5 and not stop.is_set():
+                continue
+            last_report = time.perf_counter()
+            if checkpoints is not None:
+                checkpoints.maybe_save(table, counters[N_GAMES], agent.hyperparameters())
+            elapsed = time.perf_counter() - start
+            steps = counters[STEPS]
+            if profiler is not None and profiler.enabled:
+                n_games = counters[N_GAMES]
+                profiler.count("env_steps", (steps - last_steps) * envs_per_worker)
+                profiler.count("games", n_games - last_games)
+                profiler.gauge("q_table_size", len(table))
+                profiler.maybe_export()
+                last_steps, last_games = steps, n_games
+            print(f"[{elapsed:6.0f}s] games {counters[N_GAMES] - start_games}, "
+                  f"record {counters[RECORD]}, {steps * envs_per_worker / elapsed:,.0f} env-steps/s")
+    except KeyboardInterrupt:
+        stop.set()
+        for w in workers:
+            w.join()
+    finally:
+        agent.q_table.q[:] = table.q
+        agent.q_table.visited[:] = table.visited
+        agent.n_games = counters[N_GAMES]
+        if checkpoints is not None:
+            checkpoints.save(agent.q_table, agent.n_games, agent.hyperparameters())
+            checkpoints.close()
+        table = None
+        shm.close()
+        shm.unlink()
+        if ring is not None:
+            ring.close()
+    agent.save_table()
+    print(f"Training finished: {counters[STEPS]} steps, {counters[N_GAMES] - start_games} games, "
+          f"record {counters[RECORD]}.")
+    return agent
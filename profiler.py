@@ -0,0 +1,148 @@
+# profiler.py
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# Biên trên (µs) của các ô histogram: 1, 2, 4, ... ~1 giây
+HIST_BOUNDS_US = [1 << i for i in range(21)]
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class PhaseProfiler:
+    """
+    Đo thời gian từng pha của vòng training (events, play_step, get_state, train, render, tick...).
+
+    Mỗi pha giữ `window` mẫu gần nhất để tính phân vị và histogram; bộ đếm `count` cho ra
+    tốc độ (steps/s, games/s) trong khoảng `rate_window` giây gần nhất (mặc định bằng
+    `export_every`), `gauge` lưu giá trị tức thời (kích thước Q-Table).
+    `maybe_export` ghi một dòng JSON vào `export_path` mỗi `export_every` giây.
+    """
+    enabled = True
+
+    def __init__(self, window=2000, export_path=None, export_every=10.0, rate_window=None):
+        self.window = window
+        self.export_path = export_path
+        self.export_every = export_every
+        self.rate_window = rate_window or export_every
+        self.samples = {}
+        self.counters = {}
+        self.gauges = {}
+        self._start = self._last_export = time.perf_counter()
+        # Các mốc (thời điểm, bộ đếm) để tính tốc độ theo cửa sổ trượt, độc lập với việc xuất file
+        self._marks = deque([(self._start, {})])
+        self._mark_every = self.rate_window / 10
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        now = time.perf_counter()
+        if now - self._marks[-1][0] >= self._mark_every:
+            self._mark(now)
+
+    def _mark(self, now):
+        marks = self._marks
+        marks.append((now, dict(self.counters)))
+        # Giữ mốc cũ nhất còn cách hiện tại ít nhất rate_window (cửa sổ luôn đủ dài)
+        while len(marks) > 2 and now - marks[1][0] >= self.rate_window:
+            marks.popleft()
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """Thống kê hiện tại: phân vị (ms) và histogram từng pha, tốc độ trong `rate_window` giây gần nhất."""
+        now = time.perf_counter()
+        phases = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            n = len(ordered)
+            hist = [0] * len(HIST_BOUNDS_US)
+            for s in ordered:
+                us = s * 1e6
+                i = 0
+                while i < len(HIST_BOUNDS_US) - 1 and us > HIST_BOUNDS_US[i]:
+                    i += 1
+                hist[i] += 1
+            phases[name] = {
+                "n": n,
+                "mean_ms": sum(ordered) / n * 1e3,
+                "p50_ms": ordered[n // 2] * 1e3,
+                "p90_ms": ordered[min(n - 1, int(n * 0.9))] * 1e3,
+                "p99_ms": ordered[min(n - 1, int(n * 0.99))] * 1e3,
+                "max_ms": ordered[-1] * 1e3,
+                "hist_us": {str(b): c for b, c in zip(HIST_BOUNDS_US, hist) if c},
+            }
+        self._mark(now)
+        since, base = self._marks[0]
+        elapsed = max(now - since, 1e-9)
+        rates = {f"{name}_per_s": (value - base.get(name, 0)) / elapsed
+                 for name, value in self.counters.items()}
+        return {"t": now - self._start, "phases": phases, "rates": rates,
+                "counters": dict(self.counters), "gauges": dict(self.gauges)}
+
+    def maybe_export(self):
+        now = time.perf_counter()
+        if self.export_path is None or now - self._last_export < self.export_every:
+            return
+        record = self.snapshot()
+        with open(self.export_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self._last_export = now
+
+    def summary_lines(self):
+        """Hai dòng ngắn cho thanh dưới cửa sổ: tốc độ, và 3 pha tốn thời gian nhất (ms)."""
+        snap = self.snapshot()
+        rates = snap["rates"]
+        line1 = (f"{rates.get('env_steps_per_s', 0):,.0f} st/s "
+                 f"{rates.get('games_per_s', 0):,.1f} g/s Q:{snap['gauges'].get('q_table_size', 0)}")
+        slowest = sorted(snap["phases"].items(), key=lambda kv: -kv[1]["mean_ms"])[:3]
+        line2 = " ".join(f"{name} {p['mean_ms']:.2f}" for name, p in slowest)
+        return [line1, line2 + " ms"]
+
+
+class NullProfiler:
+    """Profiler tắt: mọi lời gọi là no-op để vòng training gần như không tốn thêm gì."""
+    enabled = False
+    _null = nullcontext()
+
+    def phase(self, name):
+        return self._null
+
+    def add(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def maybe_export(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,387 @@
+# qtable.py
+import numpy as np
+
+# State của QTableAgent.get_state là 11 bit -> tối đa 2048 state, 3 action
+STATE_BITS = 11
+NUM_STATES = 1 << STATE_BITS
+NUM_ACTIONS = 3
+_BIT_WEIGHTS = 1 << np.arange(STATE_BITS - 1, -1, -1)
+
+
+def pack_state(state):
+    """Tuple bit (bit đầu tiên là bit cao nhất) -> chỉ số nguyên."""
+    idx = 0
+    for bit in state:
+        idx = (idx << 1) | int(bit)
+    return idx
+
+
+def unpack_state(idx, n_bits=STATE_BITS):
+    """Chỉ số nguyên -> tuple bit giống kết quả của get_state."""
+    return tuple((int(idx) >> (n_bits - 1 - i)) & 1 for i in range(n_bits))
+
+
+def pack_states(bits):
+    """Mảng bit (N, 11) -> mảng chỉ số (N,)."""
+    return np.asarray(bits, dtype=np.int64) @ _BIT_WEIGHTS
+
+
+class DenseQTable:
+    """
+    Q-Table dạng mảng liền (NUM_STATES, NUM_ACTIONS), đánh chỉ số bằng state đã pack.
+
+    Hỗ trợ giao diện giống dict (key là tuple bit hoặc int) để thay thế trực tiếp
+    QTableAgent.q_table, cùng các thao tác theo lô cho nhiều transition một lúc.
+    `visited` đánh dấu các state đã từng xuất hiện để chuyển đổi qua lại với dict không mất mát.
+    """
+    # Số byte cần cho from_buffer: mảng Q float64 rồi tới mảng visited
+    BUFFER_SIZE = NUM_STATES * NUM_ACTIONS * 8 + NUM_STATES
+
+    def __init__(self, n_states=NUM_STATES, n_actions=NUM_ACTIONS):
+        self.q = np.zeros((n_states, n_actions), dtype=np.float64)
+        self.visited = np.zeros(n_states, dtype=bool)
+
+    @classmethod
+    def from_buffer(cls, buffer, offset=0):
+        """Bảng nằm trên vùng nhớ có sẵn (shared memory, mmap...) thay vì tự cấp phát."""
+        table = cls.__new__(cls)
+        table.q = np.ndarray((NUM_STATES, NUM_ACTIONS), dtype=np.float64, buffer=buffer, offset=offset)
+        table.visited = np.ndarray((NUM_STATES,), dtype=bool, buffer=buffer, offset=offset + table.q.nbytes)
+        return table
+
+    @staticmethod
+    def _index(state):
+        if isinstance(state, (int, np.integer)):
+            return int(state)
+        return pack_state(state)
+
+    # --- Giao diện dict ---
+    def __contains__(self, state):
+        return bool(self.visited[self._index(state)])
+
+    def __getitem__(self, state):
+        idx = self._index(state)
+        if not self.visited[idx]:
+            raise KeyError(state)
+        return self.q[idx]  # view: ghi vào phần tử sẽ ghi thẳng vào bảng
+
+    def __setitem__(self, state, values):
+        idx = self._index(state)
+        self.q[idx] = values
+        self.visited[idx] = True
+
+    def __len__(self):
+        return int(self.visited.sum())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [unpack_state(i) for i in np.flatnonzero(self.visited)]
+
+    def items(self):
+        return [(unpack_state(i), self.q[i].tolist()) for i in np.flatnonzero(self.visited)]
+
+    # --- Thao tác theo lô ---
+    def lookup(self, states):
+        """Q-values (N, NUM_ACTIONS) của mảng state; state mới được khởi tạo bằng 0 như get_q_values."""
+        self.visited[states] = True
+        return self.q[states]
+
+    def best_actions(self, states):
+        """argmax theo từng state (hoà thì lấy action nhỏ nhất, giống np.argmax)."""
+        return self.lookup(states).argmax(axis=1)
+
+    def peek(self, states):
+        """Như lookup nhưng chỉ đọc: không đánh dấu state mới là đã thăm."""
+        return self.q[states]
+
+    def update_batch(self, states, actions, rewards, next_states, dones, lr, gamma):
+        """
+        Áp dụng công thức của QTableAgent.train_step cho cả lô.
+
+        Mọi target được tính từ bảng trước khi cập nhật. Nếu một cặp (state, action) lặp lại
+        k lần trong lô (nhiều env cùng gặp một state), các transition được gộp như update_grouped:
+        giá trị được kéo về trung bình các target với hệ số 1 - (1 - lr)^k, bằng k lần train_step
+        tuần tự về cùng target đó, không phải k * lr như khi cộng dồn delta. Khác với chạy tuần tự
+        từng env ở chỗ các target không thấy cập nhật của nhau trong cùng tick.
+        Transition kết thúc ván ghi đè trực tiếp bằng reward.
+        """
+        # Gọi thẳng bản của DenseQTable: lớp con (LiveQTable) bọc riêng từng phương thức bằng seqlock
+        DenseQTable.update_grouped(self, states, actions, rewards, next_states, dones, lr, gamma)
+
+    def update_grouped(self, states, actions, rewards, next_states, dones, lr, gamma):
+        """
+        Cập nhật cho lô lớn (replay offline), nơi một cặp (state, action) có thể lặp lại hàng nghìn lần.
+
+        Cộng dồn delta sẽ vượt quá target khi số lần lặp k * lr lớn. Ở đây các
+        transition cùng cặp được gộp lại: transition kết thúc ván ghi reward trước, rồi giá trị
+        được kéo về trung bình các target sống với hệ số 1 - (1 - lr)^k, đúng bằng k lần cập nhật
+        tuần tự về cùng một target.
+        """
+        states = np.asarray(states, dtype=np.int64)
+        actions = np.asarray(actions, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        next_states = np.asarray(next_states, dtype=np.int64)
+        dones = np.asarray(dones, dtype=bool)
+        live = ~dones
+
+        self.visited[states] = True
+        self.visited[next_states[live]] = True
+        flat = self.q.reshape(-1)
+        keys = states * self.q.shape[1] + actions
+        targets = rewards[live] + gamma * self.q[next_states[live]].max(axis=1)
+        flat[keys[dones]] = rewards[dones]
+
+        counts = np.bincount(keys[live], minlength=flat.size)
+        sums = np.bincount(keys[live], weights=targets, minlength=flat.size)
+        hit = np.flatnonzero(counts)
+        rate = 1.0 - (1.0 - lr) ** counts[hit]
+        flat[hit] += rate * (sums[hit] / counts[hit] - flat[hit])
+
+    # --- Chuyển đổi với định dạng q_table.pkl ---
+    @classmethod
+    def from_dict(cls, table):
+        dense = cls()
+        for state, values in table.items():
+            dense[state] = values
+        return dense
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+EMPTY_KEY = -1
+_HASH_MULT = np.uint64(0x9E3779B97F4A7C15)   # băm nhân Fibonacci
+
+
+class HashQTable:
+    """
+    Q-Table dạng bảng băm địa chỉ mở (dò tuyến tính) trên mảng NumPy, cho các encoding nhiều bit
+    mà DenseQTable không cấp phát nổi. Key là state đã pack (int64), Q-value float32, nên mỗi ô
+    chỉ tốn 8 + 4 * n_actions + 4 byte thay vì vài trăm byte của dict tuple -> list.
+
+    Cùng giao diện dict và các thao tác theo lô như DenseQTable. `visits[slot]` đếm số transition
+    đã cập nhật state đó; state mới chỉ được tra (lookup) có visits = 0. Với `max_bytes`, khi bảng
+    đầy ở dung lượng tối đa, các state ít được thăm nhất (trước hết là các state chưa từng được
+    cập nhật) bị loại cho tới còn EVICT_TO dung lượng.
+    """
+    MAX_LOAD = 0.7
+    EVICT_TO = 0.5
+    MIN_CAPACITY = 16
+
+    def __init__(self, state_bits=STATE_BITS, n_actions=NUM_ACTIONS, capacity=1024, max_bytes=None):
+        self.state_bits = state_bits
+        self.n_actions = n_actions
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        limit = self.max_capacity()
+        cap = self.MIN_CAPACITY
+        while cap < capacity and (limit is None or cap * 2 <= limit):
+            cap *= 2
+        self._allocate(cap)
+
+    def slot_bytes(self):
+        return 8 + 4 * self.n_actions + 4
+
+    @property
+    def nbytes(self):
+        return self.capacity * self.slot_bytes()
+
+    def max_capacity(self):
+        """Dung lượng (luỹ thừa 2) lớn nhất vừa `max_bytes`; None nếu không giới hạn."""
+        if self.max_bytes is None:
+            return None
+        cap = self.MIN_CAPACITY
+        if cap * self.slot_bytes() > self.max_bytes:
+            raise ValueError(f"max_bytes={self.max_bytes} is too small for a hash Q-table")
+        while cap * 2 * self.slot_bytes() <= self.max_bytes:
+            cap *= 2
+        return cap
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.shift = np.uint64(64 - capacity.bit_length() + 1)
+        self.table_keys = np.full(capacity, EMPTY_KEY, dtype=np.int64)
+        self.values = np.zeros((capacity, self.n_actions), dtype=np.float32)
+        self.visits = np.zeros(capacity, dtype=np.uint32)
+        self.size = 0
+
+    def _probe(self, keys, insert):
+        """Ô của từng key (các key không trùng nhau); key chưa có -> -1, hoặc được chèn nếu `insert`."""
+        slots = ((keys.astype(np.uint64) * _HASH_MULT) >> self.shift).astype(np.int64)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        pending = np.arange(len(keys))
+        while len(pending):
+            s = slots[pending]
+            found = self.table_keys[s]
+            hit = found == keys[pending]
+            result[pending[hit]] = s[hit]
+            empty = found == EMPTY_KEY
+            moving = ~hit & ~empty
+            slots[pending[moving]] = (s[moving] + 1) & self.mask
+            if insert:
+                # Nhiều key mới cùng rơi vào một ô trống: key đầu tiên giành ô, các key còn lại dò tiếp
+                claim = pending[empty]
+                if len(claim):
+                    _, first = np.unique(slots[claim], return_index=True)
+                    won = claim[first]
+                    self.table_keys[slots[won]] = keys[won]
+                    result[won] = slots[won]
+                    self.size += len(won)
+                pending = pending[result[pending] < 0]
+            else:
+                pending = pending[moving]   # gặp ô trống: key không có trong bảng
+        return result
+
+    def _slots(self, states, insert):
+        """Như _probe nhưng nhận mảng state bất kỳ (có thể lặp lại)."""
+        states = np.asarray(states, dtype=np.int64)
+        unique, inverse = np.unique(states, return_inverse=True)
+        slots = self._probe(unique, insert=False)
+        missing = slots < 0
+        # Chỉ giữ chỗ cho các key thật sự mới, để việc nới bảng/loại bớt không xảy ra sớm
+        while insert and missing.any():
+            if not self._reserve(int(missing.sum())):
+                slots[missing] = self._probe(unique[missing], insert=True)
+                break
+            # Bảng vừa được dựng lại: ô cũ không còn đúng và có thể vừa loại key của lô này
+            slots = self._probe(unique, insert=False)
+            missing = slots < 0
+        return slots[inverse]
+
+    def _reserve(self, n):
+        """
+        Bảo đảm chèn thêm `n` key không vượt MAX_LOAD: nới bảng nếu còn trong giới hạn, không thì loại bớt.
+        Trả về True nếu bảng đã được dựng lại (mọi ô đổi chỗ).
+        """
+        if self.size + n <= self.MAX_LOAD * self.capacity:
+            return False
+        limit = self.max_capacity()
+        cap = self.capacity
+        while self.size + n > self.MAX_LOAD * cap and (limit is None or cap * 2 <= limit):
+            cap *= 2
+        if self.size + n <= self.MAX_LOAD * cap:
+            self._rebuild(cap, np.flatnonzero(self.table_keys != EMPTY_KEY))
+            return True
+        keep = int(self.EVICT_TO * cap) - n
+        if keep < 0:
+            raise ValueError(f"{n} new states do not fit in a hash Q-table of {self.max_bytes} bytes")
+        occupied = np.flatnonzero(self.table_keys != EMPTY_KEY)
+        order = occupied[np.argsort(self.visits[occupied], kind="stable")]
+        self.evicted += len(order) - keep
+        self._rebuild(cap, order[len(order) - keep:])
+        return True
+
+    def _rebuild(self, capacity, slots):
+        keys, values, visits = self.table_keys[slots], self.values[slots], self.visits[slots]
+        self._allocate(capacity)
+        new = self._probe(keys, insert=True)
+        self.values[new] = values
+        self.visits[new] = visits
+
+    @staticmethod
+    def _index(state):
+        if isinstance(state, (int, np.integer)):
+            return int(state)
+        return pack_state(state)
+
+    def _slot(self, state, insert=False):
+        return int(self._slots([self._index(state)], insert)[0])
+
+    # --- Giao diện dict ---
+    def __contains__(self, state):
+        return self._slot(state) >= 0
+
+    def __getitem__(self, state):
+        slot = self._slot(state)
+        if slot < 0:
+            raise KeyError(state)
+        return self.values[slot]  # view: ghi vào phần tử sẽ ghi thẳng vào bảng
+
+    def __setitem__(self, state, values):
+        slot = self._slot(state, insert=True)   # có thể cấp phát lại self.values
+        self.values[slot] = values
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def _occupied(self):
+        slots = np.flatnonzero(self.table_keys != EMPTY_KEY)
+        return slots[np.argsort(self.table_keys[slots])]
+
+    def keys(self):
+        return [unpack_state(k, self.state_bits) for k in self.table_keys[self._occupied()]]
+
+    def items(self):
+        slots = self._occupied()
+        return [(unpack_state(k, self.state_bits), v) for k, v in zip(self.table_keys[slots], self.values[slots].tolist())]
+
+    def visit_counts(self):
+        """(states, counts) của mọi state trong bảng, state được thăm nhiều nhất trước."""
+        slots = np.flatnonzero(self.table_keys != EMPTY_KEY)
+        slots = slots[np.argsort(-self.visits[slots].astype(np.int64), kind="stable")]
+        return self.table_keys[slots], self.visits[slots]
+
+    def stats(self):
+        return {"states": self.size, "capacity": self.capacity, "bytes": self.nbytes,
+                "max_bytes": self.max_bytes, "evicted": self.evicted,
+                "never_updated": int(((self.table_keys != EMPTY_KEY) & (self.visits == 0)).sum())}
+
+    # --- Thao tác theo lô ---
+    def lookup(self, states):
+        """Q-values (N, n_actions) của mảng state; state mới được chèn với giá trị 0 như get_q_values."""
+        slots = self._slots(states, insert=True)   # có thể cấp phát lại self.values
+        return self.values[slots]
+
+    def best_actions(self, states):
+        """argmax theo từng state (hoà thì lấy action nhỏ nhất, giống np.argmax)."""
+        return self.lookup(states).argmax(axis=1)
+
+    def peek(self, states):
+        """Như lookup nhưng chỉ đọc: state chưa có trả về 0 và không được chèn."""
+        slots = self._slots(states, insert=False)
+        values = np.zeros((len(slots), self.n_actions), dtype=np.float32)
+        known = slots >= 0
+        values[known] = self.values[slots[known]]
+        return values
+
+    def update_batch(self, states, actions, rewards, next_states, dones, lr, gamma):
+        """
+        Cùng công thức với DenseQTable.update_batch (gộp các cặp lặp lại trong lô). Next state chưa
+        có trong bảng được coi là Q = 0 mà không chèn vào, để các state chỉ được nhìn thấy không chiếm chỗ.
+        """
+        actions = np.asarray(actions)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        dones = np.asarray(dones, dtype=bool)
+        live = ~dones
+
+        slots = self._slots(states, insert=True)
+        next_slots = self._slots(np.asarray(next_states)[live], insert=False)
+        max_next = np.zeros(len(slots))
+        known = next_slots >= 0
+        max_next[np.flatnonzero(live)[known]] = self.values[next_slots[known]].max(axis=1)
+        targets = rewards[live] + gamma * max_next[live]
+        self.values[slots[dones], actions[dones]] = rewards[dones]
+        keys, inverse, counts = np.unique(slots[live] * self.n_actions + actions[live],
+                                          return_inverse=True, return_counts=True)
+        means = np.bincount(inverse, weights=targets, minlength=len(keys)) / counts
+        rows, cols = keys // self.n_actions, keys % self.n_actions
+        rate = 1.0 - (1.0 - lr) ** counts
+        self.values[rows, cols] += (rate * (means - self.values[rows, cols])).astype(np.float32)
+        np.add.at(self.visits, slots, 1)
+
+    # --- Chuyển đổi với định dạng q_table.pkl ---
+    @classmethod
+    def from_dict(cls, table, **kwargs):
+        hashed = cls(capacity=int(len(table) / cls.MAX_LOAD) + 1, **kwargs)
+        for state, values in table.items():
+            hashed[state] = values
+        return hashed
+
+    def to_dict(self):
+        return dict(self.items())
@@ -0,0 +1,188 @@
+# regions.py
+from collections import deque
+
+
+class RegionTracker:
+    """
+    Gán nhãn các vùng trống liên thông (4 hướng) trên lưới ô của một bàn cờ.
+
+    Nhãn được tính một lần khi reset rồi cập nhật tăng dần: mỗi bước chỉ có ô đầu rắn
+    bị chiếm (`occupy`) và ô đuôi được giải phóng (`release`). Kích thước vùng chứa một ô
+    là phép tra cứu O(1), thay cho việc chạy BFS mỗi lần gọi is_trap.
+    """
+    def __init__(self, grid_w, grid_h):
+        self.grid_w = grid_w
+        self.grid_h = grid_h
+        self.n_cells = grid_w * grid_h
+        self.neighbors = []
+        # 8 ô quanh mỗi ô theo vòng N, NE, E, SE, S, SW, W, NW (-1 nếu ra ngoài bàn)
+        self.ring = []
+        ring_offsets = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+        for cell in range(self.n_cells):
+            x, y = cell % grid_w, cell // grid_w
+            self.neighbors.append([y * grid_w + nx for nx in (x - 1, x + 1) if 0 <= nx < grid_w] +
+                                  [ny * grid_w + x for ny in (y - 1, y + 1) if 0 <= ny < grid_h])
+            self.ring.append(tuple((y + dy) * grid_w + x + dx
+                                   if 0 <= x + dx < grid_w and 0 <= y + dy < grid_h else -1
+                                   for dx, dy in ring_offsets))
+        self.label = [-1] * self.n_cells      # -1 = ô bị chiếm
+        self.members = {}                     # nhãn -> tập ô của vùng
+        self._next_label = 0
+        self._rebuild_cache = {}              # bàn lúc reset lặp lại liên tục -> nhớ kết quả
+
+    def rebuild(self, occupied_cells):
+        """Gán nhãn lại toàn bộ bàn từ tập ô bị chiếm."""
+        key = tuple(sorted(occupied_cells))
+        cached = self._rebuild_cache.get(key)
+        if cached is None:
+            self.label = [0] * self.n_cells
+            for cell in key:
+                self.label[cell] = -1
+            self.members = {}
+            free = {cell for cell in range(self.n_cells) if self.label[cell] >= 0}
+            self._label_components(free)
+            if len(self._rebuild_cache) < 8:
+                self._rebuild_cache[key] = (self.label[:], {lab: set(r) for lab, r in self.members.items()})
+        else:
+            label, members = cached
+            self.label = label[:]
+            self.members = {lab: set(r) for lab, r in members.items()}
+        return self
+
+    def copy(self):
+        """Bản sao độc lập; các bảng láng giềng chỉ đọc được dùng chung."""
+        twin = RegionTracker.__new__(RegionTracker)
+        twin.__dict__.update(self.__dict__)
+        twin.label = self.label[:]
+        twin.members = {lab: set(r) for lab, r in self.members.items()}
+        return twin
+
+    def size(self, cell):
+        """Số ô trống liên thông với `cell` (0 nếu ô bị chiếm)."""
+        lab = self.label[cell]
+        return len(self.members[lab]) if lab >= 0 else 0
+
+    def is_free(self, cell):
+        return self.label[cell] >= 0
+
+    def occupy(self, cell):
+        lab = self.label[cell]
+        if lab < 0:
+            return
+        self.label[cell] = -1
+        region = self.members[lab]
+        region.discard(cell)
+        if not region:
+            del self.members[lab]
+        elif self._may_split(cell):
+            # Ô vừa chiếm có thể cắt đôi vùng: tìm phần bị tách ra (nếu có)
+            self._split(lab, [n for n in self.neighbors[cell] if self.label[n] == lab])
+
+    def release(self, cell):
+        if self.label[cell] >= 0:
+            return
+        labels = {self.label[n] for n in self.neighbors[cell] if self.label[n] >= 0}
+        if not labels:
+            lab = self._new_label()
+            self.members[lab] = set()
+        else:
+            # Gộp các vùng kề nhau vào vùng lớn nhất, chỉ đổi nhãn các vùng nhỏ hơn
+            lab = max(labels, key=lambda l: len(self.members[l]))
+            for other in labels - {lab}:
+                region = self.members.pop(other)
+                for c in region:
+                    self.label[c] = lab
+                self.members[lab] |= region
+        self.label[cell] = lab
+        self.members[lab].add(cell)
+
+    def _new_label(self):
+        self._next_label += 1
+        return self._next_label
+
+    def _may_split(self, cell):
+        # Xét 8 ô quanh `cell`: các ô kề cạnh còn trống có nối với nhau qua ô góc không?
+        # Nếu chỉ còn một nhóm thì chắc chắn vùng không bị cắt, khỏi phải loang lại.
+        label = self.label
+        n, ne, e, se, s, sw, w, nw = [c >= 0 and label[c] >= 0 for c in self.ring[cell]]
+        n_free = n + e + s + w
+        if n_free <= 1:
+            return False
+        joins = (n and ne and e) + (e and se and s) + (s and sw and w) + (w and nw and n)
+        return n_free - joins > 1
+
+    def _split(self, lab, starts):
+        """
+        Loang song song từ từng ô trong `starts`, mỗi lượt một ô. Hai lần loang chạm nhau
+        thì gộp nhóm; nhóm nào hết ô để loang là một vùng kín đã tách ra và nhận nhãn mới.
+        Dừng khi chỉ còn một nhóm, nên chi phí tỉ lệ với phần nhỏ bị tách chứ không phải cả vùng.
+        """
+        k = len(starts)
+        parent = list(range(k))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        owner = {s: i for i, s in enumerate(starts)}
+        cells = [[s] for s in starts]
+        queues = [deque([s]) for s in starts]
+        closed = set()
+        live = k
+        while live > 1:
+            for i in range(k):
+                queue = queues[i]
+                if not queue:
+                    continue
+                curr = queue.popleft()
+                for n in self.neighbors[curr]:
+                    if self.label[n] != lab:
+                        continue
+                    o = owner.get(n)
+                    if o is None:
+                        owner[n] = i
+                        cells[i].append(n)
+                        queue.append(n)
+                    else:
+                        ri, ro = find(i), find(o)
+                        if ri != ro:
+                            parent[ro] = ri
+                            live -= 1
+            if live <= 1:
+                break
+            for root in {find(i) for i in range(k)} - closed:
+                group = [i for i in range(k) if find(i) == root]
+                if any(queues[i] for i in group):
+                    continue
+                new_lab = self._new_label()
+                moved = set()
+                for i in group:
+                    for c in cells[i]:
+                        self.label[c] = new_lab
+                    moved.update(cells[i])
+                self.members[new_lab] = moved
+                self.members[lab] -= moved
+                closed.add(root)
+                live -= 1
+                if live <= 1:
+                    break
+
+    def _label_components(self, cells):
+        remaining = set(cells)
+        while remaining:
+            start = remaining.pop()
+            lab = self._new_label()
+            region = {start}
+            queue = deque([start])
+            while queue:
+                curr = queue.popleft()
+                for n in self.neighbors[curr]:
+                    if n in remaining:
+                        remaining.discard(n)
+                        region.add(n)
+                        queue.append(n)
+            for c in region:
+                self.label[c] = lab
+            self.members[lab] = region
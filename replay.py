@@ -0,0 +1,406 @@
+# replay.py
+"""
+Ghi lại ván chơi ở dạng nhị phân gọn và phát lại có tua.
+
+Một file .snkr là một ván: header cố định (kích thước bàn, seed, số khung, điểm, nguyên nhân chết),
+chuỗi action 2 bit mỗi bước, danh sách vị trí mồi (ô) theo thứ tự xuất hiện, và keyframe mỗi
+`keyframe_every` bước (thân rắn, hướng, điểm). Phát lại không cần agent hay RNG: ReplayGame chơi
+lại các action và đặt mồi theo danh sách đã ghi; tua tới khung bất kỳ bắt đầu từ keyframe gần nhất.
+Thống kê hàng nghìn ván chỉ đọc header (scan_recordings).
+"""
+import glob
+import os
+import struct
+import time
+import numpy as np
+from core import SingleGame, WALL
+from settings import Direction, BLOCK_SIZE, SPEED_DEMO, Theme
+
+MAGIC = b"SNKREPLY"
+FORMAT_VERSION = 1
+KEYFRAME_EVERY = 256
+DEATH_CAUSES = (None, "wall", "self", "starvation")
+TRAP_MODES = ("capped", "exact")
+# magic, version, grid_w, grid_h, trap_mode, death, seed, frames, score, foods, keyframes,
+# keyframe_every, env, recorded_at
+_HEADER = struct.Struct("<8sHHHBBqIIIIIId")
+KEYFRAME_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("food_index", "<u4"),   # số mồi đã đặt tính tới khung này; mồi hiện tại là foods[food_index - 1]
+    ("score", "<u4"),
+    ("direction", "u1"),
+    ("length", "<u2"),
+])
+
+
+class Recording:
+    """Một ván đã ghi. `actions` là bytearray các action 0/1/2, `keyframes` là list (frame, food_index, score, direction, cells)."""
+    def __init__(self, grid_w, grid_h, trap_mode="capped", seed=-1, env=0, keyframe_every=KEYFRAME_EVERY):
+        if grid_w * grid_h > 1 << 16:
+            raise ValueError("recordings store cells as 16-bit indices; board is too large")
+        self.grid_w = grid_w
+        self.grid_h = grid_h
+        self.trap_mode = trap_mode
+        self.seed = seed
+        self.env = env
+        self.keyframe_every = keyframe_every
+        self.actions = bytearray()
+        self.foods = []
+        self.keyframes = []
+        self.score = 0
+        self.death_cause = None
+        self.recorded_at = time.time()
+
+    @property
+    def frames(self):
+        return len(self.actions)
+
+    def add_keyframe(self, game):
+        self.keyframes.append((self.frames, len(self.foods), game.score, game.direction.value,
+                               np.array(game.snake, dtype=np.uint16)))
+
+    def keyframe_before(self, frame):
+        """Keyframe muộn nhất có frame <= `frame`."""
+        best = self.keyframes[0]
+        for kf in self.keyframes:
+            if kf[0] > frame:
+                break
+            best = kf
+        return best
+
+    def action_array(self):
+        return np.frombuffer(bytes(self.actions), dtype=np.uint8)
+
+    # --- Định dạng file ---
+    def to_bytes(self):
+        actions = self.action_array()
+        padded = np.zeros(-(-len(actions) // 4) * 4, dtype=np.uint8)
+        padded[:len(actions)] = actions
+        quads = padded.reshape(-1, 4)
+        packed = quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6
+        table = np.zeros(len(self.keyframes), dtype=KEYFRAME_DTYPE)
+        for row, (frame, food_index, score, direction, cells) in zip(table, self.keyframes):
+            row["frame"], row["food_index"], row["score"] = frame, food_index, score
+            row["direction"], row["length"] = direction, len(cells)
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, self.grid_w, self.grid_h,
+                              TRAP_MODES.index(self.trap_mode), DEATH_CAUSES.index(self.death_cause),
+                              self.seed, self.frames, self.score, len(self.foods), len(self.keyframes),
+                              self.keyframe_every, self.env, self.recorded_at)
+        bodies = [cells.astype("<u2").tobytes() for *_, cells in self.keyframes]
+        return b"".join([header, packed.tobytes(), np.array(self.foods, dtype="<u2").tobytes(),
+                         table.tobytes()] + bodies)
+
+    @classmethod
+    def from_bytes(cls, data):
+        info = _parse_header(data)
+        rec = cls(info["grid_w"], info["grid_h"], info["trap_mode"], info["seed"], info["env"],
+                  info["keyframe_every"])
+        rec.score, rec.death_cause, rec.recorded_at = info["score"], info["death_cause"], info["recorded_at"]
+        offset = _HEADER.size
+        n_packed = -(-info["frames"] // 4)
+        packed = np.frombuffer(data, dtype=np.uint8, count=n_packed, offset=offset)
+        offset += n_packed
+        actions = np.stack([packed & 3, packed >> 2 & 3, packed >> 4 & 3, packed >> 6], axis=1).ravel()
+        rec.actions = bytearray(actions[:info["frames"]].tobytes())
+        rec.foods = np.frombuffer(data, dtype="<u2", count=info["foods"], offset=offset).tolist()
+        offset += 2 * info["foods"]
+        table = np.frombuffer(data, dtype=KEYFRAME_DTYPE, count=info["keyframes"], offset=offset)
+        offset += table.nbytes
+        for row in table:
+            cells = np.frombuffer(data, dtype="<u2", count=int(row["length"]), offset=offset)
+            offset += cells.nbytes
+            rec.keyframes.append((int(row["frame"]), int(row["food_index"]), int(row["score"]),
+                                  int(row["direction"]), cells))
+        return rec
+
+    def save(self, path):
+        # Không fsync: mất vài ván cuối khi máy sập không sao, còn training thì không bị chậm
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+
+def _parse_header(data):
+    if len(data) < _HEADER.size:
+        raise ValueError("not a snake recording")
+    (magic, version, grid_w, grid_h, trap_mode, death, seed, frames, score, foods, keyframes,
+     keyframe_every, env, recorded_at) = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a snake recording")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"recording version {version}, newest supported is {FORMAT_VERSION}")
+    return {"grid_w": grid_w, "grid_h": grid_h, "trap_mode": TRAP_MODES[trap_mode],
+            "death_cause": DEATH_CAUSES[death], "seed": seed, "frames": frames, "score": score,
+            "foods": foods, "keyframes": keyframes, "keyframe_every": keyframe_every, "env": env,
+            "recorded_at": recorded_at}
+
+
+def load_recording(path):
+    with open(path, "rb") as f:
+        return Recording.from_bytes(f.read())
+
+
+def read_header(path):
+    """Chỉ đọc header (tóm tắt ván) mà không giải mã action hay keyframe."""
+    with open(path, "rb") as f:
+        info = _parse_header(f.read(_HEADER.size))
+    info["path"] = path
+    return info
+
+
+# --- Ghi khi đang chơi ---
+class GameRecorder:
+    """
+    Gắn vào SingleGame (game.recorder): mỗi ván thành một Recording, ván kết thúc thì giao cho `sink`.
+    SingleGame gọi start khi reset, step sau mỗi bước còn sống và finish ở bước chết.
+    """
+    def __init__(self, sink, env=0, seed=None, keyframe_every=KEYFRAME_EVERY):
+        self.sink = sink
+        self.env = env
+        self.seed = -1 if seed is None else seed
+        self.keyframe_every = keyframe_every
+        self.recording = None
+
+    def attach(self, game):
+        """Gắn vào `game`; nếu ván đang dở thì bắt đầu ghi từ ván sau."""
+        game.recorder = self
+        if game.frame_iteration == 0:
+            self.start(game)
+        return self
+
+    def start(self, game):
+        rec = Recording(game.grid_w, game.grid_h, game.trap_mode, self.seed, self.env, self.keyframe_every)
+        rec.foods.append(game.food)
+        rec.add_keyframe(game)
+        self.recording = rec
+
+    def step(self, game, move):
+        rec = self.recording
+        if rec is None:
+            return
+        rec.actions.append(move)
+        if game.score != rec.score:
+            rec.score = game.score
+            rec.foods.append(game.food)
+        if rec.frames % rec.keyframe_every == 0:
+            rec.add_keyframe(game)
+
+    def finish(self, game, move):
+        rec = self.recording
+        if rec is None:
+            return
+        rec.actions.append(move)
+        rec.death_cause = game.death_cause
+        self.recording = None
+        self.sink(rec)
+
+
+class RecordingWriter:
+    """Lưu mỗi ván có điểm >= `min_score` thành một file game_<số thứ tự>.snkr trong `directory`."""
+    def __init__(self, directory, min_score=0):
+        self.directory = directory
+        self.min_score = min_score
+        os.makedirs(directory, exist_ok=True)
+        existing = [os.path.basename(p)[5:13] for p in glob.glob(os.path.join(directory, "game_*.snkr"))]
+        self.next_index = max((int(n) for n in existing if n.isdigit()), default=-1) + 1
+        self.saved = 0
+
+    def __call__(self, recording):
+        if recording.score < self.min_score:
+            return
+        recording.save(os.path.join(self.directory, f"game_{self.next_index:08d}.snkr"))
+        self.next_index += 1
+        self.saved += 1
+
+
+def record_env(env, directory, min_score=0, seed=None, keyframe_every=KEYFRAME_EVERY):
+    """Ghi các ván của mọi bàn trong `env` (HeadlessSnakeGame/VectorizedSnakeGame hoặc DemoGame)."""
+    if hasattr(env, "games"):
+        games = env.games
+    elif hasattr(env, "game"):
+        games = [env.game]
+    else:
+        raise ValueError("game recordings need SingleGame boards; use the games engine")
+    writer = RecordingWriter(directory, min_score)
+    for i, game in enumerate(games):
+        GameRecorder(writer, env=i, seed=seed, keyframe_every=keyframe_every).attach(game)
+    return writer
+
+
+# --- Phát lại ---
+class ReplayGame(SingleGame):
+    """SingleGame chơi lại một Recording: action lấy từ file, mồi đặt theo danh sách đã ghi."""
+    def __init__(self, recording):
+        self.recording = recording
+        self.actions = recording.action_array()
+        self._food_index = 0
+        super().__init__(recording.grid_w * BLOCK_SIZE, recording.grid_h * BLOCK_SIZE, recording.trap_mode)
+
+    @property
+    def frame(self):
+        return self.frame_iteration
+
+    def reset(self):
+        self._food_index = 0
+        return super().reset()
+
+    def _place_food(self):
+        self.version += 1
+        foods = self.recording.foods
+        if self._food_index < len(foods):
+            self.food = foods[self._food_index]
+            self._food_index += 1
+
+    def seek(self, frame):
+        """Đưa bàn cờ về trạng thái sau `frame` bước (0..recording.frames)."""
+        frame = max(0, min(int(frame), self.recording.frames))
+        if frame < self.frame_iteration or frame - self.frame_iteration > self.recording.keyframe_every:
+            kf = self.recording.keyframe_before(frame)
+            if kf[0] > self.frame_iteration or frame < self.frame_iteration:
+                self._restore(kf)
+        while self.frame_iteration < frame:
+            self.play_step(int(self.actions[self.frame_iteration]))
+        return self
+
+    def _restore(self, keyframe):
+        frame, food_index, score, direction, cells = keyframe
+        self.set_body([int(c) for c in cells], Direction(direction))
+        self._food_index = food_index
+        self.food = self.recording.foods[food_index - 1]
+        self.score = score
+        self.frame_iteration = frame
+        self.death_cause = None
+
+
+class ReplayPlayer:
+    """
+    Cửa sổ phát lại một Recording, vẽ bằng UIRenderer. Phím: SPACE dừng/chạy, trái/phải lùi/tiến
+    một khung, lên/xuống nhân đôi/giảm nửa tốc độ, HOME/END về đầu/cuối; bấm vào thanh tiến độ để tua.
+    `export` vẽ các khung ra file PNG mà không cần mở cửa sổ.
+    """
+    BAR_H = 30
+
+    def __init__(self, recording, speed=SPEED_DEMO):
+        self.recording = recording
+        self.game = ReplayGame(recording)
+        self.speed = float(speed)   # khung / giây
+        self.w, self.h = self.game.w, self.game.h
+
+    def render(self, surface):
+        import pygame
+        import settings
+        from ui import UIRenderer, cell_xy
+        game = self.game
+        surface.fill(Theme.BG_DARK)
+        UIRenderer.draw_grid(surface, self.w, self.h, BLOCK_SIZE)
+        for i, cell in enumerate(game.snake):
+            if cell != WALL:   # khung cuối của ván đâm tường có đầu nằm ngoài bàn
+                x, y = cell_xy(cell, game.grid_w)
+                UIRenderer.draw_snake_cell(surface, x, y, i == 0)
+        if game.food is not None:
+            UIRenderer.draw_food(surface, *cell_xy(game.food, game.grid_w))
+
+        frames = max(1, self.recording.frames)
+        bar = pygame.Rect(0, self.h, self.w, self.BAR_H)
+        pygame.draw.rect(surface, Theme.BTN_DEFAULT, (bar.x, bar.y, bar.w, 4))
+        pygame.draw.rect(surface, Theme.ACCENT, (bar.x, bar.y, bar.w * game.frame // frames, 4))
+        end = f" {self.recording.death_cause}" if game.frame == self.recording.frames else ""
+        text = f"{game.frame}/{self.recording.frames}  score {game.score}  x{self.speed:g}{end}"
+        surface.blit(settings.font_main.render(text, True, Theme.TEXT_SUB), (5, self.h + 7))
+
+    def run(self, frame=0, scale=2):
+        from settings import init_pygame
+        pygame = init_pygame()
+        display = pygame.display.set_mode((self.w * scale, (self.h + self.BAR_H) * scale), pygame.RESIZABLE)
+        pygame.display.set_caption("Snake Replay")
+        canvas = pygame.Surface((self.w, self.h + self.BAR_H))
+        clock = pygame.time.Clock()
+        self.game.seek(frame)
+        position = float(self.game.frame)
+        paused = False
+        while True:
+            dt = clock.tick(60) / 1000
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        paused = not paused
+                    elif event.key in (pygame.K_RIGHT, pygame.K_LEFT):
+                        paused = True
+                        position = self.game.frame + (1 if event.key == pygame.K_RIGHT else -1)
+                    elif event.key == pygame.K_UP:
+                        self.speed *= 2
+                    elif event.key == pygame.K_DOWN:
+                        self.speed = max(0.25, self.speed / 2)
+                    elif event.key == pygame.K_HOME:
+                        position = 0
+                    elif event.key == pygame.K_END:
+                        position = self.recording.frames
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    win_w, win_h = display.get_size()
+                    x, y = event.pos[0] * self.w / win_w, event.pos[1] * (self.h + self.BAR_H) / win_h
+                    if y >= self.h:
+                        position = x / self.w * self.recording.frames
+            if not paused:
+                position = min(position + self.speed * dt, self.recording.frames)
+            position = max(0.0, min(position, self.recording.frames))
+            self.game.seek(position)
+            self.render(canvas)
+            display.blit(pygame.transform.scale(canvas, display.get_size()), (0, 0))
+            pygame.display.flip()
+
+    def export(self, out_dir, start=0, end=None, every=1):
+        """Lưu khung start, start + every, ... tới `end` (mặc định khung cuối) thành PNG; trả về số file."""
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        from settings import init_pygame
+        pygame = init_pygame()
+        os.makedirs(out_dir, exist_ok=True)
+        end = self.recording.frames if end is None else min(end, self.recording.frames)
+        canvas = pygame.Surface((self.w, self.h + self.BAR_H))
+        count = 0
+        for frame in range(start, end + 1, every):
+            self.game.seek(frame)
+            self.render(canvas)
+            pygame.image.save(canvas, os.path.join(out_dir, f"frame_{frame:06d}.png"))
+            count += 1
+        return count
+
+
+# --- Thống kê hàng loạt ---
+def scan_recordings(directory):
+    """Header của mọi file .snkr trong `directory` (bỏ qua file hỏng)."""
+    infos = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.snkr"))):
+        try:
+            infos.append(read_header(path))
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+    return infos
+
+
+def scan_stats(infos, top=5):
+    scores = np.array([i["score"] for i in infos])
+    frames = np.array([i["frames"] for i in infos])
+    causes = [i["death_cause"] for i in infos]
+    best = sorted(infos, key=lambda i: (-i["score"], i["frames"]))[:top]
+    return {
+        "games": len(infos),
+        "score": {"mean": float(scores.mean()), "p50": float(np.median(scores)),
+                  "p90": float(np.percentile(scores, 90)), "max": int(scores.max())},
+        "frames": {"mean": float(frames.mean()), "total": int(frames.sum()), "max": int(frames.max())},
+        "deaths": {c: causes.count(c) / len(infos) for c in DEATH_CAUSES[1:]},
+        "best": [(i["path"], i["score"], i["frames"]) for i in best],
+    }
+
+
+def format_scan(stats):
+    s, f, d = stats["score"], stats["frames"], stats["deaths"]
+    lines = [f"{stats['games']} recordings, {f['total']:,} frames",
+             f"  score   mean {s['mean']:.2f}  p50 {s['p50']:.0f}  p90 {s['p90']:.0f}  max {s['max']}",
+             f"  frames  mean {f['mean']:.0f}  max {f['max']}",
+             f"  deaths  wall {d['wall']:.1%}  self {d['self']:.1%}  starvation {d['starvation']:.1%}",
+             "  best:"]
+    lines += [f"    {path}  score {score}  frames {frames}" for path, score, frames in stats["best"]]
+    return "\n".join(lines)
@@ -0,0 +1,432 @@
+# serve.py
+"""
+Dịch vụ suy luận policy cho các process khác trên cùng máy (simulator, bot, giải đấu).
+
+Giao thức: mỗi dòng một JSON, trả lời một dòng JSON (có kèm "id" nếu request có):
+
+    {"id": 1, "state": 1234}                       -> {"id": 1, "action": 0, "q": [...], "policy": 1}
+    {"state": [0, 1, 0, ...]}                      (tuple bit như get_state)
+    {"states": [12, 34, 56]}                       -> {"actions": [...], "policy": 1}
+    {"board": {"snake": [[10, 10], [9, 10], [8, 10]], "food": [3, 4], "direction": "RIGHT"}}
+    {"cmd": "stats"} / {"cmd": "reload", "path": "..."}
+
+Toạ độ board tính theo ô, đầu rắn trước, các ô liền nhau và không trùng; "grid": [w, h]
+(mỗi cạnh MIN_GRID..MAX_GRID ô) và "trap_mode" là tuỳ chọn.
+"path" của reload chỉ được trỏ vào thư mục chứa bảng đang phục vụ (tính tương đối từ thư mục đó).
+Action: 0 thẳng, 1 phải, 2 trái.
+"""
+import asyncio
+import json
+import os
+import pickle
+import socket
+import time
+import numpy as np
+from agent import QTableAgent, table_backend
+from checkpoint import latest_checkpoint
+from config import RunConfig
+from core import SingleGame
+from encoders import BasicEncoder, ENCODERS
+from profiler import PhaseProfiler
+from qtable import pack_state
+from settings import Direction, BLOCK_SIZE, GRID_W, GRID_H
+
+DEFAULT_PORT = 8765
+MIN_GRID, MAX_GRID = 4, 64   # cạnh của "grid" trong request board (SingleGame.reset cần ít nhất 4)
+MAX_BOARDS = 8    # số bàn mã hoá (theo grid, trap_mode) được giữ lại để dùng lại
+
+
+class Policy:
+    """
+    Q-Table chỉ đọc cùng encoder của nó. `path` là q_table.pkl, checkpoint .npz, thư mục
+    checkpoint (lấy file mới nhất) hoặc file .live của trainer đang chạy (luôn đọc giá trị mới nhất,
+    không cần reload). Encoder được chọn theo state encoding ghi trong file.
+    """
+    def __init__(self, path, version=1):
+        self.source = path
+        self.path = latest_checkpoint(path) if os.path.isdir(path) else path
+        if self.path is None or not os.path.exists(self.path):
+            raise FileNotFoundError(f"no Q-table at {path}")
+        self.mtime = os.path.getmtime(self.path)
+        encoding = BasicEncoder.name
+        self.live = self.path.endswith(".live")
+        if not self.path.endswith((".npz", ".live")):
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+            if isinstance(data, dict) and "state_encoding" in data:
+                encoding = data["state_encoding"]["name"]
+        key = next((k for k, cls in ENCODERS.items() if cls.name == encoding), None)
+        if key is None:
+            raise ValueError(f"{self.path}: unknown state encoding {encoding}")
+        config = RunConfig(encoder=key)
+        agent = QTableAgent(backend="live" if self.live else table_backend(config), path=self.path, config=config)
+        if not self.live and not len(agent.q_table):
+            raise ValueError(f"{self.path}: no Q-table could be loaded")
+        self.table = agent.q_table
+        self.encoder = agent.encoder
+        self.n_games = agent.n_games
+        self.version = version
+        self.loaded_at = time.time()
+
+    def changed(self):
+        """File nguồn (hoặc checkpoint mới nhất trong thư mục) đã khác bản đang dùng chưa."""
+        if self.live:
+            return False
+        path = latest_checkpoint(self.source) if os.path.isdir(self.source) else self.source
+        return path is not None and os.path.exists(path) and (
+            path != self.path or os.path.getmtime(path) != self.mtime)
+
+    def info(self):
+        return {"path": self.path, "version": self.version, "encoding": self.encoder.name,
+                "states": len(self.table), "n_games": self.n_games, "loaded_at": self.loaded_at}
+
+
+class PolicyServer:
+    """
+    Server asyncio: mọi request "act" đang chờ được gom thành một lô (tối đa `max_batch`, chờ
+    thêm tối đa `max_wait` giây) và tra Q-Table một lần. `reload` nạp policy mới trên thread
+    riêng rồi thay con trỏ; request đã mã hoá theo policy cũ vẫn được trả lời bằng policy cũ,
+    kết nối không bị ngắt. `watch_every` > 0 tự nạp lại khi file/thư mục checkpoint đổi.
+    """
+    def __init__(self, path, max_batch=256, max_wait=0.0005, watch_every=None, log_every=None):
+        self.policy = Policy(path)
+        # Nạp Q-Table là pickle.load: client chỉ được chọn file trong thư mục này
+        source = os.path.realpath(path)
+        self.root = source if os.path.isdir(source) else os.path.dirname(source)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.watch_every = watch_every
+        self.log_every = log_every
+        self.stats = PhaseProfiler(window=20000)
+        self.queue = None
+        self.boards = {}   # (grid_w, grid_h, trap_mode) -> SingleGame dùng để mã hoá board, tối đa MAX_BOARDS
+        self._tasks = []
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None):
+        self.queue = asyncio.Queue()
+        self._tasks.append(asyncio.create_task(self._batch_loop()))
+        if self.watch_every:
+            self._tasks.append(asyncio.create_task(self._watch_loop()))
+        if self.log_every:
+            self._tasks.append(asyncio.create_task(self._log_loop()))
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            return await asyncio.start_unix_server(self._handle, path=socket_path)
+        return await asyncio.start_server(self._handle, host, port)
+
+    # --- Gom lô ---
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                self._answer_batch(items)
+            except Exception as e:
+                # Lỗi của một lô không được giết vòng gom lô: mọi query sau đó sẽ chờ mãi.
+                # Mỗi request trong lô nhận lỗi qua future và được _reply đếm vào "errors".
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _answer_batch(self, items):
+        start = time.perf_counter()
+        # Thường chỉ có một policy; ngay sau khi đổi policy thì lô có thể chứa cả bản cũ
+        groups = {}
+        for item in items:
+            groups.setdefault(id(item[2]), []).append(item)
+        for group in groups.values():
+            policy = group[0][2]
+            states = np.fromiter((state for state, _, _ in group), dtype=np.int64, count=len(group))
+            q = policy.table.peek(states)
+            actions = q.argmax(axis=1)
+            for (_, future, _), action, row in zip(group, actions.tolist(), q.tolist()):
+                if not future.done():
+                    future.set_result((action, row, policy.version))
+        self.stats.add("lookup", time.perf_counter() - start)
+        self.stats.count("batches")
+        self.stats.count("queries", len(items))
+
+    async def _lookup(self, states, policy):
+        loop = asyncio.get_running_loop()
+        futures = []
+        for state in states:
+            future = loop.create_future()
+            self.queue.put_nowait((state, future, policy))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    # --- Kết nối ---
+    async def _handle(self, reader, writer):
+        self.stats.count("connections")
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Mỗi dòng một task: request pipeline trên cùng kết nối cũng được gom lô
+                task = asyncio.create_task(self._reply(line, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except ConnectionError:
+            pass
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    async def _reply(self, line, writer):
+        start = time.perf_counter()
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            reply = await self._dispatch(request)
+        except Exception as e:
+            # Request hỏng kiểu gì cũng phải có dòng trả lời, không thì client chờ tới timeout
+            self.stats.count("errors")
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and "id" in request:
+            reply["id"] = request["id"]
+        writer.write((json.dumps(reply) + "\n").encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            return
+        self.stats.add("request", time.perf_counter() - start)
+        self.stats.count("requests")
+
+    async def _dispatch(self, request):
+        cmd = request.get("cmd", "act")
+        if cmd == "act":
+            policy = self.policy
+            if "states" in request:
+                states = [self._parse_state(s, policy) for s in request["states"]]
+                answers = await self._lookup(states, policy)
+                return {"actions": [a for a, _, _ in answers], "policy": policy.version}
+            if "state" in request:
+                state = self._parse_state(request["state"], policy)
+            elif "board" in request:
+                state = self._encode_board(request["board"], policy)
+            else:
+                raise ValueError("act needs 'state', 'states' or 'board'")
+            (action, q, version), = await self._lookup([state], policy)
+            return {"action": action, "q": q, "policy": version}
+        if cmd == "stats":
+            return self.report()
+        if cmd == "reload":
+            path = request.get("path")
+            await self.reload(self._reload_path(path) if path else None)
+            return {"ok": True, "policy": self.policy.info()}
+        raise ValueError(f"unknown cmd: {cmd}")
+
+    @staticmethod
+    def _parse_state(state, policy):
+        bits = policy.encoder.bits
+        if isinstance(state, list):
+            if len(state) != bits or any(b not in (0, 1) for b in state):
+                raise ValueError(f"state must be {bits} bits")
+            return pack_state(state)
+        state = int(state)
+        if not 0 <= state < 1 << bits:
+            raise ValueError(f"state out of range for {bits}-bit encoding")
+        return state
+
+    @staticmethod
+    def _parse_board(board):
+        """Kiểm tra board của client; trả về (grid_w, grid_h, trap_mode, snake, food, direction)."""
+        if not isinstance(board, dict):
+            raise ValueError("board must be a JSON object")
+        grid = board.get("grid", (GRID_W, GRID_H))
+        if not (isinstance(grid, (list, tuple)) and len(grid) == 2 and
+                all(type(n) is int and MIN_GRID <= n <= MAX_GRID for n in grid)):
+            raise ValueError(f"grid must be [w, h] with {MIN_GRID}..{MAX_GRID} cells per side")
+        grid_w, grid_h = grid
+        trap_mode = board.get("trap_mode", "capped")
+        if trap_mode not in ("capped", "exact"):
+            raise ValueError("trap_mode must be 'capped' or 'exact'")
+        cells = [board.get("food")] + list(board.get("snake") or [])
+        if not all(isinstance(c, (list, tuple)) and len(c) == 2 and all(type(v) is int for v in c)
+                   for c in cells):
+            raise ValueError("snake and food must be [x, y] cells")
+        if len(cells) < 2 or any(not (0 <= x < grid_w and 0 <= y < grid_h) for x, y in cells):
+            raise ValueError("snake and food must be inside the grid")
+        food, snake = tuple(cells[0]), [tuple(c) for c in cells[1:]]
+        if len(set(snake)) != len(snake) or food in snake:
+            raise ValueError("snake cells must be distinct and the food must not lie on the snake")
+        if any(abs(x0 - x1) + abs(y0 - y1) != 1 for (x0, y0), (x1, y1) in zip(snake, snake[1:])):
+            raise ValueError("consecutive snake cells must be adjacent")
+        direction = board.get("direction")
+        if not isinstance(direction, str) or direction.upper() not in Direction.__members__:
+            raise ValueError("direction must be one of " + ", ".join(Direction.__members__))
+        return grid_w, grid_h, trap_mode, snake, food, Direction[direction.upper()]
+
+    def _encode_board(self, board, policy):
+        grid_w, grid_h, trap_mode, snake, food, direction = self._parse_board(board)
+        key = (grid_w, grid_h, trap_mode)
+        game = self.boards.pop(key, None)
+        if game is None:
+            game = SingleGame(grid_w * BLOCK_SIZE, grid_h * BLOCK_SIZE, trap_mode)
+            if len(self.boards) >= MAX_BOARDS:
+                del self.boards[next(iter(self.boards))]   # bỏ bàn dùng lâu nhất
+        self.boards[key] = game   # cuối dict là bàn vừa dùng
+        game.set_body([game.cell(x, y) for x, y in snake], direction)
+        game.food = game.cell(*food)
+        return policy.encoder.encode(game)
+
+    # --- Đổi policy và thống kê ---
+    def _reload_path(self, path):
+        """Đường dẫn reload của client, chỉ nhận file nằm trong self.root."""
+        if not isinstance(path, str):
+            raise ValueError("reload path must be a string")
+        full = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([full, self.root]) != self.root:
+            raise ValueError(f"reload path must be inside {self.root}")
+        return full
+
+    async def reload(self, path=None):
+        path = path or self.policy.source
+        loop = asyncio.get_running_loop()
+        policy = await loop.run_in_executor(None, Policy, path, self.policy.version + 1)
+        self.policy = policy
+        print(f"Serving policy v{policy.version}: {policy.path} ({len(policy.table)} states)")
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.watch_every)
+            try:
+                if self.policy.changed():
+                    await self.reload()
+            except (OSError, ValueError, pickle.UnpicklingError) as e:
+                # File đang được ghi dở hoặc hỏng: giữ policy cũ, thử lại ở lần sau
+                print(f"Reload failed, keeping policy v{self.policy.version}: {e}")
+
+    async def _log_loop(self):
+        while True:
+            await asyncio.sleep(self.log_every)
+            print(format_stats(self.report()))
+
+    def report(self):
+        snap = self.stats.snapshot()
+        counters = snap["counters"]
+
+        def latency(name):
+            p = snap["phases"].get(name)
+            return {k: p[k] for k in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")} if p else {}
+
+        return {
+            "policy": self.policy.info(),
+            "uptime_s": snap["t"],
+            "requests": counters.get("requests", 0),
+            "queries": counters.get("queries", 0),
+            "errors": counters.get("errors", 0),
+            "connections": counters.get("connections", 0),
+            "mean_batch": counters.get("queries", 0) / max(counters.get("batches", 0), 1),
+            "requests_per_s": snap["rates"].get("requests_per_s", 0.0),
+            "queries_per_s": snap["rates"].get("queries_per_s", 0.0),
+            "latency": latency("request"),
+            "lookup": latency("lookup"),
+        }
+
+
+def format_stats(report):
+    lat = report["latency"]
+    line = (f"v{report['policy']['version']} {report['requests']} req ({report['requests_per_s']:,.0f}/s), "
+            f"batch {report['mean_batch']:.1f}")
+    if lat:
+        line += f", latency p50 {lat['p50_ms']:.2f} p90 {lat['p90_ms']:.2f} p99 {lat['p99_ms']:.2f} ms"
+    return line
+
+
+def run_server(path, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, max_batch=256,
+               max_wait=0.0005, watch_every=None, log_every=None):
+    """Chạy server tới khi Ctrl+C, rồi in thống kê cuối."""
+    server = PolicyServer(path, max_batch, max_wait, watch_every, log_every)
+
+    async def main():
+        srv = await server.start(host, port, socket_path)
+        where = socket_path or f"{host}:{port}"
+        print(f"Serving {server.policy.path} ({len(server.policy.table)} states, "
+              f"{server.policy.encoder.name}) on {where}")
+        async with srv:
+            await srv.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(format_stats(server.report()))
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class PolicyClient:
+    """
+    Client đồng bộ, một request mỗi lần. `address` là "host:port", cổng (int) trên localhost,
+    hoặc đường dẫn UNIX socket.
+    """
+    def __init__(self, address=DEFAULT_PORT, timeout=5.0):
+        if isinstance(address, int) or (isinstance(address, str) and ":" in address):
+            host, port = ("127.0.0.1", address) if isinstance(address, int) else address.rsplit(":", 1)
+            self.sock = socket.create_connection((host, int(port)), timeout=timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+        self.file = self.sock.makefile("rb")
+
+    def request(self, **request):
+        self.sock.sendall((json.dumps(request) + "\n").encode())
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("policy server closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def act(self, state):
+        return self.request(state=state)["action"]
+
+    def act_many(self, states):
+        return self.request(states=list(states))["actions"]
+
+    def act_board(self, snake, food, direction, grid=None):
+        board = {"snake": [list(c) for c in snake], "food": list(food), "direction": direction}
+        if grid is not None:
+            board["grid"] = list(grid)
+        return self.request(board=board)["action"]
+
+    def stats(self):
+        return self.request(cmd="stats")
+
+    def reload(self, path=None):
+        return self.request(cmd="reload", path=path)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
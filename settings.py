@@ -1,10 +1,10 @@
 # settings.py
-import pygame
+import math
 from enum import Enum
 from collections import namedtuple
 
-pygame.init()
-pygame.font.init()
+# Không import/khởi tạo pygame ở đây: core, agent và các worker chỉ cần hằng số bên dưới.
+# pygame và font được nạp khi mở cửa sổ (init_pygame, hoặc lần đầu truy cập font_*).
 
 # --- CONFIGS ---
 BLOCK_SIZE = 10
@@ -13,6 +13,7 @@ SPEED_DEMO = 30
 GRID_W = 20
 GRID_H = 20
 NUM_ENVS = 16
+# Lưới mặc định cho NUM_ENVS; cửa sổ training tự xếp lưới theo số env (grid_layout)
 COLS = 4
 ROWS = 4
 
@@ -50,11 +51,81 @@ class Theme:
     BTN_RESET_H = (200, 80, 80)
 
 # --- FONTS ---
-try:
-    font_main = pygame.font.SysFont('consolas', 14, bold=True)
-    font_title = pygame.font.SysFont('consolas', 28, bold=True)
-    font_btn = pygame.font.SysFont('arial', 18, bold=True)
-except:
-    font_main = pygame.font.SysFont('arial', 14)
-    font_title = pygame.font.SysFont('arial', 28)
-    font_btn = pygame.font.SysFont('arial', 18)
\ No newline at end of file
+FONT_NAMES = ("font_main", "font_title", "font_btn")
+_pygame_ready = False
+
+
+def init_pygame():
+    """Khởi tạo pygame (một lần) và trả về module; gọi trước khi mở cửa sổ."""
+    global _pygame_ready
+    import pygame
+    if not _pygame_ready:
+        pygame.init()
+        pygame.font.init()
+        _pygame_ready = True
+    return pygame
+
+
+def grid_layout(num_boards, board_w, board_h, max_w=None, max_h=None, bar_h=50):
+    """
+    (cols, rows) cho lưới `num_boards` bàn cờ. Có kích thước màn hình (max_w, max_h) thì chọn
+    lưới mà bàn hiện to nhất khi co cả cửa sổ vừa màn hình; không có thì chọn lưới gần vuông nhất.
+    Hoà thì lấy lưới ít ô trống hơn.
+    """
+    best = None
+    for cols in range(1, num_boards + 1):
+        rows = -(-num_boards // cols)
+        width, height = cols * board_w, rows * board_h + bar_h
+        if max_w and max_h:
+            fit = -min(max_w / width, max_h / height)
+        else:
+            fit = abs(math.log(width / height))
+        key = (round(fit, 6), cols * rows - num_boards)
+        if best is None or key < best[0]:
+            best = (key, cols, rows)
+    return best[1], best[2]
+
+
+def screen_limits(margin=0.9):
+    """Kích thước tối đa (w, h) cho cửa sổ trên màn hình chính, (None, None) nếu không biết."""
+    pygame = init_pygame()
+    try:
+        width, height = pygame.display.get_desktop_sizes()[0]
+    except (AttributeError, IndexError, pygame.error):
+        return None, None
+    if width <= 0 or height <= 0:
+        return None, None
+    return int(width * margin), int(height * margin)
+
+
+def fit_window(width, height, max_w=None, max_h=None):
+    """Kích thước cửa sổ: (width, height) thu nhỏ giữ tỉ lệ cho vừa (max_w, max_h)."""
+    if not (max_w and max_h):
+        return width, height
+    scale = min(1.0, max_w / width, max_h / height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _load_fonts():
+    pygame = init_pygame()
+    try:
+        fonts = {
+            "font_main": pygame.font.SysFont('consolas', 14, bold=True),
+            "font_title": pygame.font.SysFont('consolas', 28, bold=True),
+            "font_btn": pygame.font.SysFont('arial', 18, bold=True),
+        }
+    except Exception:
+        fonts = {
+            "font_main": pygame.font.SysFont('arial', 14),
+            "font_title": pygame.font.SysFont('arial', 28),
+            "font_btn": pygame.font.SysFont('arial', 18),
+        }
+    globals().update(fonts)
+
+
+def __getattr__(name):
+    # Chỉ chạy khi `name` chưa có trong module, tức là font chưa được nạp
+    if name in FONT_NAMES:
+        _load_fonts()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
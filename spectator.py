@@ -0,0 +1,263 @@
+# spectator.py
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from settings import BLOCK_SIZE
+
+SPECTATOR_NAME = "snake_spectator"
+MAGIC = 0x534E4B31  # "SNK1"
+
+# Ô header (int64): định danh, kích thước, số khe, số thứ tự bản mới nhất, cờ dừng
+H_MAGIC, H_NUM_BOARDS, H_GRID_W, H_GRID_H, H_SLOTS, H_LATEST, H_STOP = range(7)
+HEADER_LEN = 8
+
+
+def _slot_layout(num_boards, n_cells):
+    """(tên, dtype, shape) của từng mảng trong một khe, theo thứ tự trong bộ nhớ."""
+    return [("seq", np.int64, (1,)),
+            ("length", np.int32, (num_boards,)),
+            ("food", np.int32, (num_boards,)),
+            ("score", np.int32, (num_boards,)),
+            ("high", np.int32, (num_boards,)),
+            ("cells", np.int16, (num_boards, n_cells))]
+
+
+class SnapshotRing:
+    """
+    Vòng đệm các ảnh chụp bàn cờ trong shared memory, một bên ghi (trainer) nhiều bên đọc (viewer).
+
+    Mỗi khe chứa thân rắn (ô, từ đầu đến đuôi), mồi, điểm và kỷ lục của mọi bàn được chia sẻ.
+    Bên ghi lần lượt ghi vào khe kế tiếp: đặt `seq` lẻ, chép dữ liệu, đặt `seq` chẵn rồi mới
+    cập nhật header, nên bên đọc không bao giờ phải khoá: đọc lại `seq` sau khi chép, đổi thì bỏ.
+    Cờ dừng trong header là kênh ngược từ viewer về trainer.
+    """
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        if self.header[H_MAGIC] != MAGIC:
+            raise ValueError(f"shared memory {shm.name} is not a spectator ring")
+        self.num_boards = int(self.header[H_NUM_BOARDS])
+        self.grid_w = int(self.header[H_GRID_W])
+        self.grid_h = int(self.header[H_GRID_H])
+        self.n_slots = int(self.header[H_SLOTS])
+        offset = HEADER_LEN * 8
+        self.slots = []
+        for _ in range(self.n_slots):
+            slot = {}
+            for name, dtype, shape in _slot_layout(self.num_boards, self.grid_w * self.grid_h):
+                slot[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                offset += slot[name].nbytes
+            self.slots.append(slot)
+
+    @staticmethod
+    def nbytes(num_boards, grid_w, grid_h, n_slots):
+        per_slot = sum(np.dtype(dtype).itemsize * int(np.prod(shape))
+                       for _, dtype, shape in _slot_layout(num_boards, grid_w * grid_h))
+        return HEADER_LEN * 8 + per_slot * n_slots
+
+    @classmethod
+    def create(cls, name, num_boards, grid_w, grid_h, n_slots=3):
+        size = cls.nbytes(num_boards, grid_w, grid_h, n_slots)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Còn sót lại từ một lần chạy bị ngắt: dọn rồi tạo lại
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[[H_NUM_BOARDS, H_GRID_W, H_GRID_H, H_SLOTS]] = [num_boards, grid_w, grid_h, n_slots]
+        header[H_LATEST] = -1
+        header[H_MAGIC] = MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, untrack=True):
+        """
+        Mở vòng đệm đã có. Không có trainer nào đang chia sẻ -> FileNotFoundError.
+        `untrack=False` cho process con của trainer (dùng chung resource_tracker với bên tạo).
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if untrack:
+            # Process độc lập chỉ gắn vào không được để resource_tracker xoá vùng nhớ khi thoát
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    def write(self, lengths, foods, scores, highs, cells):
+        seq = int(self.header[H_LATEST]) + 1
+        slot = self.slots[seq % self.n_slots]
+        slot["seq"][0] = 2 * seq + 1
+        slot["length"][:] = lengths
+        slot["food"][:] = foods
+        slot["score"][:] = scores
+        slot["high"][:] = highs
+        slot["cells"][:] = cells
+        slot["seq"][0] = 2 * seq + 2
+        self.header[H_LATEST] = seq
+
+    def read(self, boards=None):
+        """
+        Bản chụp mới nhất dạng (seq, [(ô thân rắn, ô mồi, điểm, kỷ lục), ...]) cho các bàn
+        trong `boards` (mặc định tất cả); None nếu chưa có bản nào hoặc bên ghi vừa ghi đè.
+        """
+        seq = int(self.header[H_LATEST])
+        if seq < 0:
+            return None
+        slot = self.slots[seq % self.n_slots]
+        boards = range(self.num_boards) if boards is None else boards
+        before = int(slot["seq"][0])
+        data = [(slot["cells"][i, :slot["length"][i]].tolist(), int(slot["food"][i]),
+                 int(slot["score"][i]), int(slot["high"][i])) for i in boards]
+        if before != 2 * seq + 2 or int(slot["seq"][0]) != before:
+            return None
+        return seq, data
+
+    def request_stop(self):
+        self.header[H_STOP] = 1
+
+    def stop_requested(self):
+        return bool(self.header[H_STOP])
+
+    def close(self):
+        # Bỏ các view numpy trước khi đóng shared memory
+        self.header = None
+        self.slots = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SpectatorPublisher:
+    """
+    Phía trainer: chụp trạng thái các env vào SnapshotRing tối đa `max_hz` lần mỗi giây.
+
+    Chỉ `max_boards` env đầu tiên được chia sẻ. Khi không có viewer nào, chi phí chỉ là
+    một lần chụp mỗi 1/max_hz giây, không phụ thuộc tốc độ training.
+    """
+    def __init__(self, env, name=SPECTATOR_NAME, max_hz=30, max_boards=64, ring=None):
+        if hasattr(env, "games"):
+            game = env.games[0]
+            grid_w, grid_h = game.grid_w, game.grid_h
+        else:
+            grid_w, grid_h = env.grid_w, env.grid_h
+        num_boards = min(env.num_envs, max_boards)
+        self.ring = ring or SnapshotRing.create(name, num_boards, grid_w, grid_h)
+        self.num_boards = self.ring.num_boards
+        self.interval = 1.0 / max_hz
+        self._next = 0.0
+        n_cells = grid_w * grid_h
+        self._lengths = np.zeros(self.num_boards, dtype=np.int32)
+        self._foods = np.zeros(self.num_boards, dtype=np.int32)
+        self._cells = np.zeros((self.num_boards, n_cells), dtype=np.int16)
+
+    def maybe_publish(self, env):
+        now = time.perf_counter()
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        self.publish(env)
+        return True
+
+    def publish(self, env):
+        n = self.num_boards
+        if hasattr(env, "games"):
+            for i, game in enumerate(env.games[:n]):
+                self._lengths[i] = len(game.snake)
+                self._cells[i, :len(game.snake)] = game.snake
+                self._foods[i] = game.food if game.food is not None else -1
+            scores = [game.score for game in env.games[:n]]
+        else:
+            for i in range(n):
+                body = env.snake_cells(i)
+                self._lengths[i] = len(body)
+                self._cells[i, :len(body)] = body
+            self._foods[:] = env.food[:n]
+            scores = env.score[:n]
+        self.ring.write(self._lengths, self._foods, scores, env.high_scores[:n], self._cells)
+
+    def stop_requested(self):
+        return self.ring.stop_requested()
+
+    def close(self):
+        self.ring.close()
+
+
+class _BoardView:
+    """Giả một SingleGame đủ cho GridRenderer: grid_w, snake, body_set, food, score (theo ô)."""
+    def __init__(self, grid_w):
+        self.grid_w = grid_w
+        self.snake = []
+        self.body_set = set()
+        self.food = None
+        self.score = 0
+
+    def load(self, cells, food, score):
+        self.snake = cells
+        self.body_set = set(cells)
+        self.food = food if food >= 0 else None
+        self.score = score
+
+
+def run_viewer(name=SPECTATOR_NAME, boards=None, fps=30, cols=None):
+    """
+    Cửa sổ xem trực tiếp một trainer đang chạy. `boards` là danh sách chỉ số bàn cần xem.
+    Đóng cửa sổ chỉ ngắt kết nối; nút STOP & SAVE gửi cờ dừng để trainer lưu rồi thoát.
+    """
+    import pygame
+    from settings import init_pygame, grid_layout, screen_limits, fit_window
+    from ui import GridRenderer
+
+    try:
+        ring = SnapshotRing.attach(name)
+    except FileNotFoundError:
+        print(f"No trainer is sharing boards under '{name}' (start one with: main.py train --spectate).")
+        return False
+    try:
+        boards = [b for b in (boards or range(ring.num_boards)) if 0 <= b < ring.num_boards]
+        if not boards:
+            print(f"No such boards; the trainer shares boards 0..{ring.num_boards - 1}.")
+            return False
+        board_w, board_h = ring.grid_w * BLOCK_SIZE, ring.grid_h * BLOCK_SIZE
+        init_pygame()
+        max_w, max_h = screen_limits()
+        cols = cols or grid_layout(len(boards), board_w, board_h, max_w, max_h)[0]
+        renderer = GridRenderer(len(boards), cols, board_w, board_h)
+        width, height = renderer.width, renderer.height
+        display = pygame.display.set_mode(fit_window(width, height, max_w, max_h), pygame.RESIZABLE)
+        pygame.display.set_caption(f"Snake AI Spectator ({name})")
+        clock = pygame.time.Clock()
+        stop_btn_rect = pygame.Rect(width // 2 - 80, height - 40, 160, 30)
+        views = [_BoardView(ring.grid_w) for _ in boards]
+        highs = [0] * len(boards)
+        mouse_pos = (0, 0)
+        last_seq = None
+
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return True
+                if event.type == pygame.VIDEORESIZE:
+                    renderer.invalidate()
+                if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN):
+                    win_w, win_h = display.get_size()
+                    mouse_pos = (event.pos[0] * width / win_w, event.pos[1] * height / win_h)
+                    if event.type == pygame.MOUSEBUTTONDOWN and stop_btn_rect.collidepoint(mouse_pos):
+                        ring.request_stop()
+                        print("Stop requested; the trainer will save and exit.")
+                        return True
+            snap = ring.read(boards)
+            if snap is not None and snap[0] != last_seq:
+                last_seq, data = snap
+                for k, (cells, food, score, high) in enumerate(data):
+                    views[k].load(cells, food, score)
+                    highs[k] = high
+            status = [f"board(s) {boards[0]}..{boards[-1]} of {ring.num_boards}", f"snapshot {last_seq}"]
+            dirty = renderer.draw(views, highs, stop_btn_rect, "STOP & SAVE", mouse_pos, status)
+            renderer.present(display, dirty)
+            clock.tick(fps)
+    finally:
+        ring.close()
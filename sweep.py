@@ -0,0 +1,231 @@
+# sweep.py
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import random
+import time
+import numpy as np
+from config import RunConfig
+
+# Cờ dừng sớm và hàng đợi tiến độ dùng chung, gán cho mỗi worker của Pool qua initializer
+_stop_flags = None
+_progress = None
+
+
+def grid_configs(base, grid, seeds=(None,)):
+    """Tích Descartes của `grid` ({tên: [giá trị, ...]}) trên nền `base`, lặp cho từng seed."""
+    names = sorted(grid)
+    configs = []
+    for values in itertools.product(*(grid[n] for n in names)):
+        for seed in seeds:
+            configs.append(base.replace(seed=seed, **dict(zip(names, values))))
+    return configs
+
+
+def load_results(path):
+    """
+    Đọc file kết quả JSONL: trả về (run_id -> dòng 'done', run_id -> [dòng 'progress']).
+    Run lỗi ('failed') không tính là xong, nên sẽ được chạy lại khi tiếp tục sweep.
+    """
+    done, progress = {}, {}
+    if not os.path.exists(path):
+        return done, progress
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue   # dòng cuối ghi dở khi sweep bị ngắt
+            if rec.get("event") == "done" and rec.get("status") != "failed":
+                done[rec["run"]] = rec
+            elif rec.get("event") == "progress":
+                progress.setdefault(rec["run"], []).append(rec)
+    return done, progress
+
+
+class MedianStopper:
+    """
+    Quy tắc dừng theo trung vị: sau `grace_games` ván, một run bị dừng nếu điểm trung bình
+    gần đây của nó thấp hơn trung vị của các run khác tại cùng số ván (cần ít nhất `min_peers` run).
+    """
+    def __init__(self, grace_games=500, min_peers=3):
+        self.grace_games = grace_games
+        self.min_peers = min_peers
+        self.curves = {}   # run_id -> [(games, mean_score), ...] theo thứ tự tăng dần
+
+    def add(self, run_id, games, mean_score):
+        self.curves.setdefault(run_id, []).append((games, mean_score))
+
+    def should_stop(self, run_id, games, mean_score):
+        if games < self.grace_games:
+            return False
+        peers = []
+        for other, curve in self.curves.items():
+            if other == run_id:
+                continue
+            reached = [m for g, m in curve if g >= games]
+            if reached:
+                peers.append(reached[0])
+        return len(peers) >= self.min_peers and mean_score < float(np.median(peers))
+
+
+def _init_worker(stop_flags, progress):
+    global _stop_flags, _progress
+    _stop_flags = stop_flags
+    _progress = progress
+
+
+def train_run(config, max_games, max_steps=None, report_every=100, out_dir=None,
+              report=None, should_stop=None):
+    """
+    Huấn luyện một cấu hình từ bảng rỗng, headless. Mỗi `report_every` ván gọi `report(dict)`
+    với tiến độ; `should_stop()` trả về True thì dừng sớm. Trả về dict kết quả cuối.
+    """
+    from agent import QTableAgent, new_q_table
+    if config.seed is not None:
+        random.seed(config.seed)
+        np.random.seed(config.seed)
+    env = config.make_env()
+    agent = QTableAgent(q_table=new_q_table(config), config=config)
+    start = time.perf_counter()
+    recent = []
+    games = steps = record = 0
+    next_report = report_every
+    status = "finished"
+    states_old = agent.get_states(env)
+    while games < max_games and (max_steps is None or steps < max_steps):
+        actions = agent.get_actions(states_old, train_mode=True)
+        rewards, dones, scores, _ = env.step_all(actions)
+        states_new = agent.get_states(env)
+        dones = np.asarray(dones, dtype=bool)
+        agent.train_batch(states_old, actions, rewards, states_new, dones)
+        states_old = states_new
+        steps += 1
+        for i in np.flatnonzero(dones):
+            agent.n_games += 1
+            games += 1
+            recent.append(int(scores[i]))
+            record = max(record, int(scores[i]))
+        if games >= next_report:
+            next_report += report_every
+            stats = {"games": games, "steps": steps, "record": record,
+                     "mean_score": float(np.mean(recent[-report_every:])),
+                     "elapsed_s": time.perf_counter() - start}
+            if report is not None:
+                report(stats)
+            if should_stop is not None and games < max_games and should_stop():
+                status = "stopped_early"
+                break
+    result = {"status": status, "games": games, "steps": steps, "record": record,
+              "mean_score": float(np.mean(recent[-report_every:])) if recent else 0.0,
+              "elapsed_s": time.perf_counter() - start}
+    if out_dir:
+        path = os.path.join(out_dir, f"{config.run_id()}.pkl")
+        agent.save_table(path)
+        result["q_table"] = path
+    return result
+
+
+def _run_job(job):
+    index, config_dict, budget = job
+    config = RunConfig.from_dict(config_dict)
+    run_id = config.run_id()
+    try:
+        result = train_run(config, report=lambda stats: _progress.put((run_id, stats)),
+                           should_stop=lambda: bool(_stop_flags[index]), **budget)
+    except Exception as e:   # một run lỗi không được làm hỏng cả sweep
+        result = {"status": "failed", "error": repr(e)}
+    return run_id, result
+
+
+def run_sweep(configs, results_path, max_jobs=None, max_games=2000, max_steps=None,
+              report_every=100, out_dir=None, stopper=None):
+    """
+    Chạy các cấu hình trên một Pool tối đa `max_jobs` process.
+
+    Tiến độ mỗi run được ghi ngay vào `results_path` (JSONL, mỗi dòng một sự kiện
+    'progress' hoặc 'done'); chạy lại cùng lệnh thì bỏ qua các run đã có dòng 'done'.
+    `stopper` (mặc định MedianStopper) quyết định dừng sớm các run kém.
+    """
+    max_jobs = max_jobs or os.cpu_count() or 1
+    stopper = stopper if stopper is not None else MedianStopper()
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    finished, progress = load_results(results_path)
+    for run_id, recs in progress.items():
+        for rec in recs:
+            stopper.add(run_id, rec["games"], rec["mean_score"])
+    pending = []
+    seen = set()
+    for config in configs:
+        run_id = config.run_id()
+        if run_id not in finished and run_id not in seen:
+            seen.add(run_id)
+            pending.append(config)
+    print(f"Sweep: {len(configs)} runs, {len(configs) - len(pending)} already done, "
+          f"{len(pending)} to run on {max_jobs} process(es)")
+    if not pending:
+        return load_results(results_path)[0]
+
+    # Một run chạy lại từ đầu: bỏ đường cong dở dang của lần trước
+    for config in pending:
+        stopper.curves.pop(config.run_id(), None)
+    index_of = {config.run_id(): i for i, config in enumerate(pending)}
+    stop_flags = mp.Array('b', len(pending), lock=False)
+    progress_queue = mp.Queue()
+    budget = {"max_games": max_games, "max_steps": max_steps,
+              "report_every": report_every, "out_dir": out_dir}
+    jobs = [(i, config.to_dict(), budget) for i, config in enumerate(pending)]
+    configs_by_id = {config.run_id(): config for config in pending}
+
+    with open(results_path, "a+") as out, \
+            mp.Pool(max_jobs, initializer=_init_worker, initargs=(stop_flags, progress_queue)) as pool:
+        # Dòng cuối ghi dở của lần chạy bị ngắt: xuống dòng để không dính vào bản ghi mới
+        if out.tell():
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+
+        def write(rec):
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+
+        def drain(timeout):
+            """Xử lý hết các dòng tiến độ đang chờ; hàng đợi rỗng thì chờ dòng đầu tối đa `timeout` giây."""
+            first = True
+            while True:
+                try:
+                    if first and timeout:
+                        run_id, stats = progress_queue.get(timeout=timeout)
+                    else:
+                        run_id, stats = progress_queue.get_nowait()
+                except queue.Empty:
+                    return
+                first = False
+                stopper.add(run_id, stats["games"], stats["mean_score"])
+                write(dict(stats, event="progress", run=run_id, t=time.time()))
+                if stopper.should_stop(run_id, stats["games"], stats["mean_score"]):
+                    stop_flags[index_of[run_id]] = 1
+
+        results = pool.imap_unordered(_run_job, jobs)
+        remaining = len(jobs)
+        while remaining:
+            drain(0.2)
+            try:
+                run_id, result = results.next(timeout=0)
+            except mp.TimeoutError:
+                continue
+            # Ghi nốt các dòng tiến độ của run này trước dòng 'done'
+            drain(0)
+            remaining -= 1
+            write(dict(result, event="done", run=run_id, config=configs_by_id[run_id].to_dict(), t=time.time()))
+            print(f"[{len(jobs) - remaining}/{len(jobs)}] {run_id} {result['status']}: "
+                  f"mean {result.get('mean_score', 0):.2f}, record {result.get('record', 0)}, "
+                  f"{result.get('games', 0)} games")
+        # Cho worker tự thoát trước khi `with` gọi terminate(): khi thoát, thread nền của
+        # progress_queue trong worker được đẩy hết dữ liệu và join, không bị cắt ngang
+        pool.close()
+        pool.join()
+    return load_results(results_path)[0]
@@ -0,0 +1,150 @@
+# symmetry.py
+"""
+Gộp các state đối xứng của encoder basic (11 bit) về một state đại diện.
+
+Xoay bàn cờ 90 độ chỉ đổi bit hướng đi và bit vị trí mồi, còn nguy hiểm và action
+(thẳng/phải/trái) là tương đối nên giữ nguyên. Lật bàn cờ qua trục hướng đi đổi chỗ
+nguy hiểm phải/trái, mồi trên/dưới và action phải/trái. 8 phép biến đổi này chia
+2048 state thành các lớp; state đại diện là state có chỉ số nhỏ nhất trong lớp.
+
+Trên bàn vuông (mặc định 20x20) luật chơi đối xứng đúng với cả 8 phép biến đổi. Thứ duy nhất
+không đối xứng là lúc bắt đầu ván: rắn luôn ở giữa bàn, thân nằm ngang và đi sang phải, nên
+các state đối xứng không được gặp với tần suất như nhau. Bảng gộp vì thế học nhanh hơn nhưng
+có thể dừng ở điểm thấp hơn một chút so với bảng thường.
+"""
+import numpy as np
+from qtable import DenseQTable, NUM_STATES, STATE_BITS, pack_states
+
+# Thứ tự bit: danger (thẳng, phải, trái), dir (L, R, U, D), food (left, right, up, down)
+# Bit thứ i sau biến đổi lấy từ bit perm[i] của state gốc
+_ROTATE = [0, 1, 2, 6, 5, 3, 4, 10, 9, 7, 8]   # xoay 90 độ theo chiều kim đồng hồ
+_MIRROR = [0, 2, 1, 3, 4, 6, 5, 7, 8, 10, 9]   # lật trên/dưới
+# Action trong hệ của state đại diện: hàng 0 giữ nguyên, hàng 1 đổi phải <-> trái
+ACTION_MAP = np.array([[0, 1, 2], [0, 2, 1]])
+
+
+def _build_tables():
+    bits = (np.arange(NUM_STATES)[:, None] >> np.arange(STATE_BITS - 1, -1, -1)) & 1
+    canonical = np.arange(NUM_STATES)
+    mirrored = np.zeros(NUM_STATES, dtype=np.intp)
+    for flip in (0, 1):
+        variant = bits[:, _MIRROR] if flip else bits
+        for _ in range(4):
+            packed = pack_states(variant)
+            better = packed < canonical
+            canonical[better] = packed[better]
+            mirrored[better] = flip
+            variant = variant[:, _ROTATE]
+    return canonical, mirrored
+
+
+CANONICAL, MIRRORED = _build_tables()
+
+
+def canonicalize(states):
+    """(state đại diện, cờ lật) cho mảng state đã pack; cờ lật chọn hàng của ACTION_MAP."""
+    states = np.asarray(states, dtype=np.int64)
+    return CANONICAL[states], MIRRORED[states]
+
+
+class SymmetricQTable:
+    """
+    Q-Table chỉ lưu state đại diện: một lần cập nhật dùng chung cho mọi state đối xứng.
+
+    Bên ngoài vẫn dùng state và action gốc như DenseQTable (giao diện dict và các thao tác
+    theo lô); bảng tự đổi sang hệ của state đại diện. `table` là DenseQTable chứa các state
+    đại diện (có thể nằm trong shared memory); `q` và `visited` là mảng của bảng đó.
+    to_dict trả về đủ mọi state đối xứng, nên q_table.pkl vẫn dùng được ở nơi không bật symmetry.
+    """
+    state_bits = STATE_BITS
+
+    def __init__(self, table=None):
+        self.table = table if table is not None else DenseQTable()
+
+    @property
+    def q(self):
+        return self.table.q
+
+    @property
+    def visited(self):
+        return self.table.visited
+
+    # --- Giao diện dict ---
+    @staticmethod
+    def _index(state):
+        return DenseQTable._index(state)
+
+    def __contains__(self, state):
+        return bool(self.table.visited[CANONICAL[self._index(state)]])
+
+    def __getitem__(self, state):
+        idx = self._index(state)
+        if not self.table.visited[CANONICAL[idx]]:
+            raise KeyError(state)
+        return self.table.q[CANONICAL[idx], ACTION_MAP[MIRRORED[idx]]]  # bản sao, ghi lại qua __setitem__
+
+    def __setitem__(self, state, values):
+        idx = self._index(state)
+        values = np.asarray(values, dtype=np.float64)
+        # ACTION_MAP tự nghịch đảo: cùng một hoán vị đưa action về hệ đại diện và ngược lại
+        self.table[int(CANONICAL[idx])] = values[ACTION_MAP[MIRRORED[idx]]]
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return list(self.to_dict())
+
+    def items(self):
+        return list(self.to_dict().items())
+
+    # --- Thao tác theo lô ---
+    def lookup(self, states):
+        canonical, mirrored = canonicalize(states)
+        return np.take_along_axis(self.table.lookup(canonical), ACTION_MAP[mirrored], axis=1)
+
+    def best_actions(self, states):
+        canonical, mirrored = canonicalize(states)
+        return ACTION_MAP[mirrored, self.table.best_actions(canonical)]
+
+    def peek(self, states):
+        canonical, mirrored = canonicalize(states)
+        return np.take_along_axis(self.table.peek(canonical), ACTION_MAP[mirrored], axis=1)
+
+    def update_batch(self, states, actions, rewards, next_states, dones, lr, gamma):
+        """Như DenseQTable.update_batch; max Q của state sau không phụ thuộc thứ tự action."""
+        canonical, mirrored = canonicalize(states)
+        actions = ACTION_MAP[mirrored, np.asarray(actions)]
+        self.table.update_batch(canonical, actions, rewards, CANONICAL[np.asarray(next_states)],
+                                dones, lr, gamma)
+
+    # --- Chuyển đổi với định dạng q_table.pkl ---
+    def expanded(self):
+        """DenseQTable đủ 2048 state: mỗi state lấy Q-value của state đại diện, đổi lại thứ tự action."""
+        dense = DenseQTable()
+        rows = self.table.q[CANONICAL]
+        dense.q[:] = np.take_along_axis(rows, ACTION_MAP[MIRRORED], axis=1)
+        dense.visited[:] = self.table.visited[CANONICAL]
+        return dense
+
+    @classmethod
+    def from_dict(cls, table):
+        """Gộp bảng thường: state đại diện nhận trung bình Q-value của các state đối xứng đã thăm."""
+        full = table if isinstance(table, DenseQTable) else DenseQTable.from_dict(table)
+        seen = np.flatnonzero(full.visited)
+        canonical, mirrored = CANONICAL[seen], MIRRORED[seen]
+        sums = np.zeros_like(full.q)
+        np.add.at(sums, canonical, np.take_along_axis(full.q[seen], ACTION_MAP[mirrored], axis=1))
+        counts = np.bincount(canonical, minlength=NUM_STATES)
+        sym = cls()
+        hit = counts > 0
+        sym.table.q[hit] = sums[hit] / counts[hit, None]
+        sym.table.visited[:] = hit
+        return sym
+
+    def to_dict(self):
+        return self.expanded().to_dict()
+
@@ -0,0 +1,89 @@
+# test_state_cache.py
+"""
+State cache (game.state_cache theo game.version, xem encoders.py) và việc mang state của tick
+trước sang tick sau trong run_training không được đổi kết quả học: cùng seed, phải ra đúng
+cùng Q-Table với vòng lặp cũ tính lại state của mọi bàn ở đầu mỗi tick.
+"""
+import random
+import numpy as np
+import pytest
+from agent import QTableAgent, run_training, table_backend
+from config import RunConfig
+from core import HeadlessSnakeGame
+from encoders import StateEncoder
+from qtable import pack_state
+
+TICKS = 300
+ENVS = 8
+
+
+def _make_env(config):
+    random.seed(0)
+    np.random.seed(0)
+    # Tạo env sau khi seed: mỗi bàn lấy seed RNG mồi từ random lúc tạo
+    return HeadlessSnakeGame(ENVS, config)
+
+
+def _train(config, ticks=TICKS):
+    env = _make_env(config)
+    agent = run_training(env, max_steps=ticks, seed=0, load_path="missing.pkl", config=config)
+    return agent.q_table.to_dict()
+
+
+def _train_per_tick(config, ticks=TICKS):
+    """Vòng lặp cũ của run_training: tính lại states_old từ env.games ở đầu mỗi tick."""
+    env = _make_env(config)
+    random.seed(0)
+    np.random.seed(0)
+    agent = QTableAgent(backend=table_backend(config), path="missing.pkl", config=config)
+    games = 0
+    for _ in range(ticks):
+        states_old = agent.get_states(env)
+        actions = agent.get_actions(states_old, train_mode=True)
+        rewards, dones, _, _ = env.step_all(actions)
+        states_new = agent.get_states(env)
+        dones = np.asarray(dones, dtype=bool)
+        agent.train_batch(states_old, actions, rewards, states_new, dones)
+        agent.n_games += int(dones.sum())
+        games += int(dones.sum())
+    return agent.q_table.to_dict(), games
+
+
+def _uncached(self, game):
+    """StateEncoder._cached không dùng cache: lần nào cũng tính lại từ bàn cờ."""
+    _uncached.calls += 1
+    features = self.compute(game)
+    return (self.name, getattr(game, "version", None), features, pack_state(features))
+
+
+def _assert_same_tables(a, b):
+    assert a.keys() == b.keys()
+    assert len(a) > 10
+    for state, values in a.items():
+        np.testing.assert_array_equal(values, b[state])
+
+
+@pytest.mark.parametrize("encoder", ["basic", "rich"])
+def test_cache_does_not_change_q_table(encoder, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)   # run_training ghi q_table.pkl vào thư mục hiện tại
+    config = RunConfig(encoder=encoder)
+    cached = _train(config)
+
+    _uncached.calls = 0
+    monkeypatch.setattr(StateEncoder, "_cached", _uncached)
+    uncached = _train(config)
+    assert _uncached.calls > 0
+    _assert_same_tables(cached, uncached)
+
+
+@pytest.mark.parametrize("encoder", ["basic", "rich"])
+def test_carried_states_match_per_tick_states(encoder, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = RunConfig(encoder=encoder)
+    carried = _train(config)
+
+    # Bản tham chiếu không dùng cả cache lẫn state mang sang
+    monkeypatch.setattr(StateEncoder, "_cached", _uncached)
+    reference, games = _train_per_tick(config)
+    assert games > 0   # có ván kết thúc, tức là có bàn được reset giữa chừng
+    _assert_same_tables(carried, reference)
@@ -0,0 +1,157 @@
+# trajectory.py
+import glob
+import json
+import os
+import time
+import numpy as np
+from checkpoint import atomic_write, STATE_ENCODING
+from qtable import DenseQTable
+
+FORMAT_NAME = "snake-trajectories"
+FORMAT_VERSION = 1
+
+# Một transition 13 byte, không padding: state đã pack (11 bit), action 0/1/2, reward -20..20
+RECORD_DTYPE = np.dtype([
+    ("state", "<u2"),
+    ("action", "u1"),
+    ("reward", "i1"),
+    ("next_state", "<u2"),
+    ("done", "u1"),
+    ("env", "<u2"),
+    ("game", "<u4"),
+])
+
+
+def _chunk_path(directory, n):
+    return os.path.join(directory, f"chunk_{n:06d}.bin")
+
+
+class TrajectoryWriter:
+    """
+    Ghi các transition của vòng training vào thư mục log, mỗi `chunk_size` bản ghi một file.
+
+    Bản ghi được gom trong một mảng đệm rồi ghi nguyên khối (qua file tạm + đổi tên), nên
+    chunk trên đĩa luôn đầy đủ và đọc được bằng np.memmap. Ghi tiếp vào thư mục đã có thì
+    số chunk và mã ván (game id) tiếp nối phần cũ.
+    """
+    def __init__(self, directory, num_envs, chunk_size=1 << 20):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        meta = _read_meta(directory)
+        self.next_chunk = len(glob.glob(os.path.join(directory, "chunk_*.bin")))
+        self.next_game = meta.get("next_game", 0) if meta else 0
+        self.records = meta.get("records", 0) if meta else 0
+
+        self.buffer = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+        self.fill = 0
+        self.env_ids = np.arange(num_envs, dtype=np.uint16)
+        self.game_ids = np.arange(self.next_game, self.next_game + num_envs, dtype=np.uint32)
+        self.next_game += num_envs
+
+    def append(self, states, actions, rewards, next_states, dones):
+        """Một tick của mọi env (các mảng dài num_envs, giống tham số của train_batch)."""
+        dones = np.asarray(dones, dtype=bool)
+        n = len(dones)
+        start = 0
+        while start < n:
+            take = min(n - start, self.chunk_size - self.fill)
+            part = slice(start, start + take)
+            out = self.buffer[self.fill:self.fill + take]
+            out["state"] = np.asarray(states)[part]
+            out["action"] = np.asarray(actions)[part]
+            out["reward"] = np.asarray(rewards)[part]
+            out["next_state"] = np.asarray(next_states)[part]
+            out["done"] = dones[part]
+            out["env"] = self.env_ids[part]
+            out["game"] = self.game_ids[part]
+            self.fill += take
+            start += take
+            if self.fill == self.chunk_size:
+                self.flush()
+        # Env vừa kết thúc ván nhận mã ván mới cho transition kế tiếp
+        n_done = int(dones.sum())
+        if n_done:
+            self.game_ids[dones] = np.arange(self.next_game, self.next_game + n_done, dtype=np.uint32)
+            self.next_game += n_done
+
+    def flush(self):
+        if not self.fill:
+            return
+        data = self.buffer[:self.fill]
+        atomic_write(_chunk_path(self.directory, self.next_chunk), lambda f: f.write(data.tobytes()))
+        self.next_chunk += 1
+        self.records += self.fill
+        self.fill = 0
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "format": FORMAT_NAME, "version": FORMAT_VERSION,
+            "dtype": [list(field) for field in RECORD_DTYPE.descr],
+            "state_encoding": STATE_ENCODING,
+            "records": self.records, "next_game": self.next_game, "updated_at": time.time(),
+        }
+        atomic_write(os.path.join(self.directory, "meta.json"),
+                     lambda f: json.dump(meta, f, indent=2), mode="w")
+
+
+def _read_meta(directory):
+    path = os.path.join(directory, "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_NAME:
+        raise ValueError(f"{directory} is not a trajectory log")
+    if meta.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"{directory} has trajectory log version {meta['version']}, "
+                         f"newest supported is {FORMAT_VERSION}")
+    return meta
+
+
+class TrajectoryStore:
+    """Đọc log transition: mỗi chunk là một np.memmap chỉ đọc, không nạp cả log vào RAM."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = _read_meta(directory)
+        if self.meta is None:
+            raise FileNotFoundError(f"no trajectory log in {directory}")
+        self.paths = sorted(glob.glob(os.path.join(directory, "chunk_*.bin")))
+
+    def chunks(self):
+        for path in self.paths:
+            if os.path.getsize(path):
+                yield np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+
+    def __len__(self):
+        return sum(os.path.getsize(p) // RECORD_DTYPE.itemsize for p in self.paths)
+
+    def batches(self, batch_size=1 << 18):
+        for chunk in self.chunks():
+            for start in range(0, len(chunk), batch_size):
+                yield chunk[start:start + batch_size]
+
+
+def offline_train(store, q_table=None, lr=0.001, gamma=0.95, sweeps=1, batch_size=1 << 18, log=print):
+    """
+    Học Q-Table từ log có sẵn, không chạy môi trường: mỗi sweep duyệt toàn bộ log theo lô
+    `batch_size` transition (DenseQTable.update_grouped). Trả về DenseQTable.
+    """
+    table = q_table if q_table is not None else DenseQTable()
+    for sweep in range(sweeps):
+        start = time.perf_counter()
+        n = 0
+        for batch in store.batches(batch_size):
+            table.update_grouped(batch["state"], batch["action"], batch["reward"],
+                                 batch["next_state"], batch["done"].astype(bool), lr, gamma)
+            n += len(batch)
+        elapsed = time.perf_counter() - start
+        if log:
+            log(f"sweep {sweep + 1}/{sweeps}: {n:,} transitions in {elapsed:.1f}s "
+                f"({n / max(elapsed, 1e-9):,.0f}/s), {len(table)} states")
+    return table
@@ -1,6 +1,13 @@
 # ui.py
 import pygame
-from settings import Theme, BLOCK_SIZE, font_btn, font_main, font_title
+import settings
+from settings import Theme, BLOCK_SIZE, init_pygame
+
+
+def cell_xy(cell, grid_w):
+    """Chỉ số ô -> toạ độ pixel góc trên trái (chỉ dùng khi vẽ)."""
+    return cell % grid_w * BLOCK_SIZE, cell // grid_w * BLOCK_SIZE
+
 
 class UIRenderer:
     @staticmethod
@@ -16,23 +23,27 @@ class UIRenderer:
     @staticmethod
     def draw_game_elements(surface, game, offset_x=0, offset_y=0):
         # 1. Vẽ Rắn
-        for i, pt in enumerate(game.snake):
-            color = Theme.SNAKE_HEAD if i == 0 else Theme.SNAKE_BODY
-            rect = pygame.Rect(offset_x + pt.x, offset_y + pt.y, BLOCK_SIZE, BLOCK_SIZE)
-            pygame.draw.rect(surface, color, rect, border_radius=3)
-            
-            # Vẽ mắt cho đầu rắn
-            if i == 0: 
-                eye_radius = 2
-                center_x = offset_x + pt.x + BLOCK_SIZE // 2
-                center_y = offset_y + pt.y + BLOCK_SIZE // 2
-                pygame.draw.circle(surface, (0,0,0), (center_x, center_y), eye_radius)
+        for i, cell in enumerate(game.snake):
+            x, y = cell_xy(cell, game.grid_w)
+            UIRenderer.draw_snake_cell(surface, offset_x + x, offset_y + y, i == 0)
 
         # 2. Vẽ Thức ăn
-        center_food_x = offset_x + game.food.x + BLOCK_SIZE // 2
-        center_food_y = offset_y + game.food.y + BLOCK_SIZE // 2
-        pygame.draw.circle(surface, Theme.FOOD_OUTER, (center_food_x, center_food_y), BLOCK_SIZE // 2 - 1)
-        pygame.draw.circle(surface, Theme.FOOD_INNER, (center_food_x, center_food_y), BLOCK_SIZE // 4)
+        x, y = cell_xy(game.food, game.grid_w)
+        UIRenderer.draw_food(surface, offset_x + x, offset_y + y)
+
+    @staticmethod
+    def draw_snake_cell(surface, x, y, is_head=False):
+        color = Theme.SNAKE_HEAD if is_head else Theme.SNAKE_BODY
+        pygame.draw.rect(surface, color, (x, y, BLOCK_SIZE, BLOCK_SIZE), border_radius=3)
+        # Vẽ mắt cho đầu rắn
+        if is_head:
+            pygame.draw.circle(surface, (0,0,0), (x + BLOCK_SIZE // 2, y + BLOCK_SIZE // 2), 2)
+
+    @staticmethod
+    def draw_food(surface, x, y):
+        center = (x + BLOCK_SIZE // 2, y + BLOCK_SIZE // 2)
+        pygame.draw.circle(surface, Theme.FOOD_OUTER, center, BLOCK_SIZE // 2 - 1)
+        pygame.draw.circle(surface, Theme.FOOD_INNER, center, BLOCK_SIZE // 4)
 
     @staticmethod
     def draw_button(surface, rect, text, mouse_pos, is_reset=False):
@@ -49,13 +60,207 @@ class UIRenderer:
         pygame.draw.rect(surface, color, rect, border_radius=8)
         
         # Vẽ text
-        txt_surf = font_btn.render(text, True, Theme.BTN_TEXT)
+        txt_surf = settings.font_btn.render(text, True, Theme.BTN_TEXT)
         txt_rect = txt_surf.get_rect(center=rect.center)
         surface.blit(txt_surf, txt_rect)
 
+class GlyphCache:
+    """Nhớ surface của từng ký tự đã render, ghép chuỗi bằng blit thay vì font.render mỗi khung hình."""
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+
+    def glyph(self, ch, color):
+        surf = self.glyphs.get((ch, color))
+        if surf is None:
+            surf = self.glyphs[(ch, color)] = self.font.render(ch, True, color)
+        return surf
+
+    def size(self, text, color):
+        glyphs = [self.glyph(ch, color) for ch in text]
+        return sum(g.get_width() for g in glyphs), max((g.get_height() for g in glyphs), default=0)
+
+    def blit(self, surface, text, color, pos):
+        """Vẽ `text` tại `pos`, trả về Rect đã vẽ."""
+        x, y = pos
+        h = 0
+        for ch in text:
+            g = self.glyph(ch, color)
+            surface.blit(g, (x, y))
+            x += g.get_width()
+            h = max(h, g.get_height())
+        return pygame.Rect(pos[0], y, x - pos[0], h)
+
+
+class GridRenderer:
+    """
+    Vẽ lưới nhiều bàn cờ của màn hình training theo kiểu dirty-rect.
+
+    Lưới, khung và nền thanh dưới được vẽ sẵn một lần vào `background`. Mỗi khung hình chỉ
+    vẽ lại những ô đã đổi so với lần vẽ trước (đầu mới, đuôi vừa rời, mồi đổi chỗ), điểm số
+    khi giá trị đổi (ghép từ GlyphCache), nút và dòng thống kê khi chúng đổi; `draw` trả về
+    danh sách vùng bẩn để `present` chỉ cập nhật đúng các vùng đó lên màn hình.
+    """
+    def __init__(self, num_boards, cols, board_w, board_h, bar_h=50):
+        self.num_boards = num_boards
+        self.cols = cols
+        self.board_w = board_w
+        self.board_h = board_h
+        self.bar_h = bar_h
+        self.width = board_w * cols
+        self.height = board_h * ((num_boards + cols - 1) // cols) + bar_h
+        self.canvas = pygame.Surface((self.width, self.height))
+        self.background = self._build_background()
+        self.glyphs = GlyphCache(settings.font_main)
+        self.invalidate()
+
+    def _build_background(self):
+        bg = pygame.Surface((self.width, self.height))
+        bg.fill(Theme.BG_DARK)
+        for idx in range(self.num_boards):
+            ox, oy = self.origin(idx)
+            UIRenderer.draw_grid(bg, self.board_w, self.board_h, BLOCK_SIZE, ox, oy)
+        pygame.draw.rect(bg, (30,30,35), (0, self.height - self.bar_h, self.width, self.bar_h))
+        return bg
+
+    def origin(self, idx):
+        return (idx % self.cols) * self.board_w, (idx // self.cols) * self.board_h
+
+    def invalidate(self):
+        """Lần `draw` sau vẽ lại toàn bộ (lần đầu, sau khi đổi kích thước cửa sổ...)."""
+        self._full = True
+        # Trạng thái đã vẽ của từng bàn: [tập ô thân, đầu, mồi, chuỗi điểm, rect điểm]
+        self._drawn = [[set(), None, None, None, None] for _ in range(self.num_boards)]
+        self._button = None
+        self._stats = None
+
+    def draw(self, games, high_scores, button_rect, button_label, mouse_pos, stats_lines=None):
+        full = self._full
+        self._full = False
+        if full:
+            self.canvas.blit(self.background, (0, 0))
+        dirty = []
+        for idx, game in enumerate(games):
+            self._draw_board(idx, game, high_scores[idx], dirty)
+
+        hover = button_rect.collidepoint(mouse_pos)
+        if full or hover != self._button:
+            self._button = hover
+            area = button_rect.inflate(0, 8)
+            self.canvas.blit(self.background, area, area)
+            UIRenderer.draw_button(self.canvas, button_rect, button_label, mouse_pos, is_reset=True)
+            dirty.append(area)
+
+        stats_lines = list(stats_lines or [])
+        if full or stats_lines != self._stats:
+            self._stats = stats_lines
+            dirty.extend(self._draw_stats(stats_lines, button_rect))
+        return [pygame.Rect(0, 0, self.width, self.height)] if full else dirty
+
+    def _draw_board(self, idx, game, high_score, dirty):
+        drawn = self._drawn[idx]
+        old_body, old_head, old_food, old_text, old_text_rect = drawn
+        body = game.body_set
+        head = game.snake[0] if game.snake else None
+        cells = body ^ old_body
+        if head != old_head:
+            if head is not None: cells.add(head)
+            if old_head is not None: cells.add(old_head)
+        if game.food != old_food:
+            if game.food is not None: cells.add(game.food)
+            if old_food is not None: cells.add(old_food)
+        text = (str(game.score), f"H:{high_score}")
+        ox, oy = self.origin(idx)
+
+        if text != old_text or old_text_rect is None:
+            text_rect = self._text_rect(text, ox, oy)
+            area = text_rect.union(old_text_rect) if old_text_rect else text_rect
+        else:
+            text_rect = area = old_text_rect
+
+        redraw_text = text != old_text
+        for cell in cells:
+            x, y = cell_xy(cell, game.grid_w)
+            rect = pygame.Rect(ox + x, oy + y, BLOCK_SIZE, BLOCK_SIZE)
+            if rect.colliderect(area):
+                redraw_text = True   # ô nằm dưới chữ: vẽ lại vùng chữ sau khi vẽ ô
+            self.canvas.blit(self.background, rect, rect)
+            if cell in body:
+                UIRenderer.draw_snake_cell(self.canvas, rect.x, rect.y, cell == head)
+            if cell == game.food:
+                UIRenderer.draw_food(self.canvas, rect.x, rect.y)
+            dirty.append(rect)
+
+        if redraw_text:
+            self._redraw_text_area(game, text, ox, oy, area)
+            dirty.append(area)
+        drawn[:] = [set(body), head, game.food, text, text_rect]
+
+    def _text_rect(self, text, ox, oy):
+        w1, h1 = self.glyphs.size(text[0], Theme.TEXT_MAIN)
+        w2, h2 = self.glyphs.size(text[1], Theme.ACCENT)
+        return pygame.Rect(ox + 4, oy + 2, max(4 + w1, 31 + w2), max(h1, h2))
+
+    def _redraw_text_area(self, game, text, ox, oy, area):
+        # Khôi phục nền, vẽ lại các ô nằm trong vùng rồi đè chữ lên trên như bản vẽ toàn bộ
+        self.canvas.blit(self.background, area, area)
+        x0 = (area.left - ox) // BLOCK_SIZE * BLOCK_SIZE
+        y0 = (area.top - oy) // BLOCK_SIZE * BLOCK_SIZE
+        clip = self.canvas.get_clip()
+        self.canvas.set_clip(area)
+        head = game.snake[0] if game.snake else None
+        for y in range(y0, area.bottom - oy, BLOCK_SIZE):
+            for x in range(x0, area.right - ox, BLOCK_SIZE):
+                cell = y // BLOCK_SIZE * game.grid_w + x // BLOCK_SIZE
+                if cell in game.body_set:
+                    UIRenderer.draw_snake_cell(self.canvas, ox + x, oy + y, cell == head)
+                if cell == game.food:
+                    UIRenderer.draw_food(self.canvas, ox + x, oy + y)
+        self.glyphs.blit(self.canvas, text[0], Theme.TEXT_MAIN, (ox + 4, oy + 2))
+        self.glyphs.blit(self.canvas, text[1], Theme.ACCENT, (ox + 35, oy + 2))
+        self.canvas.set_clip(clip)
+
+    def _draw_stats(self, lines, button_rect):
+        # Dòng tốc độ bên trái nút STOP, dòng thời gian các pha bên phải
+        y = self.height - 32
+        areas = [pygame.Rect(0, y, button_rect.left, 20),
+                 pygame.Rect(button_rect.right, y, self.width - button_rect.right, 20)]
+        for area in areas:
+            self.canvas.blit(self.background, area, area)
+        if lines:
+            self.canvas.blit(settings.font_main.render(lines[0], True, Theme.TEXT_SUB), (8, y))
+        if len(lines) > 1:
+            self.canvas.blit(settings.font_main.render(lines[1], True, Theme.TEXT_SUB), (button_rect.right + 12, y))
+        return areas
+
+    def present(self, display, rects):
+        """Đưa các vùng bẩn của canvas lên cửa sổ (co giãn theo kích thước cửa sổ hiện tại)."""
+        if not rects:
+            return
+        win_w, win_h = display.get_size()
+        if (win_w, win_h) == (self.width, self.height):
+            for r in rects:
+                display.blit(self.canvas, r, r)
+            pygame.display.update(rects)
+            return
+        if len(rects) > 64 or rects[0].size == (self.width, self.height):
+            display.blit(pygame.transform.scale(self.canvas, (win_w, win_h)), (0, 0))
+            pygame.display.flip()
+            return
+        sx, sy = win_w / self.width, win_h / self.height
+        out = []
+        for r in rects:
+            x0, y0 = int(r.left * sx), int(r.top * sy)
+            dst = pygame.Rect(x0, y0, max(1, int(r.right * sx + 0.999) - x0), max(1, int(r.bottom * sy + 0.999) - y0))
+            display.blit(pygame.transform.scale(self.canvas.subsurface(r), dst.size), dst)
+            out.append(dst)
+        pygame.display.update(out)
+
+
 class MainMenu:
     def __init__(self):
         self.base_w, self.base_h = 400, 400 
+        init_pygame()
         self.display = pygame.display.set_mode((self.base_w, self.base_h), pygame.RESIZABLE)
         pygame.display.set_caption('Snake Q-Learning Hub')
         self.canvas = pygame.Surface((self.base_w, self.base_h))
@@ -84,14 +289,14 @@ class MainMenu:
             
             # Title
             title_txt = "SNAKE AI LAB"
-            title_shadow = font_title.render(title_txt, True, (0, 100, 50))
-            title_main = font_title.render(title_txt, True, Theme.SNAKE_HEAD)
+            title_shadow = settings.font_title.render(title_txt, True, (0, 100, 50))
+            title_main = settings.font_title.render(title_txt, True, Theme.SNAKE_HEAD)
             
             title_rect = title_main.get_rect(center=(self.base_w//2, 60))
             self.canvas.blit(title_shadow, (title_rect.x + 2, title_rect.y + 2))
             self.canvas.blit(title_main, title_rect)
             
-            sub_txt = font_main.render("Q-Learning Implementation", True, Theme.TEXT_SUB)
+            sub_txt = settings.font_main.render("Q-Learning Implementation", True, Theme.TEXT_SUB)
             sub_rect = sub_txt.get_rect(center=(self.base_w//2, 90))
             self.canvas.blit(sub_txt, sub_rect)
             